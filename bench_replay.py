@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Replay benchmark over saved webhook captures
+Feeds every capture in a directory - capture archive segments (captures_*.hcap.gz/.zst,
+byte-exact with their original Content-Type) and webhook_*.txt files - through the extraction functions and
+the full /webhook handler (against a local mock OpenHAB) and prints per-stage
+throughput, p50/p99 latency and peak traced memory. Run before and after a change to
+see regressions as numbers instead of log lines.
+
+Usage:
+    python3 bench_replay.py                                        # captures in paths.webhook_dir
+    python3 bench_replay.py /path/to/captures --iterations 20
+    python3 bench_replay.py captures/ --openhab-delay-ms 5 --state-cache
+"""
+
+import argparse
+import glob
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import webhook_processor as wp
+
+CAPTURE_BOUNDARY_PATTERN = re.compile(rb'--([!-~]{1,70})\r?\n')
+
+
+class MockOpenHAB(BaseHTTPRequestHandler):
+    """Accepts item state PUTs and REST probes, optionally after a fixed delay"""
+
+    protocol_version = 'HTTP/1.1'
+    delay = 0.0
+    puts = 0
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body=b''):
+        if self.delay:
+            time.sleep(self.delay)
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        MockOpenHAB.puts += 1
+        self._reply(202)
+
+    def do_GET(self):
+        self._reply(200, b'{}')
+
+
+def classify_capture(content_bytes, content_type=None):
+    """Return (content_type, event_type), rebuilding the Content-Type from the first boundary line if unknown"""
+    if not content_type:
+        match = CAPTURE_BOUNDARY_PATTERN.match(content_bytes)
+        content_type = f"multipart/form-data; boundary={match.group(1).decode()}" if match else 'application/octet-stream'
+    text = wp.extract_metadata_text(wp.MultipartIndex(content_bytes, wp.get_multipart_boundary(content_type)), content_bytes)
+    return content_type, 'linedetection' if wp.is_linedetection(text) else 'body_detection'
+
+
+def load_captures(directory, pattern):
+    """
+    Read archived captures (via their .idx) and pattern capture files, and classify them
+    Returns list of (name, content_bytes, content_type, event_type)
+    """
+    captures = []
+    for record in wp.iter_capture_archive(directory):
+        content_type, event_type = classify_capture(record.body, record.content_type)
+        captures.append((f"{os.path.basename(record.segment)}@{record.offset}", record.body, content_type,
+                         record.event_type or event_type))
+    for path in sorted(glob.glob(os.path.join(directory, pattern))):
+        with open(path, 'rb') as f:
+            content_bytes = f.read()
+        # Capture files hold the body only: the Content-Type is rebuilt from the body
+        captures.append((os.path.basename(path), content_bytes, *classify_capture(content_bytes)))
+    return captures
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(name, func, captures, iterations):
+    """
+    Run func(capture) for every capture, iterations times
+    Timing pass runs without tracemalloc; one extra pass measures peak traced memory
+    Returns result dict (name, count, rps, mbps, p50, p99, peak_kb), or None if no capture applies
+    """
+    if not captures:
+        return None
+    func(captures[0])  # Warm-up (imports, pools, first-call caches)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for capture in captures:
+            t0 = time.perf_counter()
+            func(capture)
+            latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    for capture in captures:
+        func(capture)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total_bytes = sum(len(capture[1]) for capture in captures) * iterations
+    return {
+        'name': name,
+        'count': len(latencies),
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'mbps': total_bytes / elapsed / 1e6 if elapsed else 0.0,
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+        'peak_kb': peak / 1024
+    }
+
+
+def stage_index(capture):
+    _, content_bytes, content_type, _ = capture
+    parts = wp.MultipartIndex(content_bytes, wp.get_multipart_boundary(content_type))
+    wp.extract_metadata_text(parts, content_bytes)
+
+
+def stage_extract_json(capture):
+    _, content_bytes, content_type, _ = capture
+    parts = wp.MultipartIndex(content_bytes, wp.get_multipart_boundary(content_type))
+    wp.extract_analytics_from_webhook_bytes(wp.extract_metadata_text(parts, content_bytes), content_bytes, parts)
+
+
+def stage_extract_xml(capture):
+    _, content_bytes, content_type, _ = capture
+    parts = wp.MultipartIndex(content_bytes, wp.get_multipart_boundary(content_type))
+    wp.extract_linedetection_from_xml(wp.extract_metadata_text(parts, content_bytes), content_bytes, parts)
+
+
+def make_handler_stage(client):
+    def stage_handler(capture):
+        _, content_bytes, content_type, _ = capture
+        response = client.post('/webhook', data=bytes(content_bytes), content_type=content_type)
+        if response.status_code != 200:
+            raise RuntimeError(f"/webhook returned {response.status_code}")
+    return stage_handler
+
+
+def print_stage_breakdown():
+    """Mean time per handler stage, read back from the service's own /metrics registry"""
+    histograms = wp.METRICS.stage_totals()
+    if not histograms:
+        return
+    print()
+    print(f"{'Handler stage':<20} {'event type':<16} {'count':>8} {'mean ms':>10}")
+    print("-" * 57)
+    for (stage, event_type), (total, count) in sorted(histograms.items(), key=lambda kv: (kv[0][1], -kv[1][0])):
+        print(f"{stage:<20} {event_type:<16} {count:>8} {total / count * 1000:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay saved webhook captures through the processing pipeline")
+    parser.add_argument('directory', nargs='?', default=wp.WEBHOOK_DIR, help="Directory with webhook captures")
+    parser.add_argument('--pattern', default='webhook_*.txt', help="Capture filename glob")
+    parser.add_argument('--iterations', type=int, default=10, help="Passes over the corpus per stage")
+    parser.add_argument('--openhab-delay-ms', type=float, default=0.0, help="Mock OpenHAB response delay")
+    parser.add_argument('--state-cache', action='store_true',
+                        help="Keep the item state cache on (default off, so every replay publishes all items)")
+    parser.add_argument('--verbose', action='store_true', help="Keep the service's INFO logging")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger(wp.__name__).setLevel(logging.WARNING)
+
+    captures = load_captures(args.directory, args.pattern)
+    if not captures:
+        print(f"❌ No capture archive segments or files matching {args.pattern} in {args.directory}")
+        sys.exit(1)
+
+    # Local mock OpenHAB and throwaway output directories
+    MockOpenHAB.delay = args.openhab_delay_ms / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockOpenHAB)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    workdir = tempfile.mkdtemp(prefix='bench_replay_')
+    wp.OPENHAB_URL = f"http://127.0.0.1:{server.server_address[1]}"
+    wp.WEBHOOK_DIR = os.path.join(workdir, 'webhooks')
+    wp.HTML_OUTPUT_PATH = os.path.join(workdir, 'html')
+    os.makedirs(wp.WEBHOOK_DIR)
+    os.makedirs(wp.HTML_OUTPUT_PATH)
+    wp._replay_queue_pid = None  # Replay queue is reopened in the throwaway webhook dir
+    wp.INGEST_WORKERS = 0  # Process inside the request so the handler timing covers the whole pipeline
+    wp.ITEM_STATE_CACHE.enabled = args.state_cache
+    wp.RATE_LIMIT_ENABLED = False  # All replays come from one local client
+    wp.COALESCER = wp.EventCoalescer(0)  # Every iteration replays the same events: no dedup, publish each one
+    wp._prober_pid = os.getpid()  # No background prober thread during the run
+    client = wp.app.test_client()
+
+    body = [c for c in captures if c[3] == 'body_detection']
+    line = [c for c in captures if c[3] == 'linedetection']
+    corpus_kb = sum(len(c[1]) for c in captures) / 1024
+
+    print("=" * 80)
+    print(f"REPLAY BENCHMARK - {len(captures)} captures ({len(body)} body, {len(line)} line crossing, "
+          f"{corpus_kb:.0f} KB) x {args.iterations} iterations")
+    print(f"Mock OpenHAB delay: {args.openhab_delay_ms:g} ms | state cache: {'on' if args.state_cache else 'off'}")
+    print("=" * 80)
+
+    try:
+        runs = [
+            ('index + decode', stage_index, captures),
+            ('extract JSON (body)', stage_extract_json, body),
+            ('extract XML (line)', stage_extract_xml, line),
+            ('/webhook handler', make_handler_stage(client), captures),
+        ]
+        results = []
+        for name, func, subset in runs:
+            if name == '/webhook handler':
+                wp.METRICS.reset()  # Breakdown below covers only the handler runs
+            result = measure(name, func, subset, args.iterations)
+            if result:
+                results.append(result)
+
+        print(f"{'Stage':<22} {'runs':>7} {'ops/s':>10} {'MB/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'peak KB':>9}")
+        print("-" * 80)
+        for r in results:
+            print(f"{r['name']:<22} {r['count']:>7} {r['rps']:>10.0f} {r['mbps']:>9.1f} "
+                  f"{r['p50']:>9.3f} {r['p99']:>9.3f} {r['peak_kb']:>9.0f}")
+        print_stage_breakdown()
+        print(f"\nMock OpenHAB received {MockOpenHAB.puts} PUTs")
+    finally:
+        wp.flush_disk_writes(30)  # Images still queued for the disk writer go before the workdir
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Flask development server against the production serve mode
+Starts both servers on free local ports, fires the same request load at each
+and prints requests/s and latency percentiles side by side
+
+Usage:
+    python3 bench_server.py                                  # GET /test
+    python3 bench_server.py --payload webhook_20260209_180636.txt   # POST /webhook
+    python3 bench_server.py --workers 2 --threads 8 --requests 5000 --concurrency 32
+"""
+
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'webhook_processor.py')
+
+
+def free_port():
+    """Ask the OS for an unused TCP port"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(port, timeout=15):
+    """Poll /test until the server answers or timeout expires"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/test')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def run_load(port, total, concurrency, payload, content_type):
+    """
+    Send `total` requests over `concurrency` keep-alive connections
+    Returns tuple: (elapsed_seconds, sorted latencies in ms, error_count)
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    break
+            start = time.perf_counter()
+            try:
+                if payload is None:
+                    conn.request('GET', '/test')
+                else:
+                    conn.request('POST', '/webhook', body=payload, headers={'Content-Type': content_type})
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    with lock:
+                        errors[0] += 1
+            except (OSError, http.client.HTTPException):
+                with lock:
+                    errors[0] += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            local.append((time.perf_counter() - start) * 1000)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, sorted(latencies), errors[0]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def benchmark(name, command, port, args, payload):
+    """Start one server, warm it up, measure it and stop it"""
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for_server(port):
+            print(f"❌ {name} did not start on port {port}")
+            return None
+        run_load(port, min(200, args.requests), args.concurrency, payload, args.content_type)
+        elapsed, latencies, errors = run_load(port, args.requests, args.concurrency, payload, args.content_type)
+        return {
+            'name': name,
+            'rps': len(latencies) / elapsed if elapsed else 0.0,
+            'p50': percentile(latencies, 50),
+            'p99': percentile(latencies, 99),
+            'errors': errors
+        }
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dev server vs production serve mode benchmark")
+    parser.add_argument('--requests', type=int, default=2000, help="Requests per server")
+    parser.add_argument('--concurrency', type=int, default=16, help="Parallel keep-alive clients")
+    parser.add_argument('--workers', type=int, default=2, help="Worker processes for serve mode")
+    parser.add_argument('--threads', type=int, default=8, help="Threads per worker for serve mode")
+    parser.add_argument('--payload', help="Saved webhook body to POST to /webhook (default: GET /test)")
+    parser.add_argument('--content-type', default='multipart/form-data; boundary=boundary',
+                        help="Content-Type header sent with --payload")
+    args = parser.parse_args()
+
+    payload = None
+    if args.payload:
+        with open(args.payload, 'rb') as f:
+            payload = f.read()
+
+    dev_port, serve_port = free_port(), free_port()
+    runs = [
+        ('Flask dev server', [sys.executable, SCRIPT, 'dev', '--port', str(dev_port)], dev_port),
+        (f'serve ({args.workers}x{args.threads})',
+         [sys.executable, SCRIPT, 'serve', '--port', str(serve_port),
+          '--workers', str(args.workers), '--threads', str(args.threads)], serve_port),
+    ]
+
+    print("=" * 80)
+    print(f"SERVER BENCHMARK - {args.requests} x {'POST /webhook' if payload else 'GET /test'}, "
+          f"{args.concurrency} concurrent clients")
+    print("=" * 80)
+    results = [r for r in (benchmark(name, cmd, port, args, payload) for name, cmd, port in runs) if r]
+
+    print(f"{'Server':<24} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>8}")
+    print("-" * 66)
+    for r in results:
+        print(f"{r['name']:<24} {r['rps']:>10.0f} {r['p50']:>10.2f} {r['p99']:>10.2f} {r['errors']:>8}")
+    if len(results) == 2 and results[0]['rps']:
+        print("-" * 66)
+        print(f"Speed-up: {results[1]['rps'] / results[0]['rps']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Synthetic Hikvision event generator and load driver
+Builds valid multipart webhook bodies in the three formats the processor parses:
+- PersonArmingTrackInfo JSON (current Camera 1 firmware)
+- CaptureResult JSON (legacy Camera 1 firmware)
+- linedetection XML with RegionCoordinatesList and TargetRect (Camera 2)
+and the TrackInfo heartbeats Camera 1 sends between detections (no capture result, no images).
+
+Usage:
+    # Write a corpus for bench_replay.py
+    python3 hikvision_event_generator.py generate captures/ --count 50 --image-kb 200
+    # Fire events at a running service from 8 cameras, stepping the rate to find saturation
+    python3 hikvision_event_generator.py load --url http://localhost:5001/webhook \\
+        --cameras 8 --rates 10,25,50,100 --duration 20
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+
+BOUNDARY = 'MIME_boundary'
+EVENT_KINDS = ('track', 'capture', 'line', 'heartbeat')
+DEFAULT_EVENT_KINDS = ('track', 'capture', 'line')
+CAMERA_WIDTH, CAMERA_HEIGHT = 1280, 720
+TIMEZONE = timezone(timedelta(hours=1))
+
+# Attribute values seen in real Camera 1 payloads
+FACE_ATTRIBUTES = {
+    'age': [str(age) for age in range(18, 70)],
+    'gender': ['male', 'female'],
+    'glass': ['yes', 'no'],
+    'faceExpression': ['smile', 'poker-faced', 'surprised', 'unknown'],
+    'mask': ['yes', 'no'],
+    'hat': ['yes', 'no']
+}
+HUMAN_ATTRIBUTES = {
+    'jacketColor': ['black', 'white', 'gray', 'red', 'blue', 'green', 'yellow', 'brown'],
+    'trousersColor': ['black', 'white', 'gray', 'blue', 'brown'],
+    'jacketType': ['longSleeve', 'shortSleeve'],
+    'trousersType': ['longPants', 'shorts', 'skirt'],
+    'hat': ['yes', 'no'],
+    'glass': ['yes', 'no'],
+    'bag': ['yes', 'no'],
+    'things': ['yes', 'no'],
+    'mask': ['yes', 'no'],
+    'ride': ['yes', 'no'],
+    'gender': ['male', 'female'],
+    'ageGroup': ['child', 'young', 'middle', 'old'],
+    'hairStyle': ['short', 'long', 'bald'],
+    'direction': ['forward', 'backward', 'left', 'right']
+}
+
+# One simulated camera: kind is one of EVENT_KINDS
+SimulatedCamera = namedtuple('SimulatedCamera', ['name', 'ip', 'mac', 'kind'])
+
+
+def make_cameras(count, kinds=DEFAULT_EVENT_KINDS):
+    """Create count cameras, cycling through the requested event kinds"""
+    return [
+        SimulatedCamera(f"Camera {i + 1}", f"10.0.20.{i + 1}", f"bc:5e:33:00:00:{i + 1:02x}", kinds[i % len(kinds)])
+        for i in range(count)
+    ]
+
+
+def make_jpeg(size, rng):
+    """
+    Return size bytes that pass as a JPEG to the extractors: SOI + JFIF header,
+    random scan data without 0xFF bytes (so no stray markers) and EOI
+    """
+    header = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+    filler = max(0, size - len(header) - 2)
+    data = rng.randbytes(filler) if hasattr(rng, 'randbytes') else os.urandom(filler)
+    return header + data.replace(b'\xff', b'\x00') + b'\xff\xd9'
+
+
+def event_time(rng):
+    """Camera-style local timestamp a few seconds in the past"""
+    return (datetime.now(TIMEZONE) - timedelta(seconds=rng.random() * 5)).isoformat(timespec='seconds')
+
+
+def extra_attributes(count, rng):
+    """Filler attributes to grow the JSON part (real firmware sends more fields than we map)"""
+    return {f'attribute{i}': rng.choice(['yes', 'no', 'unknown']) for i in range(count)}
+
+
+def person_arming_track_event(camera, rng, extra_fields=0):
+    """PersonArmingTrackInfo JSON (current firmware): Face/Human capture results as {value: x} fields"""
+    face = {key: {'value': rng.choice(values)} for key, values in FACE_ATTRIBUTES.items()}
+    face['age']['ageGroup'] = rng.choice(HUMAN_ATTRIBUTES['ageGroup'])
+    face['score'] = rng.randint(40, 99)
+    face['Rect'] = {'height': 0.12, 'width': 0.07, 'x': 0.41, 'y': 0.22}
+    human = {key: {'value': rng.choice(values)} for key, values in HUMAN_ATTRIBUTES.items()}
+    human['score'] = rng.randint(40, 99)
+    human['Rect'] = {'height': 0.6, 'width': 0.2, 'x': 0.38, 'y': 0.2}
+    for key, value in extra_attributes(extra_fields, rng).items():
+        human[key] = {'value': value}
+    return {
+        'ipAddress': camera.ip,
+        'macAddress': camera.mac,
+        'channelID': 1,
+        'dateTime': event_time(rng),
+        'activePostCount': 1,
+        'eventType': 'mixedTargetDetection',
+        'eventState': 'active',
+        'eventDescription': 'Mixed target detection',
+        'channelName': camera.name,
+        'PersonArmingTrackInfo': {
+            'PersonInfo': {
+                'Face': {'FaceCaptureResult': face},
+                'Human': {'HumanCaptureResult': human}
+            }
+        }
+    }
+
+
+def capture_result_event(camera, rng, extra_fields=0):
+    """CaptureResult JSON (legacy firmware): Face/Human attributes as Property lists"""
+    timestamp = event_time(rng)
+
+    def properties(attributes, extra):
+        return [{'description': key, 'value': rng.choice(values)} for key, values in attributes.items()] + \
+               [{'description': key, 'value': value} for key, value in extra.items()]
+
+    face_attributes = dict(FACE_ATTRIBUTES, ageGroup=HUMAN_ATTRIBUTES['ageGroup'])
+    return {
+        'ipAddress': camera.ip,
+        'macAddress': camera.mac,
+        'channelID': 1,
+        'dateTime': timestamp,
+        'activePostCount': 1,
+        'eventType': 'mixedTargetDetection',
+        'eventState': 'active',
+        'eventDescription': 'Mixed target detection',
+        'channelName': camera.name,
+        'CaptureResult': [{
+            'targetID': rng.randint(1, 10 ** 6),
+            'Face': {'snapTime': timestamp, 'Property': properties(face_attributes, {})},
+            'Human': {'snapTime': timestamp, 'Property': properties(HUMAN_ATTRIBUTES, extra_attributes(extra_fields, rng))}
+        }]
+    }
+
+
+def track_heartbeat_event(camera, rng):
+    """TrackInfo heartbeat JSON: a target is tracked but no capture result is attached yet"""
+    return {
+        'ipAddress': camera.ip,
+        'macAddress': camera.mac,
+        'channelID': 1,
+        'dateTime': event_time(rng),
+        'activePostCount': 1,
+        'eventType': 'mixedTargetDetection',
+        'eventState': 'active',
+        'eventDescription': 'Mixed target detection',
+        'channelName': camera.name,
+        'TrackInfo': {
+            'targetID': rng.randint(1, 10 ** 6),
+            'Rect': {'height': 0.6, 'width': 0.2, 'x': round(rng.uniform(0.05, 0.75), 3), 'y': 0.2}
+        }
+    }
+
+
+def linedetection_xml(camera, rng, extra_fields=0):
+    """EventNotificationAlert XML for a line crossing with a vertical line and a target box"""
+    line_x = rng.randint(CAMERA_WIDTH // 4, 3 * CAMERA_WIDTH // 4)
+    target_x = round(rng.uniform(0.05, 0.85), 3)
+    extras = ''.join(f"<extension{i}>{rng.choice(['true', 'false'])}</extension{i}>" for i in range(extra_fields))
+    return f'''<?xml version="1.0" encoding="UTF-8"?>
+<EventNotificationAlert version="2.0" xmlns="http://www.hikvision.com/ver20/XMLSchema">
+<ipAddress>{camera.ip}</ipAddress>
+<portNo>80</portNo>
+<protocol>HTTP</protocol>
+<macAddress>{camera.mac}</macAddress>
+<channelID>1</channelID>
+<dateTime>{event_time(rng)}</dateTime>
+<activePostCount>1</activePostCount>
+<eventType>linedetection</eventType>
+<eventState>active</eventState>
+<eventDescription>linedetection alarm</eventDescription>
+<channelName>{camera.name}</channelName>
+<DetectionRegionList>
+<DetectionRegionEntry>
+<regionID>{rng.choice([1, 2])}</regionID>
+<sensitivityLevel>50</sensitivityLevel>
+<RegionCoordinatesList>
+<RegionCoordinates><positionX>{line_x}</positionX><positionY>40</positionY></RegionCoordinates>
+<RegionCoordinates><positionX>{line_x}</positionX><positionY>{CAMERA_HEIGHT - 40}</positionY></RegionCoordinates>
+</RegionCoordinatesList>
+<detectionTarget>{rng.choice(['human', 'human', 'vehicle'])}</detectionTarget>
+<TargetRect><X>{target_x}</X><Y>{round(rng.uniform(0.1, 0.6), 3)}</Y><width>0.1</width><height>0.3</height></TargetRect>
+</DetectionRegionEntry>
+</DetectionRegionList>
+{extras}
+</EventNotificationAlert>'''
+
+
+def build_multipart(parts, boundary=BOUNDARY):
+    """
+    Encode parts the way the cameras do (per-part Content-Type and Content-Length)
+    Args:
+        parts: List of (name, content_type, data_bytes)
+    Returns the body as bytes
+    """
+    chunks = []
+    for name, content_type, data in parts:
+        disposition = f'form-data; name="{name}"'
+        if content_type == 'image/jpeg':
+            disposition += f'; filename="{name}.jpg"'
+        chunks.append(f'--{boundary}\r\nContent-Disposition: {disposition}\r\nContent-Type: {content_type}\r\n'
+                      f'Content-Length: {len(data)}\r\n\r\n'.encode())
+        chunks.append(data)
+        chunks.append(b'\r\n')
+    chunks.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(chunks)
+
+
+def generate_event(camera, rng, image_kb=150, crop_kb=10, extra_fields=0, boundary=BOUNDARY):
+    """
+    Build one webhook body for this camera's event kind
+    Returns tuple: (body_bytes, content_type_header)
+    """
+    if camera.kind == 'heartbeat':
+        metadata = json.dumps(track_heartbeat_event(camera, rng), indent='\t').encode()
+        return build_multipart([('mixedTargetDetection', 'application/json', metadata)], boundary), \
+            f'multipart/form-data; boundary={boundary}'
+    background = make_jpeg(image_kb * 1024, rng)
+    if camera.kind == 'line':
+        xml = linedetection_xml(camera, rng, extra_fields).encode()
+        parts = [('linedetection', 'application/xml', xml), ('linedetectionImage', 'image/jpeg', background)]
+    else:
+        builder = person_arming_track_event if camera.kind == 'track' else capture_result_event
+        metadata = json.dumps(builder(camera, rng, extra_fields), indent='\t').encode()
+        parts = [
+            ('mixedTargetDetection', 'application/json', metadata),
+            ('faceImage', 'image/jpeg', make_jpeg(crop_kb * 1024, rng)),
+            ('humanImage', 'image/jpeg', make_jpeg(crop_kb * 1024, rng)),
+            ('humanBackgroundImage', 'image/jpeg', background)
+        ]
+    return build_multipart(parts, boundary), f'multipart/form-data; boundary={boundary}'
+
+
+def write_corpus(directory, count, cameras, rng, **event_options):
+    """Write count generated bodies as webhook_*.txt captures (the format bench_replay.py reads)"""
+    os.makedirs(directory, exist_ok=True)
+    start = datetime.now()
+    for i in range(count):
+        body, _ = generate_event(cameras[i % len(cameras)], rng, **event_options)
+        name = f"webhook_{(start + timedelta(seconds=i)).strftime('%Y%m%d_%H%M%S')}_{i:05d}.txt"
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(body)
+    return count
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def fetch_ingest_dropped(url):
+    """Read the service's ingest drop counter from /health (None if unavailable)"""
+    parts = urlsplit(url)
+    try:
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=5)
+        conn.request('GET', '/health')
+        health = json.loads(conn.getresponse().read())
+        conn.close()
+        return health.get('ingest', {}).get('dropped')
+    except (OSError, ValueError, http.client.HTTPException):
+        return None
+
+
+def run_load(url, payloads, rate, duration, workers):
+    """
+    Open-loop load: send rate requests/s for duration seconds, round-robin over payloads
+    Latency is measured from each request's scheduled send time, so a saturated service
+    shows up as growing latency instead of a silently lower send rate
+    Returns dict with sent, achieved rate, p50/p99 ms and status counts
+    """
+    parts = urlsplit(url)
+    local = threading.local()
+    lock = threading.Lock()
+    latencies = []
+    statuses = {}
+
+    def send(scheduled, body, content_type):
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        try:
+            conn.request('POST', parts.path or '/webhook', body=body, headers={'Content-Type': content_type})
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            local.conn = None
+            status = 'error'
+        with lock:
+            latencies.append((time.perf_counter() - scheduled) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    total = max(1, int(rate * duration))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        start = time.perf_counter()
+        for i in range(total):
+            scheduled = start + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            body, content_type = payloads[i % len(payloads)]
+            executor.submit(send, scheduled, body, content_type)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'target': rate,
+        'sent': total,
+        'achieved': total / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+        'statuses': statuses
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic Hikvision webhook generator and load driver")
+    parser.add_argument('--cameras', type=int, default=3, help="Number of simulated cameras")
+    parser.add_argument('--kinds', default=','.join(DEFAULT_EVENT_KINDS),
+                        help="Event kinds cycled over cameras: track, capture, line, heartbeat")
+    parser.add_argument('--image-kb', type=int, default=150, help="Background image size")
+    parser.add_argument('--crop-kb', type=int, default=10, help="Face/human crop image size")
+    parser.add_argument('--extra-fields', type=int, default=0, help="Extra attributes per event (larger metadata)")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed (same seed = same corpus)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help="Write webhook_*.txt captures to a directory")
+    generate.add_argument('directory', help="Output directory")
+    generate.add_argument('--count', type=int, default=30, help="Number of captures")
+
+    load = commands.add_parser('load', help="Send events to a running service")
+    load.add_argument('--url', default='http://localhost:5001/webhook', help="Webhook URL")
+    load.add_argument('--rates', default='10,25,50', help="Comma-separated target rates (events/s), run in order")
+    load.add_argument('--duration', type=float, default=10, help="Seconds per rate step")
+    load.add_argument('--workers', type=int, default=32, help="Concurrent sender threads")
+    load.add_argument('--variants', type=int, default=5, help="Pre-generated bodies per camera")
+    args = parser.parse_args()
+
+    kinds = [kind.strip() for kind in args.kinds.split(',') if kind.strip()]
+    unknown = [kind for kind in kinds if kind not in EVENT_KINDS]
+    if unknown or not kinds:
+        parser.error(f"unknown event kinds {unknown}, choose from {', '.join(EVENT_KINDS)}")
+    rng = random.Random(args.seed)
+    cameras = make_cameras(args.cameras, kinds)
+    event_options = {'image_kb': args.image_kb, 'crop_kb': args.crop_kb, 'extra_fields': args.extra_fields}
+
+    if args.command == 'generate':
+        write_corpus(args.directory, args.count, cameras, rng, **event_options)
+        print(f"✅ Wrote {args.count} captures from {len(cameras)} cameras to {args.directory}")
+        return
+
+    # Pre-generate bodies so payload building never limits the send rate
+    payloads = [generate_event(camera, rng, **event_options) for _ in range(args.variants) for camera in cameras]
+    rates = [float(rate) for rate in args.rates.split(',')]
+    average_kb = sum(len(body) for body, _ in payloads) / len(payloads) / 1024
+
+    print("=" * 86)
+    print(f"LOAD TEST - {args.url} | {len(cameras)} cameras ({', '.join(kinds)}) | "
+          f"{average_kb:.0f} KB/event | {args.duration:g}s per step")
+    print("=" * 86)
+    print(f"{'target/s':>9} {'achieved/s':>11} {'p50 ms':>9} {'p99 ms':>9} {'200':>7} {'429':>6} {'503':>6} "
+          f"{'errors':>7} {'queue drops':>12}")
+    print("-" * 86)
+    for rate in rates:
+        dropped_before = fetch_ingest_dropped(args.url)
+        result = run_load(args.url, payloads, rate, args.duration, args.workers)
+        dropped_after = fetch_ingest_dropped(args.url)
+        statuses = result['statuses']
+        other_errors = sum(count for status, count in statuses.items() if status not in (200, 429, 503))
+        queue_drops = dropped_after - dropped_before if None not in (dropped_before, dropped_after) else '-'
+        print(f"{result['target']:>9g} {result['achieved']:>11.1f} {result['p50']:>9.1f} {result['p99']:>9.1f} "
+              f"{statuses.get(200, 0):>7} {statuses.get(429, 0):>6} {statuses.get(503, 0):>6} {other_errors:>7} {queue_drops:>12}")
+    print("-" * 86)
+    print("Saturation: achieved/s falls behind target/s, p99 climbs, or 503s / queue drops appear "
+          "(429s are the service's per-source rate limit)")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(130)
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""Shared runner and helpers for the offline test scripts (python3 test_<name>.py)"""
+
+import sys
+from contextlib import contextmanager
+
+try:
+    import pytest
+    SKIPPED = pytest.skip.Exception  # pytest.importorskip / pytest.skip outside pytest
+except ImportError:
+    SKIPPED = ()
+
+
+def run(namespace):
+    """Run every test_* function in a test module's globals(); exits 1 if any fails"""
+    tests = [(name, func) for name, func in sorted(namespace.items()) if name.startswith('test_')]
+    failed = 0
+    for name, func in tests:
+        try:
+            func()
+            print(f"✅ {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {name}: {e}")
+        except SKIPPED as e:
+            print(f"⏭️  {name}: skipped ({e})")
+    sys.exit(1 if failed else 0)
+
+
+@contextmanager
+def swapped(module, **values):
+    """Set module globals for the duration of a with block, then put the previous values back"""
+    saved = {name: getattr(module, name) for name in values}
+    for name, value in values.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(module, name, value)
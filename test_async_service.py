@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Test the asyncio variant end to end against a stand-in OpenHAB (runs offline)"""
+
+import asyncio
+import os
+import random
+import socket
+import tempfile
+from contextlib import asynccontextmanager
+
+import pytest
+
+import hikvision_event_generator as gen
+import offline_tests
+import webhook_processor as wp
+
+
+@asynccontextmanager
+async def stand_in_openhab():
+    """aiohttp stand-in for the OpenHAB REST API: records every PUT, answers the probe; yields (states, url)"""
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+
+    states = {}
+
+    async def put_state(request):
+        states[request.match_info['item']] = await request.text()
+        return web.Response(status=202)
+
+    async def root(request):
+        return web.json_response({"version": "4"})
+
+    app = web.Application()
+    app.router.add_put('/rest/items/{item}/state', put_state)
+    app.router.add_get('/rest/', root)
+    server = TestServer(app)
+    await server.start_server()
+    try:
+        yield states, str(server.make_url('')).rstrip('/')
+    finally:
+        await server.close()
+
+
+def unused_url():
+    with socket.socket() as unused:
+        unused.bind(('127.0.0.1', 0))
+        return f"http://127.0.0.1:{unused.getsockname()[1]}"
+
+
+@asynccontextmanager
+async def async_service(openhab_url, cameras=None):
+    """
+    Run webhook_processor_async against openhab_url with fresh output directories,
+    cameras, breaker, limiter and replay queue; yields (client, app)
+    """
+    from aiohttp.test_utils import TestClient, TestServer
+    import webhook_processor_async as wpa
+
+    workdir = tempfile.mkdtemp()
+    wp.ITEM_STATE_CACHE.invalidate("test setup")
+    with offline_tests.swapped(wp, OPENHAB_URL=openhab_url, WEBHOOK_DIR=workdir, HTML_OUTPUT_PATH=workdir,
+                               CAMERAS=cameras or wp.CameraRegistry({}), COALESCER=wp.EventCoalescer(0),
+                               RATE_LIMITER=wp.TokenBucketLimiter(), OPENHAB_BREAKER=wp.CircuitBreaker(5, 30),
+                               _replay_queue=wp.ReplayQueue(os.path.join(workdir, 'replay.json'), 50),
+                               _replay_queue_pid=os.getpid(), _capture_archive=wp._capture_archive,
+                               _archive_pid=wp._archive_pid):
+        client = TestClient(TestServer(wpa.create_app()))
+        await client.start_server()
+        try:
+            yield client, client.server.app
+        finally:
+            await client.close()
+            wp.ITEM_STATE_CACHE.invalidate("test teardown")
+
+
+async def settle(app):
+    """Wait for every scheduled event task, then for the disk writer and any filename publishes"""
+    while app['tasks']:
+        await asyncio.gather(*app['tasks'])
+    await asyncio.get_running_loop().run_in_executor(None, wp.flush_disk_writes, 2)
+    await asyncio.sleep(0.05)
+
+
+def expected_updates(body, content_type):
+    """Item updates the threaded service would publish for this body"""
+    parts = wp.MultipartIndex(body, wp.get_multipart_boundary(content_type))
+    content_text = wp.extract_metadata_text(parts, body)
+    camera = wp.CAMERAS.identify(content_text, '127.0.0.1', 'body_detection')
+    analytics, _ = wp.extract_analytics_from_webhook_bytes(content_text, body, parts, camera)
+    return dict(wp.build_analytics_updates(analytics, camera))
+
+
+def generated(kind):
+    return gen.generate_event(gen.make_cameras(1, [kind])[0], random.Random(5), image_kb=4, crop_kb=1)
+
+
+def run(scenario):
+    """Run one async scenario in a fresh event loop (skipped without aiohttp)"""
+    pytest.importorskip('aiohttp')
+    asyncio.run(scenario())
+
+
+def test_event_is_published_and_heartbeat_answered():
+    async def scenario():
+        async with stand_in_openhab() as (states, url), async_service(url) as (client, app):
+            body, content_type = generated('heartbeat')
+            response = await client.post('/webhook', data=body, headers={'Content-Type': content_type})
+            assert (await response.json())['reason'] == 'heartbeat'
+            assert os.listdir(wp.WEBHOOK_DIR) == []
+
+            body, content_type = generated('track')
+            response = await client.post('/webhook', data=body, headers={'Content-Type': content_type})
+            assert (await response.json())['status'] == 'queued'
+            await settle(app)
+            expected = expected_updates(body, content_type)
+            assert expected and {item: states.get(item) for item in expected} == expected
+            camera = wp.CAMERAS.default_for('body_detection')
+            assert states[camera.item(wp.ITEM_IMAGE_FILENAME)] == camera.body_image
+            assert [name for name in os.listdir(wp.WEBHOOK_DIR) if wp.CAPTURE_SEGMENT_PATTERN.match(name)]
+
+            # Same /health and /metrics as the threaded service
+            health = await (await client.get('/health')).json()
+            assert health['in_flight'] == 0 and health['replay_queue']['pending'] == 0
+            metrics = await (await client.get('/metrics')).text()
+            assert 'result="ok"' in metrics and 'result="heartbeat"' in metrics
+    run(scenario)
+
+
+def test_unreachable_openhab_lands_in_replay_queue():
+    async def scenario():
+        async with async_service(unused_url()) as (client, app):
+            body, content_type = generated('track')
+            response = await client.post('/webhook', data=body, headers={'Content-Type': content_type})
+            assert (await response.json())['status'] == 'queued'
+            await settle(app)
+            expected = expected_updates(body, content_type)
+            assert expected and expected.items() <= dict(wp.get_replay_queue().pending).items()
+            assert wp.OPENHAB_BREAKER.state == 'open'
+    run(scenario)
+
+
+def test_coalesced_burst_is_published_from_the_loop():
+    async def scenario():
+        cameras = wp.CameraRegistry({'body_detection': {'coalesce_window_seconds': {'body_detection': 0.1}}})
+        async with stand_in_openhab() as (states, url), async_service(url, cameras) as (client, app):
+            body, content_type = generated('track')
+            await client.post('/webhook', data=body, headers={'Content-Type': content_type})
+            await settle(app)
+            assert states == {}  # Held until the window closes, then published on the loop
+            await asyncio.sleep(0.3)
+            await settle(app)
+            expected = expected_updates(body, content_type)
+            assert {item: states.get(item) for item in expected} == expected
+    run(scenario)
+
+
+if __name__ == '__main__':
+    offline_tests.run(globals())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Test the camera registry: identification, item namespaces, output files and ingest lanes (runs offline)"""
+
+import os
+import random
+import tempfile
+import threading
+import time
+
+import hikvision_event_generator as gen
+import offline_tests
+import webhook_processor as wp
+
+REGISTRY_CONFIG = {
+    'body_detection': {'name': 'Front', 'ip': '10.0.20.1'},
+    'line_crossing': {'region_direction_mapping': {'1': 'enter'}},
+    'garage': {'name': 'Garage', 'ip': '10.0.20.2', 'item_prefix': 'Garage', 'region_direction_mapping': {'1': 'exit'}},
+    'nvr_ch2': {'name': 'Yard', 'ip': '10.0.20.9', 'mac': 'AA:BB:CC:00:00:09', 'channel': 2, 'lane': 'nvr'},
+    'nvr_ch3': {'name': 'Gate', 'ip': '10.0.20.9', 'channel': 3, 'lane': 'nvr'},
+    'notes': 'ignored'
+}
+
+
+def metadata_text(camera):
+    body, content_type = gen.generate_event(camera, random.Random(1), image_kb=1, crop_kb=1)
+    parts = wp.MultipartIndex(body, wp.get_multipart_boundary(content_type))
+    return wp.extract_metadata_text(parts, body)
+
+
+def test_identify_by_ip_channel_mac_and_fallback():
+    registry = wp.CameraRegistry(REGISTRY_CONFIG)
+    garage = gen.SimulatedCamera('Garage', '10.0.20.2', 'bc:5e:33:00:00:02', 'track')
+    assert registry.identify(metadata_text(garage), '127.0.0.1', 'body_detection').id == 'garage'
+    xml = '<ipAddress>10.0.20.9</ipAddress><macAddress>aa:bb:cc:00:00:09</macAddress><channelID>3</channelID>linedetection'
+    assert registry.identify(xml, '10.0.20.9', 'linedetection').id == 'nvr_ch3'
+    assert registry.identify(xml.replace('10.0.20.9', '10.9.9.9').replace('>3<', '>2<'), '', 'linedetection').id == 'nvr_ch2'
+    # Unregistered source: built-in camera for the event type
+    assert registry.identify('{"ipAddress": "10.9.9.9"}', '10.9.9.9', 'linedetection').id == 'line_crossing'
+    assert registry.identify('', '10.0.20.2', 'body_detection').id == 'garage'
+    assert set(registry.cameras) == {'body_detection', 'garage', 'nvr_ch2', 'nvr_ch3', 'line_crossing'}
+
+
+def test_item_namespace_and_region_mapping_are_per_camera():
+    registry = wp.CameraRegistry(REGISTRY_CONFIG)
+    linedata = {'region_id': '1', 'detection_target': 'human', 'datetime': ''}
+    default = dict(wp.build_linedetection_updates(linedata, registry.default_for('linedetection')))
+    garage = dict(wp.build_linedetection_updates(linedata, registry.cameras['garage']))
+    assert default[wp.ITEM_LC_DIRECTION] == 'Human Enter'
+    assert garage[f'Garage_{wp.ITEM_LC_DIRECTION}'] == 'Human Exit'
+    assert all(item.startswith('Garage_') for item in garage)
+
+
+def test_output_files_are_per_camera():
+    registry = wp.CameraRegistry(REGISTRY_CONFIG)
+    directory = tempfile.mkdtemp()
+    with offline_tests.swapped(wp, HTML_OUTPUT_PATH=directory):
+        assert wp.write_detection_image(b'\xff\xd8front\xff\xd9', '2026-02-09 18:06:36', registry.cameras['body_detection'])
+        assert wp.write_detection_image(b'\xff\xd8garage\xff\xd9', '2026-02-09 18:06:37', registry.cameras['garage'])
+        filename = wp.write_linedetection_image(b'\xff\xd8x\xff\xd9', '2026-02-09T07:39:01+01:00', registry.cameras['garage'])
+    with open(os.path.join(directory, wp.IMAGE_FILENAME), 'rb') as f:
+        assert f.read() == b'\xff\xd8front\xff\xd9'
+    with open(os.path.join(directory, f'garage_{wp.IMAGE_FILENAME}'), 'rb') as f:
+        assert f.read() == b'\xff\xd8garage\xff\xd9'
+    assert filename == f"{registry.cameras['garage'].line_prefix}_20260209_073901.jpg"
+
+
+def test_busy_lane_does_not_delay_other_cameras():
+    registry = wp.CameraRegistry(REGISTRY_CONFIG)
+    release, processed = threading.Event(), []
+
+    def process_webhook(content_bytes, content_type, remote_addr, timings=None):
+        if remote_addr == '10.0.20.2':
+            release.wait(5)  # Garage lane is stuck
+        processed.append(remote_addr)
+        return {}, 200
+
+    saved = wp.CAMERAS, wp.INGEST_WORKERS, wp.process_webhook
+    wp.CAMERAS, wp.INGEST_WORKERS, wp.process_webhook = registry, 1, process_webhook
+    try:
+        for _ in range(3):
+            assert wp.enqueue_webhook(b'', None, '10.0.20.2')
+        assert wp.enqueue_webhook(b'', None, '10.0.20.1')
+        deadline = time.monotonic() + 2
+        while '10.0.20.1' not in processed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert processed == ['10.0.20.1']
+        assert wp.get_ingest_status()['lanes']['garage'] == 2
+        release.set()
+    finally:
+        release.set()
+        wp.CAMERAS, wp.INGEST_WORKERS, wp.process_webhook = saved
+
+
+if __name__ == '__main__':
+    offline_tests.run(globals())
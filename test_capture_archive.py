@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Test the compressed raw capture archive and its indexed reader (runs offline)"""
+
+import gzip
+import os
+import tempfile
+import unittest
+
+import pytest
+
+import offline_tests
+import webhook_processor as wp
+
+BODY = b'--boundary\r\nContent-Type: image/jpeg\r\n\r\n\xff\xd8\x00\xfe\x80 not utf-8 \xff\xd9\r\n--boundary--\r\n'
+CONTENT_TYPE = 'multipart/form-data; boundary=boundary'
+
+
+def segments(directory):
+    return sorted(name for name in os.listdir(directory) if wp.CAPTURE_SEGMENT_PATTERN.match(name))
+
+
+def test_records_round_trip_byte_exact():
+    directory = tempfile.mkdtemp()
+    archive = wp.CaptureArchive(directory)
+    path, offset = archive.append(BODY, CONTENT_TYPE, '10.0.11.101', 'body_detection', 1770656796.5)
+    archive.append(memoryview(BODY)[:20], None, '10.0.11.102', 'linedetection')
+    records = list(wp.iter_capture_archive(directory))
+    assert [record.body for record in records] == [BODY, BODY[:20]]
+    assert records[0] == (path, offset, 1770656796.5, '10.0.11.101', CONTENT_TYPE, 'body_detection', BODY)
+    assert records[1].content_type is None and records[1].event_type == 'linedetection'
+    # Random access by offset, and every segment is a plain multi-member gzip file
+    entry = wp.read_capture_index(path)[1]
+    assert wp.read_capture(path, entry['offset'], entry['size']).body == BODY[:20]
+    with gzip.open(path) as f:
+        assert f.read().count(BODY[:20]) == 2
+
+
+def test_event_type_filter_reads_only_matching_records():
+    directory = tempfile.mkdtemp()
+    archive = wp.CaptureArchive(directory)
+    for event_type in ('linedetection', 'body_detection', 'linedetection'):
+        archive.append(BODY, CONTENT_TYPE, None, event_type)
+    assert [record.event_type for record in wp.iter_capture_archive(directory, 'linedetection')] == ['linedetection'] * 2
+
+
+def test_segments_rotate_and_oldest_are_deleted():
+    directory = tempfile.mkdtemp()
+    archive = wp.CaptureArchive(directory, segment_bytes=1, max_bytes=1000)
+    for i in range(8):
+        archive.append(BODY + str(i).encode(), CONTENT_TYPE)
+    remaining = segments(directory)
+    assert 1 < len(remaining) < 8
+    assert all(os.path.exists(os.path.join(directory, name + '.idx')) for name in remaining)
+    bodies = [record.body for record in wp.iter_capture_archive(directory)]
+    assert bodies == [BODY + str(i).encode() for i in range(8 - len(bodies), 8)]
+
+
+def test_retention_keeps_segments_other_live_workers_are_writing():
+    directory = tempfile.mkdtemp()
+    dead_pid = next(pid for pid in range(4194304, 0, -1) if not wp.process_alive(pid))
+    live, dead = f"captures_20260101_000000_{os.getppid()}_0001.hcap.gz", f"captures_20260101_000000_{dead_pid}_0001.hcap.gz"
+    for name in (live, dead):
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(wp.gzip_member([b'x' * 2000]))
+    archive = wp.CaptureArchive(directory, segment_bytes=1, max_bytes=1)
+    archive.append(BODY, CONTENT_TYPE)
+    # Over the limit, but the other worker's open segment stays; the dead worker's goes
+    assert live in segments(directory) and dead not in segments(directory)
+
+
+def test_segment_without_index_is_scanned_up_to_a_torn_record():
+    directory = tempfile.mkdtemp()
+    archive = wp.CaptureArchive(directory)
+    path, _ = archive.append(BODY, CONTENT_TYPE, None, 'body_detection')
+    archive.append(BODY, CONTENT_TYPE, None, 'body_detection')
+    archive._close_segment()
+    os.remove(path + '.idx')
+    with open(path, 'ab') as f:
+        f.write(wp.gzip_member([b'{"received": 1, "remote_addr": null, "content_type": null, '
+                                b'"event_type": null, "length": 9999}\n', BODY]))
+    records = list(wp.iter_capture_archive(directory))
+    assert [record.body for record in records] == [BODY, BODY]
+    assert [record.offset for record in records] == [0, 1]
+
+
+def test_zstd_segments_round_trip():
+    zstandard = pytest.importorskip('zstandard')
+    directory = tempfile.mkdtemp()
+    archive = wp.CaptureArchive(directory, 'zstd')
+    path, offset = archive.append(BODY, CONTENT_TYPE, '10.0.11.101', 'body_detection', 1770656796.5)
+    archive.append(memoryview(BODY)[:20], None, '10.0.11.102', 'linedetection')
+    assert path.endswith('.hcap.zst')
+    records = list(wp.iter_capture_archive(directory))
+    assert records[0] == (path, offset, 1770656796.5, '10.0.11.101', CONTENT_TYPE, 'body_detection', BODY)
+    assert [record.body for record in wp.iter_capture_archive(directory, 'linedetection')] == [BODY[:20]]
+    # One frame per record: the segment also decompresses in one go, and reads without its .idx
+    archive._close_segment()
+    with zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True) as f:
+        assert f.read().count(BODY[:20]) == 2
+    os.remove(path + '.idx')
+    assert [record.body for record in wp.iter_capture_archive(directory)] == [BODY, BODY[:20]]
+
+
+def test_zstd_falls_back_to_gzip_without_zstandard():
+    directory = tempfile.mkdtemp()
+    with offline_tests.swapped(wp, zstandard=None), unittest.TestCase().assertLogs(wp.logger, 'WARNING') as logs:
+        archive = wp.CaptureArchive(directory, 'zstd')
+    assert archive.compression == 'gzip'
+    assert 'zstandard' in logs.output[0]
+    path, _ = archive.append(BODY, CONTENT_TYPE)
+    assert path.endswith('.hcap.gz')
+    with gzip.open(path) as f:
+        assert f.read().endswith(BODY)
+
+
+def test_log_raw_webhook_writes_archive_record():
+    directory = tempfile.mkdtemp()
+    with offline_tests.swapped(wp, WEBHOOK_DIR=directory, CAPTURE_FORMAT='archive',
+                               _capture_archive=wp._capture_archive, _archive_pid=wp._archive_pid):
+        wp.log_raw_webhook(BODY, '', 'body_detection', CONTENT_TYPE, '10.0.11.101', 1770656796.0)
+        [record] = wp.iter_capture_archive(directory)
+        assert (record.body, record.content_type, record.remote_addr) == (BODY, CONTENT_TYPE, '10.0.11.101')
+        assert wp.get_capture_status()['records'] == 1
+
+
+if __name__ == '__main__':
+    offline_tests.run(globals())
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Test raw webhook capture naming and retention (runs offline)"""
+
+import os
+import tempfile
+
+import offline_tests
+import webhook_processor as wp
+
+
+def captures(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith('.txt'))
+
+
+def test_same_second_captures_get_unique_names():
+    directory = tempfile.mkdtemp()
+    retention = wp.CaptureRetention(directory, 50, 10 ** 6)
+    paths = [retention.save(b'body %d' % i) for i in range(5)]
+    assert len(set(paths)) == 5
+    assert captures(directory) == sorted(os.path.basename(path) for path in paths)
+    with open(paths[3], 'rb') as f:
+        assert f.read() == b'body 3'
+
+
+def test_evicts_oldest_by_count_and_bytes():
+    directory = tempfile.mkdtemp()
+    retention = wp.CaptureRetention(directory, 3, 250)
+    paths = [retention.save(b'x' * 100) for _ in range(4)]
+    # Count limit keeps 3, byte limit (250) keeps 2
+    assert captures(directory) == sorted(os.path.basename(path) for path in paths[2:])
+    assert retention.status()['bytes'] == 200
+    # A capture larger than the byte limit is still kept on its own
+    big = retention.save(b'y' * 1000)
+    assert captures(directory) == [os.path.basename(big)]
+
+
+def test_existing_files_are_adopted_and_sequence_continues():
+    directory = tempfile.mkdtemp()
+    for name, size in (('webhook_20260209_180600.txt', 10), ('webhook_20260209_180601_000041.txt', 20)):
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(b'z' * size)
+    os.utime(os.path.join(directory, 'webhook_20260209_180600.txt'), (1, 1))
+    with open(os.path.join(directory, 'notes.txt'), 'w') as f:
+        f.write('not a capture')
+    retention = wp.CaptureRetention(directory, 2, 10 ** 6)
+    assert retention.status()['files'] == 2 and retention.status()['bytes'] == 30
+    path = retention.save(b'new')
+    assert path.endswith('_000042.txt')
+    assert captures(directory) == ['notes.txt', 'webhook_20260209_180601_000041.txt', os.path.basename(path)]
+
+
+def test_limits_hold_across_worker_processes():
+    directory = tempfile.mkdtemp()
+    workers = [wp.CaptureRetention(directory, 4, 10 ** 6) for _ in range(3)]  # One handle per process
+    for i in range(12):
+        workers[i % 3].save(b'capture %d' % i)
+    assert len(captures(directory)) == 4
+    assert workers[2].status()['files'] == 4
+
+
+def test_log_raw_webhook_uses_current_directory():
+    directory = tempfile.mkdtemp()
+    with offline_tests.swapped(wp, WEBHOOK_DIR=directory, CAPTURE_FORMAT='files',
+                               _capture_retention=wp._capture_retention, _retention_pid=wp._retention_pid):
+        wp.log_raw_webhook(b'--boundary\r\n', '', 'body_detection')
+        assert len(captures(directory)) == 1
+        assert wp.get_capture_retention().directory == directory
+
+
+if __name__ == '__main__':
+    offline_tests.run(globals())
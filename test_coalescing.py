@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Test event dedup and burst coalescing (runs offline)"""
+
+import time
+
+import offline_tests
+import webhook_processor as wp
+
+
+def make_camera(window):
+    return wp.Camera('cam', {'ip': '10.0.20.1', 'coalesce_window_seconds': window})
+
+
+def test_exact_retransmit_is_dropped():
+    coalescer = wp.EventCoalescer(60)
+    camera = make_camera(0)
+    event = {'human.snapTime': '2026-02-09T18:06:36+01:00', 'human.jacketColor': 'red'}
+    assert coalescer.submit(camera, 'body_detection', event, (), None) == 'publish'
+    assert coalescer.submit(camera, 'body_detection', dict(event), (), None) == 'duplicate'
+    assert coalescer.submit(camera, 'body_detection', dict(event, **{'human.jacketColor': 'blue'}), (), None) == 'publish'
+    # Same fields from another event type or camera are not retransmits
+    assert coalescer.submit(camera, 'linedetection', dict(event), (), None) == 'publish'
+    assert coalescer.status()['duplicates'] == 1
+
+
+def test_same_attributes_at_another_time_are_not_duplicates():
+    coalescer = wp.EventCoalescer(60)
+    camera = make_camera(0)
+    human = {'HumanCaptureResult': {'jacketColor': {'value': 'red'}, 'hairStyle': {'value': 'short'}}}
+    def payload(when):
+        return {'dateTime': when, 'PersonArmingTrackInfo': {'PersonInfo': {'Human': human}}}
+    first = wp.BODY_MAPPING.read(payload('2026-02-09T18:06:36+01:00'))
+    second = wp.BODY_MAPPING.read(payload('2026-02-09T18:06:52+01:00'))
+    assert coalescer.submit(camera, 'body_detection', first, (), None) == 'publish'
+    assert coalescer.submit(camera, 'body_detection', second, (), None) == 'publish'
+    assert coalescer.submit(camera, 'body_detection', dict(second), (), None) == 'duplicate'
+
+
+def test_dedup_expires():
+    coalescer = wp.EventCoalescer(0.05)
+    camera = make_camera(0)
+    assert coalescer.submit(camera, 'linedetection', {'datetime': 'x'}, (), None) == 'publish'
+    time.sleep(0.06)
+    assert coalescer.submit(camera, 'linedetection', {'datetime': 'x'}, (), None) == 'publish'
+
+
+def test_burst_publishes_best_scoring_event_once():
+    published = []
+    coalescer = wp.EventCoalescer(0)
+    camera = make_camera({'body_detection': 0.1})
+    outcomes = [coalescer.submit(camera, 'body_detection', {'human.score': str(score)}, (score,), published.append)
+                for score in (60, 91, 75)]
+    assert outcomes == ['held', 'coalesced', 'coalesced']
+    assert published == []
+    time.sleep(0.2)
+    assert published == [91]
+    assert coalescer.status()['open_bursts'] == 0
+    # Line crossings have no score: the latest event of the burst wins
+    camera = make_camera(0.1)
+    for index in range(3):
+        coalescer.submit(camera, 'linedetection', {'datetime': str(index)}, (index,), published.append)
+    time.sleep(0.2)
+    assert published == [91, 2]
+
+
+def test_camera_window_overrides_global_and_rejects_invalid():
+    assert make_camera({'linedetection': 1.5}).coalesce_window['linedetection'] == 1.5
+    assert make_camera(2).coalesce_window == {'body_detection': 2, 'linedetection': 2}
+    assert make_camera({'linedetection': -1}).coalesce_window == wp.COALESCE_WINDOW
+
+
+if __name__ == '__main__':
+    offline_tests.run(globals())
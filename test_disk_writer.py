@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Test the background disk writer: ordering, superseding, bounds and fsync batching (runs offline)"""
+
+import os
+import tempfile
+import threading
+
+import offline_tests
+import webhook_processor as wp
+
+JPEG = b'\xff\xd8crossing\xff\xd9'
+
+
+def hold(writer):
+    """Block the writer thread until the returned event is set"""
+    gate, started = threading.Event(), threading.Event()
+    writer.submit(lambda: (started.set(), gate.wait(2)))
+    started.wait(2)
+    return gate
+
+
+def test_queued_writes_to_one_file_are_superseded():
+    writer = wp.DiskWriter(16, 1)
+    ran = []
+    gate = hold(writer)
+    for i in range(3):
+        writer.submit(lambda i=i: ran.append(('latest', i)), 'latest.jpg', lambda i=i: ran.append(('skipped', i)))
+        writer.submit(lambda i=i: ran.append(('capture', i)))
+    gate.set()
+    assert writer.flush(2)
+    assert ran == [('skipped', 0), ('capture', 0), ('skipped', 1), ('capture', 1), ('latest', 2), ('capture', 2)]
+    status = writer.status()
+    assert status['superseded'] == 2 and status['written'] == 5 and status['pending'] == 0
+
+
+def test_full_queue_drops_after_block_timeout():
+    writer = wp.DiskWriter(1, 0.05)
+    gate = hold(writer)
+    assert writer.submit(lambda: None)
+    assert not writer.submit(lambda: None)
+    gate.set()
+    assert writer.flush(2)
+    assert writer.status()['dropped'] == 1
+
+
+def test_failed_write_does_not_stop_the_writer():
+    writer = wp.DiskWriter(4, 1)
+    ran = []
+    writer.submit(lambda: 1 / 0)
+    writer.submit(lambda: ran.append('after'))
+    assert writer.flush(2)
+    assert ran == ['after'] and writer.status()['failed'] == 1
+
+
+def test_batch_policy_syncs_once_per_drained_burst():
+    writer = wp.DiskWriter(16, 1, 'batch')
+    gate = hold(writer)
+    for _ in range(5):
+        writer.submit(lambda: None)
+    gate.set()
+    assert writer.flush(2)
+    assert writer.status()['syncs'] == 1
+
+
+def test_line_crossing_burst_keeps_every_image_and_one_latest_write():
+    directory = tempfile.mkdtemp()
+    published = []
+    with offline_tests.swapped(wp, HTML_OUTPUT_PATH=directory, CAMERAS=wp.CameraRegistry({}), DISK_WRITER_ENABLED=True,
+                               publish_openhab_items=lambda updates, *args, **kwargs: published.extend(updates)):
+        gate = hold(wp.get_disk_writer())
+        try:
+            for second in range(3):
+                wp.save_linedetection_image(JPEG, f'2026-02-09T18:05:5{second}+01:00')
+            camera = wp.CAMERAS.default_for('linedetection')
+            assert not os.path.exists(os.path.join(directory, camera.line_image))
+        finally:
+            gate.set()
+        assert wp.flush_disk_writes(2)
+    names = [f"{camera.line_prefix}_20260209_18055{second}.jpg" for second in range(3)]
+    assert [value for _, value in published] == names
+    assert os.path.samefile(os.path.join(directory, camera.line_image), os.path.join(directory, names[-1]))
+    assert open(os.path.join(directory, camera.line_timestamp)).read() == '18:05:52'
+    assert not [name for name in os.listdir(directory) if name.startswith('.tmp')]
+
+
+def test_slow_openhab_does_not_hold_up_disk_writes():
+    directory = tempfile.mkdtemp()
+    openhab_back = threading.Event()
+    with offline_tests.swapped(wp, HTML_OUTPUT_PATH=directory, CAMERAS=wp.CameraRegistry({}), DISK_WRITER_ENABLED=True,
+                               publish_openhab_items=lambda *args, **kwargs: openhab_back.wait(5)):
+        try:
+            for second in range(3):
+                wp.save_linedetection_image(JPEG, f'2026-02-09T18:06:0{second}+01:00')
+            # Every image is on disk while the first filename publish is still stuck
+            assert wp.get_disk_writer().flush(2)
+            assert len([name for name in os.listdir(directory) if name.endswith('.jpg')]) == 4
+            openhab_back.set()
+            assert wp.flush_disk_writes(2)
+        finally:
+            openhab_back.set()
+
+
+if __name__ == '__main__':
+    offline_tests.run(globals())
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""Test that generated Hikvision events parse through the webhook extractors (runs offline)"""
+
+import random
+
+import hikvision_event_generator as gen
+import offline_tests
+import webhook_processor as wp
+
+
+def parse(camera, **options):
+    body, content_type = gen.generate_event(camera, random.Random(7), **options)
+    parts = wp.MultipartIndex(body, wp.get_multipart_boundary(content_type))
+    return body, parts, wp.extract_metadata_text(parts, body)
+
+
+def test_person_arming_track_event_parses():
+    camera = gen.make_cameras(1, ['track'])[0]
+    body, parts, text = parse(camera, image_kb=20, crop_kb=2)
+    analytics, image = wp.extract_analytics_from_webhook_bytes(text, body, parts)
+    assert analytics['human.jacketColor'] in gen.HUMAN_ATTRIBUTES['jacketColor']
+    assert analytics['face.gender'] in gen.FACE_ATTRIBUTES['gender']
+    image = bytes(image)
+    assert image.startswith(b'\xff\xd8') and image.endswith(b'\xff\xd9')
+    assert 19 * 1024 < len(image) <= 20 * 1024
+
+
+def test_capture_result_event_parses():
+    camera = gen.make_cameras(2, ['capture'])[1]
+    body, parts, text = parse(camera, image_kb=5, crop_kb=1, extra_fields=3)
+    analytics, image = wp.extract_analytics_from_webhook_bytes(text, body, parts)
+    assert analytics['human.trousersColor'] in gen.HUMAN_ATTRIBUTES['trousersColor']
+    assert image is not None
+
+
+def test_linedetection_event_parses():
+    camera = gen.make_cameras(1, ['line'])[0]
+    body, parts, text = parse(camera, image_kb=5)
+    assert wp.is_linedetection(text)
+    detection, image = wp.extract_linedetection_from_xml(text, body, parts)
+    assert detection['camera_ip'] == camera.ip
+    assert detection['region_id'] in ('1', '2')
+    assert detection['line_orientation'] == 'vertical'
+    assert image is not None
+
+
+if __name__ == '__main__':
+    offline_tests.run(globals())
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Test the declarative body detection field mapping (runs offline)"""
+
+import offline_tests
+import webhook_processor as wp
+
+CURRENT_FORMAT = {
+    'channelName': 'Cam1', 'eventType': 'mixedTargetDetection', 'dateTime': '2026-02-08T08:29:23+01:00',
+    'PersonArmingTrackInfo': {'PersonInfo': {
+        'Face': {'FaceCaptureResult': {'age': {'value': 34, 'ageGroup': 'young'}, 'glass': {'value': 'yes'},
+                                       'beard': {'value': 'yes'}, 'score': 88}},
+        'Human': {'HumanCaptureResult': {'jacketColor': {'value': 'red'}, 'hat': {'value': 'no'}}}
+    }}
+}
+LEGACY_FORMAT = {
+    'channelName': 'Cam1', 'eventType': 'mixedTargetDetection',
+    'CaptureResult': [{
+        'Face': {'snapTime': '2026-02-08T08:29:23+01:00', 'Property': [
+            {'description': 'age', 'value': 34}, {'description': 'ageGroup', 'value': 'young'},
+            {'description': 'glass', 'value': 'yes'}, {'description': 'beard', 'value': 'yes'},
+            {'description': 'score', 'value': 88}]},
+        'Human': {'snapTime': '2026-02-08T08:29:23+01:00', 'Property': [
+            {'description': 'jacketColor', 'value': 'red'}, {'description': 'hat', 'value': 'no'}]}
+    }]
+}
+
+
+def test_both_formats_map_to_the_same_items():
+    current = dict(wp.build_analytics_updates(wp.BODY_MAPPING.read(CURRENT_FORMAT)))
+    legacy = dict(wp.build_analytics_updates(wp.BODY_MAPPING.read(LEGACY_FORMAT)))
+    assert current == legacy
+    assert current[wp.ITEM_TIMESTAMP] == '08-02-2026 kl 08:29'
+    assert current[wp.ITEM_HAS_GLASSES] == 'ON'  # face.glass fills in for the missing human.glass
+    assert current[wp.ITEM_HAS_HAT] == 'OFF'
+    assert current[wp.ITEM_AGE] == '34'
+    assert current[wp.ITEM_AGE_GROUP] == 'young'
+    assert current[wp.ITEM_TROUSERS_COLOR] == 'unknown'
+
+
+def test_config_rules_add_and_replace_items():
+    rules = wp.merge_mapping_rules(wp.DEFAULT_BODY_MAPPING, [
+        {'item': 'Hikvision_HasBeard', 'paths': ['face.beard'], 'transform': 'switch', 'default': 'no'},
+        {'item': wp.ITEM_JACKET_COLOR, 'paths': ['human.jacketColor'], 'transform': 'map',
+         'values': {'red': 'Rød'}, 'default': 'unknown'}
+    ])
+    mapping = wp.AnalyticsMapping(rules, wp.SNAP_TIME_PATHS)
+    states = dict(mapping.updates(mapping.read(CURRENT_FORMAT)))
+    assert states['Hikvision_HasBeard'] == 'ON'
+    assert states[wp.ITEM_JACKET_COLOR] == 'Rød'
+    assert len(mapping.rules) == len(wp.DEFAULT_BODY_MAPPING) + 1
+
+
+def test_invalid_rules_are_skipped():
+    mapping = wp.AnalyticsMapping([
+        {'paths': ['face.age']},
+        {'item': 'A', 'paths': ['body.age']},
+        {'item': 'B', 'paths': ['face.age'], 'transform': 'upper'},
+        {'item': 'C', 'paths': ['face.age'], 'transform': 'map'},
+        {'item': 'D', 'paths': 'face.age'}
+    ])
+    assert [rule[0] for rule in mapping.rules] == ['D']
+    assert mapping.updates(mapping.read(CURRENT_FORMAT)) == [('D', '34')]
+
+
+def test_rule_without_default_is_skipped_when_missing():
+    mapping = wp.AnalyticsMapping([{'item': 'A', 'paths': ['human.bag']}, {'item': 'B', 'paths': ['human.bag'], 'default': 'none'}])
+    assert mapping.updates(mapping.read(CURRENT_FORMAT)) == [('B', 'none')]
+
+
+if __name__ == '__main__':
+    offline_tests.run(globals())
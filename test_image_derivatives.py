@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Test downscaled image derivatives and the viewer manifests (runs offline)"""
+
+import io
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+import offline_tests
+import webhook_processor as wp
+
+JPEG = b'\xff\xd8event image\xff\xd9'
+
+
+def stand_in_derivatives(jpeg_data, stem, content_hash=False):
+    """Same naming as build_derivatives without decoding (Pillow is optional)"""
+    suffix = f"_{bytes(jpeg_data).hex()[-8:]}" if content_hash else ''
+    filename = f"{stem}_thumb{suffix}.jpg"
+    return [(filename, b'thumb')], {'thumb': {"file": filename, "width": 320, "height": 180, "bytes": 5}}
+
+
+@contextmanager
+def output_dir(build=stand_in_derivatives, **overrides):
+    """Fresh output directory, built-in cameras and the given derivative builder; all restored afterwards"""
+    directory = tempfile.mkdtemp()
+    with offline_tests.swapped(wp, HTML_OUTPUT_PATH=directory, CAMERAS=wp.CameraRegistry({}),
+                               build_derivatives=build, **overrides):
+        yield directory
+
+
+def read_json(directory, name):
+    with open(os.path.join(directory, name)) as f:
+        return json.load(f)
+
+
+def test_body_manifest_keeps_one_previous_generation():
+    with output_dir() as directory:
+        camera = wp.CAMERAS.default_for('body_detection')
+        for i in range(3):
+            assert wp.write_detection_image(JPEG + bytes([i]), f'2026-02-09 18:05:5{i}', camera)
+        manifest = read_json(directory, wp.manifest_name_for(camera.body_image))
+        assert manifest['image'] == camera.body_image and manifest['time'] == '18:05:52'
+        current, previous = manifest['derivatives']['thumb']['file'], manifest['previous']
+        thumbs = sorted(name for name in os.listdir(directory) if '_thumb_' in name)
+        assert thumbs == sorted([current] + previous) and len(previous) == 1
+
+
+def test_body_manifest_is_removed_when_derivatives_stop():
+    with output_dir() as directory:
+        camera = wp.CAMERAS.default_for('body_detection')
+        wp.write_detection_image(JPEG, '18:05:50', camera)
+        wp.write_detection_image(JPEG + b'2', '18:05:51', camera)
+        wp.build_derivatives = lambda *args, **kwargs: ([], {})
+        wp.write_detection_image(JPEG, '18:05:52', camera)
+        assert sorted(os.listdir(directory)) == sorted([camera.body_image, camera.body_timestamp])
+
+
+def test_line_crossing_derivatives_are_indexed_and_evicted():
+    with output_dir(LINE_RETENTION_MAX_IMAGES=1) as directory:
+        camera = wp.CAMERAS.default_for('linedetection')
+        first = wp.write_linedetection_image(JPEG, '2026-02-09T18:05:57+01:00')
+        assert os.path.exists(os.path.join(directory, first.replace('.jpg', '_thumb.jpg')))
+        second = wp.write_linedetection_image(JPEG, '2026-02-09T18:05:58+01:00')
+        manifest = read_json(directory, wp.manifest_name_for(camera.line_image))
+        assert manifest['image'] == second
+        assert manifest['derivatives']['thumb']['file'] == second.replace('.jpg', '_thumb.jpg')
+        [entry] = wp.get_line_image_index(camera).recent(5)
+        assert entry['derivatives'] == {'thumb': second.replace('.jpg', '_thumb.jpg')}
+        # Retention deleted the first image together with its derivative
+        assert not [name for name in os.listdir(directory) if name.startswith(first[:-4])]
+
+
+def test_build_derivatives_downscales_without_upscaling():
+    if wp.Image is None:
+        return  # Pillow is optional; without it no derivatives are built at all
+    enabled, sizes = wp.DERIVATIVES_ENABLED, wp.DERIVATIVE_SIZES
+    try:
+        wp.DERIVATIVES_ENABLED, wp.DERIVATIVE_SIZES = True, {'thumb': 320, 'medium': 960, 'large': 4096}
+        out = io.BytesIO()
+        wp.Image.new('RGB', (1920, 1080), (200, 40, 40)).save(out, 'JPEG')
+        files, derivatives = wp.build_derivatives(memoryview(out.getvalue()), 'cam', content_hash=True)
+        assert sorted(derivatives) == ['medium', 'thumb']
+        assert (derivatives['thumb']['width'], derivatives['thumb']['height']) == (320, 180)
+        assert (derivatives['medium']['width'], derivatives['medium']['height']) == (960, 540)
+        assert all(wp.Image.open(io.BytesIO(data)).format == 'JPEG' for _, data in files)
+        assert wp.build_derivatives(b'not a jpeg', 'cam') == ([], {})
+    finally:
+        wp.DERIVATIVES_ENABLED, wp.DERIVATIVE_SIZES = enabled, sizes
+
+
+if __name__ == '__main__':
+    offline_tests.run(globals())
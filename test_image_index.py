@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Test the event image store, line crossing image index and retention (runs offline)"""
+
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+import offline_tests
+import webhook_processor as wp
+
+JPEG = b'\xff\xd8crossing\xff\xd9'
+
+
+@contextmanager
+def output_dir():
+    """Point the image output path at a fresh directory with only the built-in cameras, then restore both"""
+    directory = tempfile.mkdtemp()
+    with offline_tests.swapped(wp, HTML_OUTPUT_PATH=directory, CAMERAS=wp.CameraRegistry({})):
+        yield directory
+
+
+def test_same_second_crossings_are_kept_and_indexed():
+    with output_dir() as directory:
+        linedata = {'direction': 'Enter', 'object_type': 'Human', 'region_id': '1'}
+        names = [wp.write_linedetection_image(JPEG, '2026-02-09T18:05:57+01:00', None, linedata) for _ in range(3)]
+        prefix = wp.CAMERAS.default_for('linedetection').line_prefix
+        assert names == [f"{prefix}_20260209_180557.jpg", f"{prefix}_20260209_180557_2.jpg", f"{prefix}_20260209_180557_3.jpg"]
+        with open(os.path.join(directory, f"{prefix}_index.jsonl")) as f:
+            entries = [json.loads(line) for line in f]
+        assert [entry['file'] for entry in entries] == names
+        assert entries[0]['direction'] == 'Enter' and entries[0]['size'] == len(JPEG)
+        assert not [name for name in os.listdir(directory) if name.startswith('tmp')]
+
+
+def test_latest_alias_shares_the_timestamped_image():
+    with output_dir() as directory:
+        body = b'--x\r\n' + JPEG + b'\r\n--x--'
+        filename = wp.write_linedetection_image(memoryview(body)[5:5 + len(JPEG)], '2026-02-09T18:05:57+01:00')
+        camera = wp.CAMERAS.default_for('linedetection')
+        latest = os.path.join(directory, camera.line_image)
+        assert os.path.samefile(latest, os.path.join(directory, filename))
+        assert open(latest, 'rb').read() == JPEG
+        assert open(os.path.join(directory, camera.line_timestamp)).read() == '18:05:57'
+        assert not [name for name in os.listdir(directory) if name.startswith('.tmp')]
+        # The alias keeps the image when retention deletes the timestamped name
+        os.remove(os.path.join(directory, filename))
+        assert open(latest, 'rb').read() == JPEG
+
+
+def test_detection_image_and_timestamp_are_published_together():
+    with output_dir() as directory:
+        camera = wp.CAMERAS.default_for('body_detection')
+        assert wp.write_detection_image(JPEG, '2026-02-09 18:05:57', camera)
+        assert open(os.path.join(directory, camera.body_image), 'rb').read() == JPEG
+        assert open(os.path.join(directory, camera.body_timestamp)).read() == '18:05:57'
+        assert sorted(os.listdir(directory)) == sorted([camera.body_image, camera.body_timestamp])
+
+
+def test_retention_by_count_bytes_and_age():
+    directory = tempfile.mkdtemp()
+    index = wp.ImageIndex(directory, 'cam', 3, 25, 3600)
+    for i in range(4):
+        open(os.path.join(directory, f'cam_{i}.jpg'), 'wb').write(b'x' * 10)
+        index.add(f'cam_{i}.jpg', 10)
+    # Count limit keeps 3, byte limit (25) keeps 2
+    assert sorted(name for name in os.listdir(directory) if name.endswith('.jpg')) == ['cam_2.jpg', 'cam_3.jpg']
+    assert [entry['file'] for entry in index.recent(10)] == ['cam_3.jpg', 'cam_2.jpg']
+    index.max_age = -1  # Everything saved is now past the age limit
+    assert index.recent(10) == []
+
+
+def test_indexes_share_the_file_across_processes():
+    directory = tempfile.mkdtemp()
+    first = wp.ImageIndex(directory, 'cam', 100, 10 ** 6, 3600)
+    second = wp.ImageIndex(directory, 'cam', 100, 10 ** 6, 3600)
+    first.add('cam_a.jpg', 1)
+    second.add('cam_b.jpg', 1)
+    assert [entry['file'] for entry in first.recent(5)] == ['cam_b.jpg', 'cam_a.jpg']
+    # Compaction by one writer replaces the file; the other reloads it
+    second.max_images = 1
+    for i in range(wp.INDEX_COMPACT_MIN_LINES + 2):
+        second.add(f'cam_{i}.jpg', 1)
+    with open(second.path) as f:
+        assert len(f.readlines()) <= wp.INDEX_COMPACT_MIN_LINES + 2
+    assert [entry['file'] for entry in first.recent(1)] == [f'cam_{wp.INDEX_COMPACT_MIN_LINES + 1}.jpg']
+
+
+def test_existing_images_are_adopted_once():
+    directory = tempfile.mkdtemp()
+    for name in ('cam_20260209_180557.jpg', 'cam_20260209_180558_2.jpg', 'cam_latest.jpg', 'other.jpg'):
+        open(os.path.join(directory, name), 'wb').write(b'x')
+    index = wp.ImageIndex(directory, 'cam', 100, 10 ** 6, 10 ** 9, skip=('cam_latest.jpg',))
+    assert sorted(entry['file'] for entry in index.recent(10)) == ['cam_20260209_180557.jpg', 'cam_20260209_180558_2.jpg']
+    again = wp.ImageIndex(directory, 'cam', 100, 10 ** 6, 10 ** 9)
+    assert len(again.recent(10)) == 2
+
+
+def test_linecrossings_endpoint_lists_recent_images():
+    with output_dir():
+        wp.write_linedetection_image(JPEG, '2026-02-09T18:05:57+01:00', None, {'direction': 'Exit'})
+        client = wp.app.test_client()
+        crossings = client.get('/linecrossings?limit=5').get_json()['crossings']
+        assert list(crossings) == ['line_crossing']
+        assert crossings['line_crossing'][0]['direction'] == 'Exit'
+        assert client.get('/linecrossings?camera=nope').status_code == 404
+        assert client.get('/linecrossings?limit=x').status_code == 400
+
+
+if __name__ == '__main__':
+    offline_tests.run(globals())
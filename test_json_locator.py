@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""Test the body detection JSON locator and decoder (runs offline)"""
+
+import json
+import random
+
+import hikvision_event_generator as gen
+import offline_tests
+import webhook_processor as wp
+
+
+def test_json_part_is_decoded_from_part_index():
+    body, content_type = gen.generate_event(gen.make_cameras(1, ['track'])[0], random.Random(3), image_kb=2, crop_kb=1)
+    parts = wp.MultipartIndex(body, wp.get_multipart_boundary(content_type))
+    # Metadata text is not needed when the JSON part can be decoded directly
+    result = wp.decode_metadata_json('', parts)
+    assert result['eventType'] == 'mixedTargetDetection'
+    assert 'PersonArmingTrackInfo' in result
+
+
+def test_text_fallback_skips_braces_inside_strings():
+    payload = {'ipAddress': '10.0.0.1', 'eventDescription': 'odd } { "quoted" \\ text', 'Nested': {'a': [1, {'b': 2}]}}
+    for indent in (None, '\t', 8):
+        text = 'preamble {not json}\r\n' + json.dumps(payload, indent=indent) + '\r\n--boundary\r\n{"trailing": 1}'
+        assert wp.decode_metadata_json(text) == payload
+
+
+def test_unclosed_object_is_not_decoded():
+    text = '{"ipAddress": "10.0.0.1", "x": {' + '"k": "v", ' * 1000
+    assert wp.decode_metadata_json(text) is None
+    assert wp.decode_metadata_json('no json here') is None
+
+
+if __name__ == '__main__':
+    offline_tests.run(globals())
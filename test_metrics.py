@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Test the Prometheus metrics registry and /metrics endpoint (runs offline)"""
+
+import offline_tests
+import webhook_processor as wp
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = wp.MetricsRegistry((0.01, 0.1, 1.0))
+    for seconds in (0.005, 0.05, 0.05, 5.0):
+        metrics.observe('decode', 'body_detection', seconds)
+    text = metrics.render()
+    camera = wp.get_camera_label('body_detection')
+    labels = f'camera="{camera}",event_type="body_detection",stage="decode"'
+    assert f'hikvision_stage_duration_seconds_bucket{{{labels},le="0.01"}} 1' in text
+    assert f'hikvision_stage_duration_seconds_bucket{{{labels},le="0.1"}} 3' in text
+    assert f'hikvision_stage_duration_seconds_bucket{{{labels},le="1.0"}} 3' in text
+    assert f'hikvision_stage_duration_seconds_bucket{{{labels},le="+Inf"}} 4' in text
+    assert f'hikvision_stage_duration_seconds_count{{{labels}}} 4' in text
+    assert f'hikvision_stage_duration_seconds_sum{{{labels}}} 5.105000' in text
+
+
+def test_counters_and_unknown_event_type():
+    metrics = wp.MetricsRegistry(wp.METRICS_BUCKETS)
+    metrics.inc('hikvision_webhooks_total', 'linedetection', 'ok')
+    metrics.inc('hikvision_webhooks_total', 'linedetection', 'ok')
+    metrics.inc('hikvision_webhooks_total', None, 'error')
+    metrics.inc('hikvision_webhooks_total', None, 'error', 0)
+    text = metrics.render()
+    assert '# TYPE hikvision_webhooks_total counter' in text
+    assert 'event_type="linedetection",result="ok"} 2' in text
+    assert 'hikvision_webhooks_total{camera="unknown",event_type="unknown",result="error"} 1' in text
+
+
+def test_series_are_labelled_by_identified_camera():
+    metrics = wp.MetricsRegistry(wp.METRICS_BUCKETS)
+    garage = wp.Camera('garage', {'ip': '10.0.11.120', 'name': 'Garage'})
+    metrics.inc('hikvision_webhooks_total', 'body_detection', 'ok', camera=garage)
+    metrics.inc('hikvision_webhooks_total', 'body_detection', 'ok')
+    metrics.observe('decode', 'body_detection', 0.01, garage)
+    text = metrics.render()
+    builtin = wp.get_camera_label('body_detection')
+    assert f'hikvision_webhooks_total{{camera="{garage.label}",event_type="body_detection",result="ok"}} 1' in text
+    assert f'hikvision_webhooks_total{{camera="{builtin}",event_type="body_detection",result="ok"}} 1' in text
+    assert f'hikvision_stage_duration_seconds_count{{camera="{garage.label}",event_type="body_detection",stage="decode"}} 1' in text
+    assert metrics.stage_totals() == {('decode', 'body_detection'): (0.01, 1)}
+
+
+def test_disabled_registry_records_nothing():
+    metrics = wp.MetricsRegistry(wp.METRICS_BUCKETS, enabled=False)
+    metrics.observe('decode', 'body_detection', 0.01)
+    metrics.inc('hikvision_webhooks_total', 'body_detection', 'ok')
+    assert metrics.render() == '\n'
+
+
+def test_label_values_are_escaped():
+    assert wp.escape_label_value('a"b\\c\nd') == 'a\\"b\\\\c\\nd'
+
+
+def test_metrics_endpoint_serves_text_format():
+    response = wp.app.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    assert '# TYPE hikvision_circuit_breaker_open gauge' in response.get_data(as_text=True)
+
+
+if __name__ == '__main__':
+    offline_tests.run(globals())
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""Test OpenHAB publisher transports against local stand-in servers (runs offline)"""
+
+import socket
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import offline_tests
+import webhook_processor as wp
+
+
+class StandInBroker:
+    """Minimal MQTT 3.1.1 broker: accepts CONNECT, records every PUBLISH"""
+
+    def __init__(self):
+        self.server = socket.socket()
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+        self.messages = []
+        self.connections = 0
+        self.clients = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections += 1
+            self.clients.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        buffered = b''
+        try:
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    return
+                buffered += chunk
+                while buffered:
+                    # Decode fixed header: type byte + variable-length remaining length
+                    multiplier, length, index = 1, 0, 1
+                    while index < len(buffered):
+                        digit = buffered[index]
+                        length += (digit & 0x7F) * multiplier
+                        multiplier *= 128
+                        index += 1
+                        if not digit & 0x80:
+                            break
+                    else:
+                        break
+                    if len(buffered) < index + length:
+                        break
+                    packet_type, body = buffered[0], buffered[index:index + length]
+                    buffered = buffered[index + length:]
+                    if packet_type == 0x10:
+                        conn.sendall(b'\x20\x02\x00\x00')
+                    elif packet_type & 0xF0 == 0x30:
+                        topic_len = int.from_bytes(body[:2], 'big')
+                        topic = body[2:2 + topic_len].decode()
+                        self.messages.append((topic, body[2 + topic_len:].decode(), bool(packet_type & 0x01)))
+        except (ConnectionError, OSError):
+            return
+
+    def drop_clients(self):
+        for conn in self.clients:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+        self.clients = []
+
+    def close(self):
+        self.drop_clients()
+        try:
+            self.server.shutdown(socket.SHUT_RDWR)  # Wakes the blocked accept() so the port stops listening
+        except OSError:
+            pass
+        self.server.close()
+
+
+class StandInOpenHAB(BaseHTTPRequestHandler):
+    """Records PUT /rest/items/<item>/state requests and counts GET /rest/ probes"""
+
+    protocol_version = 'HTTP/1.1'
+    states = {}
+    probes = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+        StandInOpenHAB.states[self.path.split('/')[3]] = body
+        self.send_response(202)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        StandInOpenHAB.probes += 1
+        body = b'{"version": "4"}'
+        self.send_response(200 if self.path == '/rest/' else 404)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+@contextmanager
+def use_transport(transport, url=None, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+    """
+    Swap the process-wide transport for a with block; start from an empty state cache, a closed
+    breaker and an empty replay queue, and put the previous globals back afterwards
+    """
+    wp.get_openhab_session()
+    wp.ITEM_STATE_CACHE.invalidate("test setup")
+    try:
+        with offline_tests.swapped(wp, _openhab_transport=transport, OPENHAB_URL=url or wp.OPENHAB_URL,
+                                   OPENHAB_BREAKER=wp.CircuitBreaker(failure_threshold, reset_timeout, clock),
+                                   _replay_queue=wp.ReplayQueue(os.path.join(tempfile.mkdtemp(), 'replay.json'), 50),
+                                   _replay_queue_pid=os.getpid(), _prober_pid=wp._prober_pid):
+            yield
+    finally:
+        wp.ITEM_STATE_CACHE.invalidate("test teardown")
+
+
+def test_mqtt_transport_publishes_event_in_one_burst():
+    broker = StandInBroker()
+    transport = wp.MqttTransport('127.0.0.1', broker.port, 'oh/{item}/state', 'test-client')
+    try:
+        with use_transport(transport):
+            updates = [(f'Item_{i}', f'value {i}') for i in range(20)]
+            assert wp.publish_openhab_items(updates, 'test') == 20
+            assert wait_for(lambda: len(broker.messages) == 20)
+            assert broker.messages[0] == ('oh/Item_0/state', 'value 0', True)
+            assert broker.connections == 1
+
+            # Second event reuses the connection; unchanged items are skipped by the state cache
+            assert wp.publish_openhab_items(updates[:5] + [('Item_0', 'new value')], 'test') == 1
+            assert wait_for(lambda: len(broker.messages) == 21)
+            assert broker.messages[-1] == ('oh/Item_0/state', 'new value', True)
+            assert broker.connections == 1
+    finally:
+        transport.close()
+        broker.close()
+
+
+def test_mqtt_transport_reconnects_after_broker_drop():
+    broker = StandInBroker()
+    transport = wp.MqttTransport('127.0.0.1', broker.port, 'oh/{item}/state', 'test-client')
+    try:
+        with use_transport(transport):
+            assert wp.update_openhab_item('Item_A', 'one')
+            assert wait_for(lambda: len(broker.messages) == 1)
+            broker.drop_clients()
+            time.sleep(0.05)
+            assert wp.update_openhab_item('Item_A', 'two')
+            assert wait_for(lambda: len(broker.messages) == 2)
+            assert broker.connections == 2
+    finally:
+        transport.close()
+        broker.close()
+
+
+def test_mqtt_transport_reports_failure_when_broker_down():
+    broker = StandInBroker()
+    port = broker.port
+    broker.close()
+    with use_transport(wp.MqttTransport('127.0.0.1', port, 'oh/{item}/state', 'test-client')):
+        assert wp.publish_openhab_items([('Item_A', 'x'), ('Item_B', 'y')], 'test') == 0
+        assert wp.ITEM_STATE_CACHE.status()['entries'] == 0
+
+
+def test_rest_transport_puts_every_item():
+    StandInOpenHAB.states = {}
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInOpenHAB)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with use_transport(wp.RestTransport(), f"http://127.0.0.1:{server.server_address[1]}"):
+            updates = [(f'Item_{i}', str(i)) for i in range(10)]
+            assert wp.publish_openhab_items(updates, 'test') == 10
+            assert StandInOpenHAB.states == {item: value for item, value in updates}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_circuit_breaker_queues_during_outage_and_replays_on_recovery():
+    StandInOpenHAB.states = {}
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInOpenHAB)
+    up_url = f"http://127.0.0.1:{server.server_address[1]}"
+    with socket.socket() as unused:
+        unused.bind(('127.0.0.1', 0))
+        down_url = f"http://127.0.0.1:{unused.getsockname()[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        now = [1000.0]  # Breaker clock, advanced by hand
+        with use_transport(wp.RestTransport(), down_url, failure_threshold=2, reset_timeout=30, clock=lambda: now[0]):
+            assert wp.publish_openhab_items([('Item_A', '1'), ('Item_B', '1')], 'test') == 0
+            assert wp.OPENHAB_BREAKER.state == 'open'
+            queue = wp.get_replay_queue()
+
+            # Open breaker: nothing is sent, later states replace queued ones per item
+            failures = wp.OPENHAB_BREAKER.failures
+            assert wp.publish_openhab_items([('Item_A', '2'), ('Item_C', '2')], 'test') == 0
+            assert wp.OPENHAB_BREAKER.failures == failures
+            assert dict(queue.pending) == {'Item_A': '2', 'Item_B': '1', 'Item_C': '2'}
+
+            # Queue is durable: a fresh instance reads the same file back
+            assert wp.ReplayQueue(queue.path, 50).pending == queue.pending
+
+            # OpenHAB is back: the half-open probe closes the breaker and the queue is flushed
+            wp.OPENHAB_URL = up_url
+            now[0] += 31
+            assert wp.publish_openhab_items([('Item_C', '3')], 'test') == 1
+            assert wp.OPENHAB_BREAKER.state == 'closed'
+            assert StandInOpenHAB.states == {'Item_A': '2', 'Item_B': '1', 'Item_C': '3'}
+            assert len(queue) == 0
+            assert not os.path.exists(queue.path)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_replay_queue_is_shared_between_workers():
+    path = os.path.join(tempfile.mkdtemp(), 'replay.json')
+    first, second = wp.ReplayQueue(path, 50), wp.ReplayQueue(path, 50)  # As in two gunicorn workers
+    first.add([('Item_A', '1'), ('Item_B', '1')])
+    second.add([('Item_C', '1')])
+    second.discard(['Item_B'])
+    assert len(first) == 2  # Rereads the file the other worker replaced
+    assert wp.ReplayQueue(path, 50).pending == {'Item_A': '1', 'Item_C': '1'}
+
+    # Only one worker replays: draining in one leaves nothing for the other
+    assert first.drain() == [('Item_A', '1'), ('Item_C', '1')]
+    assert second.drain() == []
+    assert len(first) == 0 and not os.path.exists(path)
+
+
+def test_health_probe_closes_breaker_and_health_reads_cache():
+    StandInOpenHAB.states, StandInOpenHAB.probes = {}, 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInOpenHAB)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with use_transport(wp.RestTransport(), f"http://127.0.0.1:{server.server_address[1]}", failure_threshold=1):
+            wp.OPENHAB_BREAKER.record_failure()
+            wp.get_replay_queue().add([('Item_A', 'queued')])
+
+            # A probe succeeds without any camera event: breaker closes, queue is replayed
+            assert wp.probe_openhab()
+            assert wp.OPENHAB_BREAKER.state == 'closed'
+            assert StandInOpenHAB.states == {'Item_A': 'queued'}
+
+            # /health only reads cached state, it never calls OpenHAB itself
+            wp._prober_pid = os.getpid()
+            probes = StandInOpenHAB.probes
+            response = wp.app.test_client().get('/health')
+            health = response.get_json()
+            assert response.status_code == 200
+            assert StandInOpenHAB.probes == probes
+            assert health['openhab_probe']['reachable'] is True
+            assert health['replay_queue']['pending'] == 0
+            assert set(health['publish_latency_ms']) == {'count', 'p50', 'p90', 'p99', 'max'}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    offline_tests.run(globals())
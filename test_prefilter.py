@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Test the heartbeat / no-op webhook pre-filter (runs offline)"""
+
+import os
+import random
+import tempfile
+
+import hikvision_event_generator as gen
+import offline_tests
+import webhook_processor as wp
+
+ALERT_XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<EventNotificationAlert version="2.0" xmlns="http://www.hikvision.com/ver20/XMLSchema">
+<ipAddress>10.0.11.102</ipAddress>
+<channelID>1</channelID>
+<eventType>{event_type}</eventType>
+<eventState>{event_state}</eventState>
+</EventNotificationAlert>'''
+
+
+def generated(kind, **options):
+    camera = gen.make_cameras(1, [kind])[0]
+    return gen.generate_event(camera, random.Random(3), **options)
+
+
+def test_detection_events_pass_through():
+    for kind in ('track', 'capture', 'line'):
+        body, _ = generated(kind, image_kb=5, crop_kb=1)
+        assert wp.preclassify_webhook(body)[0] is None, kind
+    # Small body detection event that fits in the window entirely is still a detection
+    body, _ = generated('track', image_kb=1, crop_kb=1)
+    assert wp.preclassify_webhook(body, scan_bytes=len(body) + 1)[0] is None
+
+
+def test_track_info_heartbeat_is_skipped():
+    body, _ = generated('heartbeat')
+    assert wp.preclassify_webhook(body) == ('heartbeat', 'mixedtargetdetection')
+    # Larger than the window: cannot tell, full pipeline decides
+    assert wp.preclassify_webhook(body, scan_bytes=len(body) - 1)[0] is None
+
+
+def test_inactive_and_unknown_events_are_skipped():
+    heartbeat = ALERT_XML.format(event_type='videoloss', event_state='inactive').encode()
+    inactive = ALERT_XML.format(event_type='linedetection', event_state='inactive').encode()
+    unknown = ALERT_XML.format(event_type='VMD', event_state='active').encode()
+    no_metadata = b'--MIME_boundary\r\nContent-Type: image/jpeg\r\n\r\n\xff\xd8\xff\xd9\r\n--MIME_boundary--\r\n'
+    assert wp.preclassify_webhook(heartbeat)[0] == 'heartbeat'
+    assert wp.preclassify_webhook(inactive) == ('inactive', 'linedetection')
+    assert wp.preclassify_webhook(unknown) == ('unknown_event', 'vmd')
+    assert wp.preclassify_webhook(no_metadata) == (None, None)
+
+
+def test_unknown_event_types_are_processed_unless_skipped():
+    unknown = ALERT_XML.format(event_type='fieldDetectionV2', event_state='active').encode()
+    before = wp.get_prefilter_status()
+    with offline_tests.swapped(wp, PREFILTER_UNKNOWN_EVENTS='process'):
+        assert wp.filter_webhook(unknown, '10.0.11.102') is None
+    with offline_tests.swapped(wp, PREFILTER_UNKNOWN_EVENTS='skip'):
+        assert wp.filter_webhook(unknown, '10.0.11.102') == 'unknown_event'
+    after = wp.get_prefilter_status()
+    assert after['unknown_processed'] == before['unknown_processed'] + 1
+    assert after['unknown_event'] == before['unknown_event'] + 1
+    assert 'hikvision_webhooks_unknown_total{camera=' in wp.METRICS.render()
+
+
+def test_webhook_route_answers_heartbeat_without_logging():
+    workdir = tempfile.mkdtemp()
+    before = wp.get_prefilter_status()['heartbeat']
+    body, content_type = generated('heartbeat')
+    with offline_tests.swapped(wp, WEBHOOK_DIR=workdir, _prober_pid=os.getpid()):
+        response = wp.app.test_client().post('/webhook', data=body, content_type=content_type)
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'ignored'
+    assert response.get_json()['reason'] == 'heartbeat'
+    assert os.listdir(workdir) == []
+    assert wp.get_prefilter_status()['heartbeat'] == before + 1
+    assert 'hikvision_webhooks_filtered_total{camera=' in wp.METRICS.render()
+
+
+if __name__ == '__main__':
+    offline_tests.run(globals())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Test per-source rate limiting and load shedding (runs offline)"""
+
+import io
+import os
+import time
+
+import offline_tests
+import webhook_processor as wp
+
+
+def test_token_bucket_allows_burst_then_refills():
+    limiter = wp.TokenBucketLimiter()
+    assert all(limiter.allow('10.0.20.1', 20, 5) for _ in range(5))
+    assert not limiter.allow('10.0.20.1', 20, 5)
+    # Another source has its own bucket
+    assert limiter.allow('10.0.20.2', 20, 5)
+    time.sleep(0.06)
+    assert limiter.allow('10.0.20.1', 20, 5)
+    assert limiter.status() == {'10.0.20.1': 1}
+
+
+def test_idle_buckets_are_pruned():
+    limiter = wp.TokenBucketLimiter(max_sources=2)
+    limiter.allow('a', 1000, 1)
+    limiter.allow('b', 1000, 1)
+    time.sleep(0.01)
+    limiter.allow('c', 1000, 1)
+    assert set(limiter.buckets) == {'c'}
+
+
+def test_prune_uses_each_bucket_own_rate():
+    limiter = wp.TokenBucketLimiter(max_sources=2)
+    limiter.allow('nvr', 0.001, 1)  # Camera override: depleted for a long time
+    limiter.allow('b', 1000, 1)
+    time.sleep(0.01)
+    limiter.allow('c', 1000, 1)  # Prunes with the default rate of the new source
+    assert set(limiter.buckets) == {'nvr', 'c'}
+    assert not limiter.allow('nvr', 0.001, 1)
+
+
+def test_camera_rate_limit_override():
+    registry = wp.CameraRegistry({'nvr': {'ip': '10.0.20.9', 'rate_limit': {'rate_per_second': 50}}})
+    assert registry.rate_limit_for('10.0.20.9') == (50, wp.RATE_LIMIT_BURST)
+    assert registry.rate_limit_for('10.0.20.10') == (wp.RATE_LIMIT_RATE, wp.RATE_LIMIT_BURST)
+
+
+def test_webhook_sheds_before_reading_body():
+    cameras, rate_limiter, prober_pid = wp.CAMERAS, wp.RATE_LIMITER, wp._prober_pid
+    wp._prober_pid = os.getpid()
+    wp.RATE_LIMITER = wp.TokenBucketLimiter()
+    wp.CAMERAS = wp.CameraRegistry({'loop': {'ip': '10.0.20.7', 'rate_limit': {'rate_per_second': 0.001, 'burst': 1}}})
+    try:
+        client = wp.app.test_client()
+        environ = {'REMOTE_ADDR': '10.0.20.7'}
+        first = client.post('/webhook', data=b'', content_type='text/plain', environ_base=environ)
+        assert first.status_code != 429
+        second = client.post('/webhook', data=b'x' * 1024, content_type='text/plain', environ_base=environ)
+        assert second.status_code == 429
+        assert second.headers['Retry-After'] == '1'
+        assert second.get_json()['status'] == 'rate_limited'
+        camera = wp.CAMERAS.cameras['loop'].label
+        assert f'hikvision_webhooks_shed_total{{camera="{camera}",event_type="unknown",result="rate_limited"}}' in wp.METRICS.render()
+        assert wp.get_rate_limit_status()['in_flight'] == 0
+    finally:
+        wp.CAMERAS, wp.RATE_LIMITER, wp._prober_pid = cameras, rate_limiter, prober_pid
+
+
+def test_oversized_body_is_refused_before_reading():
+    prober_pid = wp._prober_pid
+    wp._prober_pid = os.getpid()
+    try:
+        client = wp.app.test_client()
+        declared = str(wp.WEBHOOK_MAX_BODY_BYTES + 1)
+        response = client.post('/webhook', data=b'x' * 1024, content_type='text/plain',
+                               environ_overrides={'CONTENT_LENGTH': declared})
+        assert response.status_code == 413
+        assert response.get_json()['status'] == 'too_large'
+        assert 'result="too_large"' in wp.METRICS.render()
+        assert wp.get_rate_limit_status()['in_flight'] == 0
+    finally:
+        wp._prober_pid = prober_pid
+    # Chunked uploads have no declared length: reading stops once the limit is passed
+    assert wp.read_request_body(io.BytesIO(b'x' * 200 * 1024), None, 100 * 1024) is None
+    assert len(wp.read_request_body(io.BytesIO(b'x' * 200 * 1024), None, 300 * 1024)) == 200 * 1024
+
+
+def test_concurrency_cap_sheds_with_503():
+    rate_limiter = wp.RATE_LIMITER
+    wp.RATE_LIMITER = wp.TokenBucketLimiter()
+    limit = wp.RATE_LIMIT_MAX_CONCURRENT
+    admitted = [wp.admit_webhook(f'10.0.21.{i}') for i in range(limit)]
+    try:
+        assert admitted == [None] * limit
+        rejection = wp.admit_webhook('10.0.22.1')
+        assert rejection[1] == 503
+    finally:
+        for _ in admitted:
+            wp.release_webhook()
+        wp.RATE_LIMITER = rate_limiter
+    assert wp.admit_webhook('10.0.22.1') is None
+    wp.release_webhook()
+
+
+if __name__ == '__main__':
+    offline_tests.run(globals())
@@ -4,15 +4,48 @@ Hikvision Webhook Analytics Processor
 Receives webhook notifications from Hikvision camera and updates OpenHAB items
 """
 
-from flask import Flask, request
+from flask import Flask, Response, request
+import argparse
+import atexit
+import bisect
+import fcntl
+import gzip
+import hashlib
+import io
 import json
 import requests
 from datetime import datetime
 import logging
 import os
-import glob
+import re
+import select
+import socket
+import sys
 import tempfile
+import queue
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from requests.adapters import HTTPAdapter
 import xml.etree.ElementTree as ET
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
 
 # Load configuration from JSON file
 CONFIG_FILE = os.path.join(os.path.dirname(__file__), 'config.json')
@@ -32,17 +65,72 @@ except json.JSONDecodeError as e:
 OPENHAB_URL = CONFIG.get('openhab', {}).get('url', "http://localhost:8080")
 OPENHAB_TIMEOUT = CONFIG.get('openhab', {}).get('timeout_seconds', 5)
 OPENHAB_HEALTH_TIMEOUT = CONFIG.get('openhab', {}).get('health_check_timeout', 2)
+OPENHAB_HEALTH_INTERVAL = CONFIG.get('openhab', {}).get('health_check_interval_seconds', 30)
+OPENHAB_PUBLISH_WORKERS = CONFIG.get('openhab', {}).get('publish_workers', 24)
+OPENHAB_POOL_SIZE = CONFIG.get('openhab', {}).get('connection_pool_size', 24)
+OPENHAB_TRANSPORT = CONFIG.get('openhab', {}).get('transport', 'rest')
+MQTT_HOST = CONFIG.get('openhab', {}).get('mqtt', {}).get('host', 'localhost')
+MQTT_PORT = CONFIG.get('openhab', {}).get('mqtt', {}).get('port', 1883)
+MQTT_TOPIC_TEMPLATE = CONFIG.get('openhab', {}).get('mqtt', {}).get('topic_template', 'hikvision/{item}/state')
+MQTT_CLIENT_ID = CONFIG.get('openhab', {}).get('mqtt', {}).get('client_id', 'hikvision-analytics')
+MQTT_USERNAME = CONFIG.get('openhab', {}).get('mqtt', {}).get('username', '')
+MQTT_PASSWORD = CONFIG.get('openhab', {}).get('mqtt', {}).get('password', '')
+MQTT_RETAIN = CONFIG.get('openhab', {}).get('mqtt', {}).get('retain', True)
+MQTT_KEEPALIVE = CONFIG.get('openhab', {}).get('mqtt', {}).get('keepalive_seconds', 60)
+STATE_CACHE_ENABLED = CONFIG.get('openhab', {}).get('state_cache', {}).get('enabled', True)
+STATE_CACHE_TTL = CONFIG.get('openhab', {}).get('state_cache', {}).get('ttl_seconds', 300)
+STATE_CACHE_REFRESH_INTERVAL = CONFIG.get('openhab', {}).get('state_cache', {}).get('refresh_interval_seconds', 3600)
+BREAKER_FAILURE_THRESHOLD = CONFIG.get('openhab', {}).get('circuit_breaker', {}).get('failure_threshold', 5)
+BREAKER_RESET_TIMEOUT = CONFIG.get('openhab', {}).get('circuit_breaker', {}).get('reset_timeout_seconds', 30)
+REPLAY_QUEUE_FILE = CONFIG.get('openhab', {}).get('replay_queue', {}).get('file', 'openhab_replay.json')
+REPLAY_QUEUE_MAX_ITEMS = CONFIG.get('openhab', {}).get('replay_queue', {}).get('max_items', 500)
+SERVER_WORKERS = CONFIG.get('server', {}).get('workers', 1)
+SERVER_THREADS = CONFIG.get('server', {}).get('threads', 8)
+SERVER_TIMEOUT = CONFIG.get('server', {}).get('timeout_seconds', 30)
+SERVER_GRACEFUL_TIMEOUT = CONFIG.get('server', {}).get('graceful_timeout_seconds', 30)
+SERVER_KEEPALIVE = CONFIG.get('server', {}).get('keepalive_seconds', 5)
+REQUEST_CHUNK_SIZE = 64 * 1024  # Bytes read from the request stream per call
+INGEST_WORKERS = CONFIG.get('ingest', {}).get('workers', 2)
+INGEST_QUEUE_SIZE = CONFIG.get('ingest', {}).get('queue_size', 100)
+INGEST_OVERFLOW_POLICY = CONFIG.get('ingest', {}).get('overflow_policy', 'drop_oldest')
+INGEST_BLOCK_TIMEOUT = CONFIG.get('ingest', {}).get('block_timeout_seconds', 5)
+DISK_WRITER_ENABLED = CONFIG.get('disk_writer', {}).get('enabled', True)
+DISK_WRITER_QUEUE_SIZE = CONFIG.get('disk_writer', {}).get('queue_size', 64)
+DISK_WRITER_BLOCK_TIMEOUT = CONFIG.get('disk_writer', {}).get('block_timeout_seconds', 5)
+DISK_FSYNC_POLICY = CONFIG.get('disk_writer', {}).get('fsync', 'none')
+PREFILTER_ENABLED = CONFIG.get('prefilter', {}).get('enabled', True)
+PREFILTER_SCAN_BYTES = CONFIG.get('prefilter', {}).get('scan_bytes', 4096)
+PREFILTER_EVENT_TYPES = CONFIG.get('prefilter', {}).get('event_types', ['mixedTargetDetection', 'linedetection'])
+PREFILTER_UNKNOWN_EVENTS = CONFIG.get('prefilter', {}).get('unknown_events', 'process')
+COALESCE_WINDOW = CONFIG.get('coalesce', {}).get('window_seconds', 0)
+RATE_LIMIT_ENABLED = CONFIG.get('rate_limit', {}).get('enabled', True)
+RATE_LIMIT_RATE = CONFIG.get('rate_limit', {}).get('rate_per_second', 10)
+RATE_LIMIT_BURST = CONFIG.get('rate_limit', {}).get('burst', 20)
+RATE_LIMIT_MAX_CONCURRENT = CONFIG.get('rate_limit', {}).get('max_concurrent', 32)
+COALESCE_DEDUP_SECONDS = CONFIG.get('coalesce', {}).get('dedup_seconds', 60)
+METRICS_ENABLED = CONFIG.get('metrics', {}).get('enabled', True)
 WEBHOOK_PORT = CONFIG.get('webhook', {}).get('port', 5001)
 LOG_WEBHOOKS = CONFIG.get('webhook', {}).get('log_webhooks', True)
 MAX_WEBHOOK_FILES = CONFIG.get('webhook', {}).get('max_saved_files', 50)
+MAX_WEBHOOK_MB = CONFIG.get('webhook', {}).get('max_saved_mb', 100)
+CAPTURE_FORMAT = CONFIG.get('webhook', {}).get('capture_format', 'archive')
+CAPTURE_COMPRESSION = CONFIG.get('webhook', {}).get('capture_compression', 'gzip')
+CAPTURE_SEGMENT_MB = CONFIG.get('webhook', {}).get('segment_mb', 8)
+# Largest webhook body accepted (both variants); async.max_body_bytes is the older name
+WEBHOOK_MAX_BODY_BYTES = CONFIG.get('webhook', {}).get(
+    'max_body_bytes', CONFIG.get('async', {}).get('max_body_bytes', 16 * 1024 * 1024))
 WEBHOOK_DIR = CONFIG.get('paths', {}).get('webhook_dir', "/etc/openhab/hikvision-analytics")
 HTML_OUTPUT_PATH = CONFIG.get('paths', {}).get('html_output', "/etc/openhab/html")
 IMAGE_FILENAME = CONFIG.get('files', {}).get('body_detection_image', "hikvision_latest.jpg")
 TIMESTAMP_FILENAME = CONFIG.get('files', {}).get('body_detection_timestamp', "hikvision_latest_time.txt")
 LINE_CROSSING_IMAGE = CONFIG.get('files', {}).get('line_crossing_image', "linecrossing_latest.jpg")
 LINE_CROSSING_TIMESTAMP = CONFIG.get('files', {}).get('line_crossing_timestamp', "linecrossing_latest_time.txt")
-# Extract prefix for timestamped line crossing files (remove '_latest.jpg' from filename)
-LINE_CROSSING_PREFIX = LINE_CROSSING_IMAGE.replace('_latest.jpg', '').replace('.jpg', '')
+LINE_RETENTION_MAX_IMAGES = CONFIG.get('retention', {}).get('line_crossing', {}).get('max_images', 500)
+LINE_RETENTION_MAX_MB = CONFIG.get('retention', {}).get('line_crossing', {}).get('max_mb', 500)
+LINE_RETENTION_MAX_AGE_DAYS = CONFIG.get('retention', {}).get('line_crossing', {}).get('max_age_days', 30)
+DERIVATIVES_ENABLED = CONFIG.get('derivatives', {}).get('enabled', True)
+DERIVATIVE_SIZES = CONFIG.get('derivatives', {}).get('sizes', {'thumb': 320, 'medium': 960})
+DERIVATIVE_QUALITY = CONFIG.get('derivatives', {}).get('quality', 80)
 
 # Detection configuration (target-specific thresholds for optimal detection)
 # Detection configuration
@@ -51,9 +139,8 @@ INVERT_DIRECTION = CONFIG.get('detection', {}).get('invert_direction', False)
 REGION_DIRECTION_MAP = CONFIG.get('detection', {}).get('region_direction_mapping', {})
 CAMERA_RESOLUTION = CONFIG.get('detection', {}).get('camera_resolution', {'width': 1280, 'height': 720})
 
-# Camera configuration from JSON
-CAMERA_BODY = CONFIG.get('cameras', {}).get('body_detection', {})
-CAMERA_LINE = CONFIG.get('cameras', {}).get('line_crossing', {})
+# Camera configuration from JSON (every entry is a camera, see CAMERA REGISTRY)
+CAMERA_CONFIG = CONFIG.get('cameras', {})
 
 # OpenHAB Item Names from config (with fallbacks)
 body_items = CONFIG.get('items', {}).get('body_detection', {})
@@ -104,6 +191,9 @@ ITEM_LC_REGION_ID = line_items.get('region_id', 'LineCrossing_RegionID')
 ITEM_LC_SENSITIVITY = line_items.get('sensitivity', 'LineCrossing_Sensitivity')
 ITEM_LC_IMAGE_FILENAME = line_items.get('image_filename', 'LineCrossing_ImageFilename')
 
+# Extra or replacement body detection field mappings (see FIELD MAPPING below)
+BODY_MAPPING_RULES = CONFIG.get('mappings', {}).get('body_detection', [])
+
 # Setup logging (must be before validation)
 logging.basicConfig(
     level=logging.INFO,
@@ -123,166 +213,689 @@ if not isinstance(CAMERA_RESOLUTION, dict):
 CAMERA_WIDTH = CAMERA_RESOLUTION.get('width', 1280)
 CAMERA_HEIGHT = CAMERA_RESOLUTION.get('height', 720)
 
+# Validate publisher pool sizes (must be positive integers)
+if not isinstance(OPENHAB_PUBLISH_WORKERS, int) or OPENHAB_PUBLISH_WORKERS < 1:
+    logger.warning(f"Invalid publish_workers {OPENHAB_PUBLISH_WORKERS}, using default 24")
+    OPENHAB_PUBLISH_WORKERS = 24
+if not isinstance(OPENHAB_POOL_SIZE, int) or OPENHAB_POOL_SIZE < 1:
+    logger.warning(f"Invalid connection_pool_size {OPENHAB_POOL_SIZE}, using default 24")
+    OPENHAB_POOL_SIZE = 24
+
+# Validate OpenHAB transport (rest = one PUT per item, mqtt = one publish burst per event)
+if OPENHAB_TRANSPORT not in ('rest', 'mqtt'):
+    logger.warning(f"Invalid openhab transport '{OPENHAB_TRANSPORT}', using default 'rest'")
+    OPENHAB_TRANSPORT = 'rest'
+
+# Validate background health probe interval
+if not isinstance(OPENHAB_HEALTH_INTERVAL, (int, float)) or OPENHAB_HEALTH_INTERVAL <= 0:
+    logger.warning(f"Invalid health_check_interval_seconds {OPENHAB_HEALTH_INTERVAL}, using default 30")
+    OPENHAB_HEALTH_INTERVAL = 30
+
+# Validate circuit breaker and replay queue settings
+if not isinstance(BREAKER_FAILURE_THRESHOLD, int) or BREAKER_FAILURE_THRESHOLD < 1:
+    logger.warning(f"Invalid circuit_breaker failure_threshold {BREAKER_FAILURE_THRESHOLD}, using default 5")
+    BREAKER_FAILURE_THRESHOLD = 5
+if not isinstance(BREAKER_RESET_TIMEOUT, (int, float)) or BREAKER_RESET_TIMEOUT <= 0:
+    logger.warning(f"Invalid circuit_breaker reset_timeout_seconds {BREAKER_RESET_TIMEOUT}, using default 30")
+    BREAKER_RESET_TIMEOUT = 30
+if not isinstance(REPLAY_QUEUE_MAX_ITEMS, int) or REPLAY_QUEUE_MAX_ITEMS < 1:
+    logger.warning(f"Invalid replay_queue max_items {REPLAY_QUEUE_MAX_ITEMS}, using default 500")
+    REPLAY_QUEUE_MAX_ITEMS = 500
+
+# Validate raw capture retention (count and size limits)
+if not isinstance(MAX_WEBHOOK_FILES, int) or MAX_WEBHOOK_FILES < 1:
+    logger.warning(f"Invalid max_saved_files {MAX_WEBHOOK_FILES}, using default 50")
+    MAX_WEBHOOK_FILES = 50
+if not isinstance(MAX_WEBHOOK_MB, (int, float)) or MAX_WEBHOOK_MB <= 0:
+    logger.warning(f"Invalid max_saved_mb {MAX_WEBHOOK_MB}, using default 100")
+    MAX_WEBHOOK_MB = 100
+
+# Validate capture archive settings (CaptureArchive falls back to gzip when zstandard is missing)
+if CAPTURE_FORMAT not in ('archive', 'files'):
+    logger.warning(f"Invalid capture_format '{CAPTURE_FORMAT}', using default 'archive'")
+    CAPTURE_FORMAT = 'archive'
+if CAPTURE_COMPRESSION not in ('gzip', 'zstd'):
+    logger.warning(f"Invalid capture_compression '{CAPTURE_COMPRESSION}', using default 'gzip'")
+    CAPTURE_COMPRESSION = 'gzip'
+if not isinstance(CAPTURE_SEGMENT_MB, (int, float)) or CAPTURE_SEGMENT_MB <= 0:
+    logger.warning(f"Invalid segment_mb {CAPTURE_SEGMENT_MB}, using default 8")
+    CAPTURE_SEGMENT_MB = 8
+
+# Validate line crossing image retention (count, size and age limits)
+if not isinstance(LINE_RETENTION_MAX_IMAGES, int) or LINE_RETENTION_MAX_IMAGES < 1:
+    logger.warning(f"Invalid line_crossing max_images {LINE_RETENTION_MAX_IMAGES}, using default 500")
+    LINE_RETENTION_MAX_IMAGES = 500
+if not isinstance(LINE_RETENTION_MAX_MB, (int, float)) or LINE_RETENTION_MAX_MB <= 0:
+    logger.warning(f"Invalid line_crossing max_mb {LINE_RETENTION_MAX_MB}, using default 500")
+    LINE_RETENTION_MAX_MB = 500
+if not isinstance(LINE_RETENTION_MAX_AGE_DAYS, (int, float)) or LINE_RETENTION_MAX_AGE_DAYS <= 0:
+    logger.warning(f"Invalid line_crossing max_age_days {LINE_RETENTION_MAX_AGE_DAYS}, using default 30")
+    LINE_RETENTION_MAX_AGE_DAYS = 30
+
+# Validate image derivative settings (downscaled copies need the optional Pillow package)
+if not isinstance(DERIVATIVE_SIZES, dict) or not all(
+        isinstance(name, str) and name.isidentifier() and isinstance(width, int) and width >= 16
+        for name, width in DERIVATIVE_SIZES.items()):
+    logger.warning(f"Invalid derivatives sizes {DERIVATIVE_SIZES}, using default {{'thumb': 320, 'medium': 960}}")
+    DERIVATIVE_SIZES = {'thumb': 320, 'medium': 960}
+if not isinstance(DERIVATIVE_QUALITY, int) or not 1 <= DERIVATIVE_QUALITY <= 95:
+    logger.warning(f"Invalid derivatives quality {DERIVATIVE_QUALITY}, using default 80")
+    DERIVATIVE_QUALITY = 80
+if DERIVATIVES_ENABLED and Image is None:
+    logger.warning("Image derivatives need Pillow (pip install Pillow) - viewers will load full-size images")
+    DERIVATIVES_ENABLED = False
+
+# Validate ingest queue settings (0 workers = process synchronously in the request)
+if not isinstance(INGEST_WORKERS, int) or INGEST_WORKERS < 0:
+    logger.warning(f"Invalid ingest workers {INGEST_WORKERS}, using default 2")
+    INGEST_WORKERS = 2
+if not isinstance(INGEST_QUEUE_SIZE, int) or INGEST_QUEUE_SIZE < 1:
+    logger.warning(f"Invalid ingest queue_size {INGEST_QUEUE_SIZE}, using default 100")
+    INGEST_QUEUE_SIZE = 100
+if INGEST_OVERFLOW_POLICY not in ('drop_oldest', 'drop_newest', 'block'):
+    logger.warning(f"Invalid ingest overflow_policy '{INGEST_OVERFLOW_POLICY}', using default 'drop_oldest'")
+    INGEST_OVERFLOW_POLICY = 'drop_oldest'
+
+# Validate disk writer settings (bounded queue, fsync policy none/batch/always)
+if not isinstance(DISK_WRITER_QUEUE_SIZE, int) or DISK_WRITER_QUEUE_SIZE < 1:
+    logger.warning(f"Invalid disk_writer queue_size {DISK_WRITER_QUEUE_SIZE}, using default 64")
+    DISK_WRITER_QUEUE_SIZE = 64
+if not isinstance(DISK_WRITER_BLOCK_TIMEOUT, (int, float)) or DISK_WRITER_BLOCK_TIMEOUT < 0:
+    logger.warning(f"Invalid disk_writer block_timeout_seconds {DISK_WRITER_BLOCK_TIMEOUT}, using default 5")
+    DISK_WRITER_BLOCK_TIMEOUT = 5
+if DISK_FSYNC_POLICY not in ('none', 'batch', 'always'):
+    logger.warning(f"Invalid disk_writer fsync '{DISK_FSYNC_POLICY}', using default 'none'")
+    DISK_FSYNC_POLICY = 'none'
+
+# Validate webhook pre-filter settings (scan window must reach past the first part's headers)
+if not isinstance(PREFILTER_SCAN_BYTES, int) or PREFILTER_SCAN_BYTES < 512:
+    logger.warning(f"Invalid prefilter scan_bytes {PREFILTER_SCAN_BYTES}, using default 4096")
+    PREFILTER_SCAN_BYTES = 4096
+if not isinstance(PREFILTER_EVENT_TYPES, list) or not all(isinstance(t, str) for t in PREFILTER_EVENT_TYPES):
+    logger.warning(f"Invalid prefilter event_types {PREFILTER_EVENT_TYPES}, using default ['mixedTargetDetection', 'linedetection']")
+    PREFILTER_EVENT_TYPES = ['mixedTargetDetection', 'linedetection']
+if PREFILTER_UNKNOWN_EVENTS not in ('process', 'skip'):
+    logger.warning(f"Invalid prefilter unknown_events '{PREFILTER_UNKNOWN_EVENTS}', using default 'process'")
+    PREFILTER_UNKNOWN_EVENTS = 'process'
+
+# Validate rate limiting settings (per-source token bucket, global concurrency cap)
+if not isinstance(RATE_LIMIT_RATE, (int, float)) or RATE_LIMIT_RATE <= 0:
+    logger.warning(f"Invalid rate_limit rate_per_second {RATE_LIMIT_RATE}, using default 10")
+    RATE_LIMIT_RATE = 10
+if not isinstance(RATE_LIMIT_BURST, (int, float)) or RATE_LIMIT_BURST < 1:
+    logger.warning(f"Invalid rate_limit burst {RATE_LIMIT_BURST}, using default 20")
+    RATE_LIMIT_BURST = 20
+if not isinstance(RATE_LIMIT_MAX_CONCURRENT, int) or RATE_LIMIT_MAX_CONCURRENT < 1:
+    logger.warning(f"Invalid rate_limit max_concurrent {RATE_LIMIT_MAX_CONCURRENT}, using default 32")
+    RATE_LIMIT_MAX_CONCURRENT = 32
+
+# Validate coalescing settings (one window for both event types, or one per event type; 0 = off)
+if not isinstance(COALESCE_WINDOW, dict):
+    COALESCE_WINDOW = {'body_detection': COALESCE_WINDOW, 'linedetection': COALESCE_WINDOW}
+if not all(isinstance(seconds, (int, float)) and seconds >= 0 for seconds in COALESCE_WINDOW.values()):
+    logger.warning(f"Invalid coalesce window_seconds {COALESCE_WINDOW}, coalescing disabled")
+    COALESCE_WINDOW = {}
+if not isinstance(COALESCE_DEDUP_SECONDS, (int, float)) or COALESCE_DEDUP_SECONDS < 0:
+    logger.warning(f"Invalid coalesce dedup_seconds {COALESCE_DEDUP_SECONDS}, using default 60")
+    COALESCE_DEDUP_SECONDS = 60
+
+# Validate camera registry config (individual cameras are checked when registered)
+if not isinstance(CAMERA_CONFIG, dict):
+    logger.warning(f"Invalid cameras section (expected object, got {type(CAMERA_CONFIG).__name__}), using built-in cameras")
+    CAMERA_CONFIG = {}
+
+# Validate field mapping overrides (individual rules are checked when the mapping is compiled)
+if not isinstance(BODY_MAPPING_RULES, list):
+    logger.warning(f"Invalid mappings.body_detection (expected list, got {type(BODY_MAPPING_RULES).__name__}), using built-in mapping")
+    BODY_MAPPING_RULES = []
+
 app = Flask(__name__)
 
 
-def extract_analytics_from_webhook_bytes(content_text, content_bytes):
+# ==================== METRICS ====================
+# Latency histogram bucket bounds in seconds (Prometheus convention)
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MetricsRegistry:
+    """
+    Per-stage latency histograms and counters, rendered in Prometheus text format
+    No client library: an observation is one bisect and a few additions under a lock,
+    cheap enough to leave on in production. Series are keyed by event type and the label
+    of the camera that sent the event; without a camera the built-in camera for the event
+    type is used, resolved only when /metrics is rendered
+    """
+    
+    def __init__(self, buckets, enabled=True):
+        self.buckets = buckets
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.histograms = {}  # (stage, event_type, camera label) -> [bucket counts, sum, count]
+        self.counters = {}  # (name, event_type, result, camera label) -> value
+    
+    def observe(self, stage, event_type, seconds, camera=None):
+        """Record one duration (seconds) for a pipeline stage of an event from camera"""
+        if not self.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, seconds)
+        key = (stage, event_type or 'unknown', camera.label if camera else None)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+    
+    @contextmanager
+    def timer(self, stage, event_type, camera=None):
+        """Time the enclosed block as one observation of stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, event_type, time.perf_counter() - start, camera)
+    
+    def inc(self, name, event_type, result, amount=1, camera=None):
+        """Increase counter name{camera, event_type, result} by amount"""
+        if not self.enabled or not amount:
+            return
+        key = (name, event_type or 'unknown', result, camera.label if camera else None)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+    
+    def stage_totals(self):
+        """Return {(stage, event_type): (total_seconds, count)} for reports (all cameras)"""
+        totals = {}
+        with self.lock:
+            for (stage, event_type, _), h in self.histograms.items():
+                total, count = totals.get((stage, event_type), (0.0, 0))
+                totals[(stage, event_type)] = (total + h[1], count + h[2])
+        return totals
+    
+    def reset(self):
+        """Drop every recorded series"""
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+    
+    @staticmethod
+    def _labels(event_type, camera, **extra):
+        if camera is None:
+            camera = get_camera_label(event_type) if event_type in ('body_detection', 'linedetection') else 'unknown'
+        labels = {'camera': camera, 'event_type': event_type, **extra}
+        return ','.join(f'{key}="{escape_label_value(value)}"' for key, value in labels.items())
+    
+    def render(self):
+        """Return all series in Prometheus text exposition format"""
+        with self.lock:
+            histograms = {key: (list(h[0]), h[1], h[2]) for key, h in self.histograms.items()}
+            counters = dict(self.counters)
+        lines = []
+        if histograms:
+            lines.append("# HELP hikvision_stage_duration_seconds Time spent in each webhook pipeline stage")
+            lines.append("# TYPE hikvision_stage_duration_seconds histogram")
+        for (stage, event_type, camera), (bucket_counts, total, count) in sorted(histograms.items(), key=series_order):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"hikvision_stage_duration_seconds_bucket{{{self._labels(event_type, camera, stage=stage, le=le)}}} {cumulative}")
+            lines.append(f"hikvision_stage_duration_seconds_sum{{{self._labels(event_type, camera, stage=stage)}}} {total:.6f}")
+            lines.append(f"hikvision_stage_duration_seconds_count{{{self._labels(event_type, camera, stage=stage)}}} {count}")
+        for name in sorted({key[0] for key in counters}):
+            lines.append(f"# HELP {name} {METRIC_COUNTER_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for (counter_name, event_type, result, camera), value in sorted(counters.items(), key=series_order):
+                if counter_name == name:
+                    lines.append(f"{name}{{{self._labels(event_type, camera, result=result)}}} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+METRIC_COUNTER_HELP = {
+    'hikvision_webhooks_total': "Webhooks processed, by outcome (ok, no_data, error)",
+    'hikvision_openhab_updates_total': "OpenHAB item updates, by outcome (sent, failed, unchanged, queued)",
+    'hikvision_webhooks_filtered_total': "Webhooks skipped before parsing, by reason (heartbeat, inactive, unknown_event)",
+    'hikvision_webhooks_unknown_total': "Active webhooks of an event type outside prefilter.event_types passed on to the pipeline",
+    'hikvision_events_coalesced_total': "Extracted events not published on their own, by reason (duplicate, coalesced)",
+    'hikvision_webhooks_shed_total': "Webhooks rejected before the body was read, by reason (rate_limited, overloaded, too_large)",
+    'hikvision_image_bytes_written_total': "Bytes written for event images, their derivatives, manifests and timestamp files"
+}
+
+
+def series_order(item):
+    """Sort key for (series key, value) pairs whose camera label may be None"""
+    return tuple(part or '' for part in item[0])
+
+
+def escape_label_value(value):
+    """Escape a Prometheus label value (backslash, double quote, newline)"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+METRICS = MetricsRegistry(METRICS_BUCKETS, METRICS_ENABLED)
+
+
+# ==================== MULTIPART PARSING ====================
+# One part of a multipart body: offset/length point into the original buffer
+MultipartPart = namedtuple('MultipartPart', ['name', 'content_type', 'headers', 'offset', 'length'])
+
+BOUNDARY_PATTERN = re.compile(r'boundary=(?:"([^"]+)"|([^;\s]+))', re.IGNORECASE)
+PART_NAME_PATTERN = re.compile(r';\s*name="([^"]*)"')
+# Body detection JSON starts with the ipAddress key (compact, tab- or space-indented)
+JSON_START_PATTERN = re.compile(r'\{\s*"ipAddress"')
+JSON_DECODER = json.JSONDecoder()
+
+
+def get_multipart_boundary(content_type):
+    """
+    Read the multipart boundary from a Content-Type header value
+    Returns boundary as bytes, or None if the header has no boundary parameter
+    """
+    if not content_type:
+        return None
+    match = BOUNDARY_PATTERN.search(content_type)
+    if not match:
+        return None
+    return (match.group(1) or match.group(2)).encode('latin-1')
+
+
+class MultipartIndex:
+    """
+    Index of all parts in a multipart webhook body, built in a single pass
+    Part data is exposed as memoryview slices of the original buffer (no copies)
+    """
+    
+    def __init__(self, body, boundary=None):
+        self.body = body
+        self.buffer = memoryview(body)
+        self.parts = []
+        self.by_name = {}
+        self.boundary = boundary or self._sniff_boundary()
+        if self.boundary:
+            self._scan()
+    
+    def _sniff_boundary(self):
+        """Take the boundary from the first delimiter line when no header was given"""
+        start = 0
+        while start < len(self.body) and self.body[start:start + 1] in (b'\r', b'\n', b' '):
+            start += 1
+        if self.body[start:start + 2] != b'--':
+            return None
+        line_end = self.body.find(b'\n', start)
+        if line_end == -1:
+            return None
+        boundary = bytes(self.body[start + 2:line_end]).rstrip(b'\r')
+        return boundary or None
+    
+    def _scan(self):
+        """Walk the body once, recording name/headers/offset/length of every part"""
+        body = self.body
+        delimiter = b'--' + self.boundary
+        pos = body.find(delimiter)
+        while pos != -1:
+            header_start = pos + len(delimiter)
+            if body[header_start:header_start + 2] == b'--':
+                break  # Closing delimiter
+            if body[header_start:header_start + 2] == b'\r\n':
+                header_start += 2
+            elif body[header_start:header_start + 1] == b'\n':
+                header_start += 1
+            
+            # Headers end at the first blank line (CRLF or bare LF)
+            header_end = body.find(b'\r\n\r\n', header_start)
+            lf_end = body.find(b'\n\n', header_start, header_end if header_end != -1 else len(body))
+            if lf_end != -1:
+                header_end, separator = lf_end, 2
+            elif header_end != -1:
+                separator = 4
+            else:
+                break
+            
+            headers = {}
+            for line in str(self.buffer[header_start:header_end], 'latin-1').splitlines():
+                key, sep, value = line.partition(':')
+                if sep:
+                    headers[key.strip().lower()] = value.strip()
+            data_start = header_end + separator
+            
+            # Jump straight over the payload when Content-Length is trustworthy
+            next_pos = -1
+            declared = headers.get('content-length', '')
+            if declared.isdigit():
+                candidate = data_start + int(declared)
+                for gap in (b'\r\n', b'\n', b''):
+                    if body.startswith(gap + delimiter, candidate):
+                        next_pos = candidate + len(gap)
+                        break
+            if next_pos == -1:
+                next_pos = body.find(delimiter, data_start)
+            data_end = next_pos if next_pos != -1 else len(body)
+            if body[data_end - 2:data_end] == b'\r\n':
+                data_end -= 2
+            elif body[data_end - 1:data_end] == b'\n':
+                data_end -= 1
+            
+            name_match = PART_NAME_PATTERN.search(headers.get('content-disposition', ''))
+            part = MultipartPart(
+                name=name_match.group(1) if name_match else '',
+                content_type=headers.get('content-type', '').split(';')[0].strip().lower(),
+                headers=headers,
+                offset=data_start,
+                length=max(data_end - data_start, 0)
+            )
+            self.parts.append(part)
+            self.by_name.setdefault(part.name, part)
+            pos = next_pos
+    
+    def get(self, name):
+        """Return the first part with the given form-data name, or None"""
+        return self.by_name.get(name)
+    
+    def first_of_type(self, content_type):
+        """Return the first part whose Content-Type starts with content_type, or None"""
+        for part in self.parts:
+            if part.content_type.startswith(content_type):
+                return part
+        return None
+    
+    def view(self, part):
+        """Return the part payload as a zero-copy memoryview"""
+        return self.buffer[part.offset:part.offset + part.length]
+
+
+def trim_jpeg_view(data):
+    """
+    Strip surrounding whitespace from a JPEG memoryview without copying
+    Returns the trimmed view if it has JPEG SOI/EOI markers, None otherwise
+    """
+    start, end = 0, len(data)
+    while start < end and data[start] in b' \t\r\n':
+        start += 1
+    while end > start and data[end - 1] in b' \t\r\n':
+        end -= 1
+    data = data[start:end]
+    if data[:2] != b'\xff\xd8' or data[-2:] != b'\xff\xd9':
+        return None
+    return data
+
+
+def extract_metadata_text(parts, content_bytes):
+    """
+    Decode only the non-image (JSON/XML) parts of a webhook to text
+    Falls back to decoding the whole body when it is not multipart
+    Returns metadata text string
+    """
+    texts = [str(parts.view(part), 'utf-8', 'ignore') for part in parts.parts
+             if not part.content_type.startswith('image/')]
+    if texts:
+        return '\n'.join(texts)
+    return content_bytes.decode('utf-8', errors='ignore')
+
+
+def decode_json(data):
+    """
+    Parse JSON from bytes, memoryview or str, using orjson when it is installed
+    Raises ValueError on invalid JSON (both backends' decode errors subclass it)
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    if not isinstance(data, str):
+        data = str(data, 'utf-8')
+    return json.loads(data)
+
+
+def decode_metadata_json(content_text, parts=None):
+    """
+    Locate and decode the body detection JSON object
+    Decodes the application/json multipart part directly when the body has one; otherwise
+    finds the object in the metadata text with one regex search and decodes it in place
+    Args:
+        content_text: Decoded metadata text (fallback search)
+        parts: Optional MultipartIndex of the webhook body
+    Returns parsed dict, or None if no JSON object was found
+    """
+    if parts is not None:
+        part = parts.first_of_type('application/json')
+        if part is not None:
+            try:
+                result = decode_json(parts.view(part))
+                if isinstance(result, dict):
+                    return result
+            except ValueError as e:
+                logger.debug(f"JSON part did not decode on its own ({e}), searching metadata text")
+    
+    match = JSON_START_PATTERN.search(content_text)
+    if not match:
+        return None
+    try:
+        return JSON_DECODER.raw_decode(content_text, match.start())[0]
+    except ValueError as e:
+        logger.warning(f"Failed to parse JSON with decoder: {e}")
+        return None
+
+
+# ==================== FIELD MAPPING ====================
+# Body detection payload fields -> OpenHAB items. A path names a section and an attribute
+# (event.channelName, human.jacketColor, face.age.ageGroup); the current PersonArmingTrackInfo
+# and legacy CaptureResult formats resolve the same paths, so one table serves both
+MAPPING_SECTIONS = ('event', 'face', 'human')
+SNAP_TIME_PATHS = ('human.snapTime', 'face.snapTime')
+# Detection confidence, read for every event so coalescing can keep the best one of a burst
+SCORE_PATHS = ('human.score', 'face.score')
+# Event time, read for every event so dedup only drops retransmits of the same event
+EVENT_TIME_PATHS = ('event.dateTime',)
+
+
+def transform_switch(value, rule):
+    """yes -> ON, anything else -> OFF"""
+    return 'ON' if value == 'yes' else 'OFF'
+
+
+def transform_datetime(value, rule):
+    """Reformat an ISO 8601 camera timestamp with rule['format']; unparseable values pass through"""
+    try:
+        return datetime.fromisoformat(value).strftime(rule.get('format', '%d-%m-%Y kl %H:%M'))
+    except (ValueError, TypeError) as e:
+        logger.debug(f"Error parsing timestamp '{value}': {e}")
+        return value
+
+
+def transform_map(value, rule):
+    """Translate the value through rule['values'], passing unknown values through"""
+    return str(rule['values'].get(value, value))
+
+
+MAPPING_TRANSFORMS = {
+    'text': lambda value, rule: value,
+    'switch': transform_switch,
+    'datetime': transform_datetime,
+    'map': transform_map
+}
+
+
+class AnalyticsMapping:
+    """
+    Declarative body detection mapping, compiled once at startup
+    Each rule has an item, paths (tried in order, first non-empty value wins), a transform
+    and an optional default; rules without a default are skipped when no path has a value.
+    Per event, read() looks up only the paths the rules use and updates() applies the rules
+    """
+    
+    def __init__(self, rules, always_read=()):
+        self.rules = []  # (item, paths, transform, rule)
+        self.fields = {section: [] for section in MAPPING_SECTIONS}  # section -> [(path, attribute, key, nested)]
+        self.snap_times = []  # (path, section)
+        for rule in rules:
+            compiled = self._compile(rule)
+            if compiled:
+                self.rules.append(compiled)
+        known = set()
+        for path in [path for _, paths, _, _ in self.rules for path in paths] + list(always_read):
+            if path in known:
+                continue
+            known.add(path)
+            section, _, rest = path.partition('.')
+            attribute, _, subkey = rest.partition('.')
+            if attribute == 'snapTime' and section != 'event':
+                self.snap_times.append((path, section))
+            else:
+                # Most fields are {value: x}; an explicit key (face.age.ageGroup) reads that key instead
+                self.fields[section].append((path, attribute, subkey or 'value', bool(subkey)))
+    
+    @staticmethod
+    def _compile(rule):
+        """Validate one rule; returns (item, paths, transform, rule) or None"""
+        if not isinstance(rule, dict) or not rule.get('item'):
+            logger.warning(f"Ignoring field mapping without an item: {rule}")
+            return None
+        paths = rule.get('paths', [])
+        if isinstance(paths, str):
+            paths = [paths]
+        if not paths or not all(isinstance(path, str) and path.split('.')[0] in MAPPING_SECTIONS
+                                and path.count('.') in (1, 2) for path in paths):
+            logger.warning(f"Ignoring field mapping for {rule['item']}: paths must look like "
+                           f"<{'|'.join(MAPPING_SECTIONS)}>.<attribute>[.<key>], got {paths}")
+            return None
+        transform = MAPPING_TRANSFORMS.get(rule.get('transform', 'text'))
+        if transform is None:
+            logger.warning(f"Ignoring field mapping for {rule['item']}: unknown transform '{rule.get('transform')}' "
+                           f"(choose from {', '.join(MAPPING_TRANSFORMS)})")
+            return None
+        if rule.get('transform') == 'map' and not isinstance(rule.get('values'), dict):
+            logger.warning(f"Ignoring field mapping for {rule['item']}: transform 'map' needs a values object")
+            return None
+        return (rule['item'], tuple(paths), transform, rule)
+    
+    def read(self, result):
+        """
+        Resolve the mapped paths in a decoded body detection payload
+        Returns dict of path -> string value for the paths present in this event
+        """
+        person_info = (result.get('PersonArmingTrackInfo') or {}).get('PersonInfo')
+        if person_info:
+            sections = {
+                'face': (person_info.get('Face') or {}).get('FaceCaptureResult') or {},
+                'human': (person_info.get('Human') or {}).get('HumanCaptureResult') or {}
+            }
+            # Current format carries one event time instead of a snapTime per section
+            snap_times = {name: result.get('dateTime', '') for name, section in sections.items() if section}
+        else:
+            # Legacy format: attributes are a Property list per section of CaptureResult[0]
+            capture = (result.get('CaptureResult') or [{}])[0]
+            sections, snap_times = {}, {}
+            for name, key in (('face', 'Face'), ('human', 'Human')):
+                if key in capture:
+                    sections[name] = {prop['description']: prop['value'] for prop in capture[key].get('Property', [])}
+                    snap_times[name] = capture[key].get('snapTime', '')
+        sections['event'] = result
+        
+        values = {path: snap_times[section] for path, section in self.snap_times if section in snap_times}
+        for section, fields in self.fields.items():
+            source = sections.get(section)
+            if not source:
+                continue
+            for path, attribute, key, nested in fields:
+                value = source.get(attribute)
+                if isinstance(value, dict):
+                    value = value.get(key)
+                elif nested:
+                    continue
+                if value is not None:
+                    values[path] = str(value)
+        return values
+    
+    def updates(self, analytics):
+        """
+        Apply the rules to values from read()
+        Returns list of (item_name, value) tuples
+        """
+        updates = []
+        for item, paths, transform, rule in self.rules:
+            for path in paths:
+                value = analytics.get(path)
+                if value:
+                    break
+            else:
+                if rule.get('default') is None:
+                    continue
+                value = str(rule['default'])
+            updates.append((item, transform(value, rule)))
+        return updates
+
+
+# Built-in mapping; config rules replace the rule for the same item, rules for new items are added
+DEFAULT_BODY_MAPPING = [
+    {'item': ITEM_CHANNEL_NAME, 'paths': ['event.channelName'], 'default': 'unknown'},
+    {'item': ITEM_EVENT_TYPE, 'paths': ['event.eventType'], 'default': 'unknown'},
+    {'item': ITEM_TIMESTAMP, 'paths': ['human.snapTime', 'face.snapTime'], 'transform': 'datetime', 'format': '%d-%m-%Y kl %H:%M'},
+    {'item': ITEM_JACKET_COLOR, 'paths': ['human.jacketColor'], 'default': 'unknown'},
+    {'item': ITEM_TROUSERS_COLOR, 'paths': ['human.trousersColor'], 'default': 'unknown'},
+    {'item': ITEM_JACKET_TYPE, 'paths': ['human.jacketType'], 'default': 'unknown'},
+    {'item': ITEM_TROUSERS_TYPE, 'paths': ['human.trousersType'], 'default': 'unknown'},
+    {'item': ITEM_HAS_HAT, 'paths': ['human.hat', 'face.hat'], 'transform': 'switch', 'default': 'no'},
+    {'item': ITEM_HAS_GLASSES, 'paths': ['human.glass', 'face.glass'], 'transform': 'switch', 'default': 'no'},
+    {'item': ITEM_HAS_BAG, 'paths': ['human.bag'], 'transform': 'switch', 'default': 'no'},
+    {'item': ITEM_HAS_THINGS, 'paths': ['human.things'], 'transform': 'switch', 'default': 'no'},
+    {'item': ITEM_HAS_MASK, 'paths': ['human.mask', 'face.mask'], 'transform': 'switch', 'default': 'no'},
+    {'item': ITEM_RIDE, 'paths': ['human.ride'], 'transform': 'switch', 'default': 'no'},
+    {'item': ITEM_GENDER, 'paths': ['human.gender', 'face.gender'], 'default': 'unknown'},
+    {'item': ITEM_AGE_GROUP, 'paths': ['human.ageGroup', 'face.ageGroup', 'face.age.ageGroup'], 'default': 'unknown'},
+    {'item': ITEM_HAIR_STYLE, 'paths': ['human.hairStyle'], 'default': 'unknown'},
+    {'item': ITEM_FACE_EXPRESSION, 'paths': ['face.faceExpression'], 'default': 'unknown'},
+    {'item': ITEM_AGE, 'paths': ['face.age'], 'default': '0'},
+    {'item': ITEM_MOTION_DIRECTION, 'paths': ['human.direction'], 'default': 'unknown'},
+    {'item': ITEM_FACE_SCORE, 'paths': ['face.score'], 'default': '0'},
+    {'item': ITEM_HUMAN_SCORE, 'paths': ['human.score'], 'default': '0'}
+]
+
+
+def merge_mapping_rules(defaults, overrides):
+    """Return defaults with each override replacing the rule for its item (new items appended)"""
+    merged = {rule['item']: rule for rule in defaults}
+    extra = []
+    for rule in overrides:
+        if isinstance(rule, dict) and rule.get('item'):
+            merged[rule['item']] = rule
+        else:
+            extra.append(rule)  # Invalid, reported by AnalyticsMapping
+    return list(merged.values()) + extra
+
+
+BODY_MAPPING = AnalyticsMapping(merge_mapping_rules(DEFAULT_BODY_MAPPING, BODY_MAPPING_RULES), SNAP_TIME_PATHS + SCORE_PATHS + EVENT_TIME_PATHS)
+
+
+def extract_analytics_from_webhook_bytes(content_text, content_bytes, parts=None, camera=None):
     """
     Extract Face and Human analytics AND images from webhook multipart content
     Args:
         content_text: Webhook content as text string (for JSON parsing)
         content_bytes: Webhook content as bytes (for image extraction)
+        parts: Optional MultipartIndex of content_bytes (built if not given)
+        camera: Camera that sent the event (labels the timing metrics)
     Returns tuple: (analytics_dict, background_image_bytes)
     """
+    start = time.perf_counter()
     try:
-        # Find the JSON section by looking for the start of mixedTargetDetection
-        json_start = content_text.find('{"ipAddress"') 
-        if json_start == -1:
-            json_start = content_text.find('{\n\t"ipAddress"')
-        if json_start == -1:
-            json_start = content_text.find('{\n        "ipAddress"')
+        # Jump to the JSON part (or search the metadata text once) and decode only that slice
+        result = decode_metadata_json(content_text, parts)
         
-        if json_start != -1:
-            # Find the end of this JSON object using json.JSONDecoder
-            # This is more robust than manual brace counting (handles escaped braces in strings)
-            try:
-                from json import JSONDecoder
-                decoder = JSONDecoder()
-                result, json_end_idx = decoder.raw_decode(content_text, json_start)
-                json_str = content_text[json_start:json_start + json_end_idx]
-            except (json.JSONDecodeError, ValueError) as json_err:
-                logger.warning(f"Failed to parse JSON with decoder: {json_err}")
-                # Fallback to manual brace counting (less robust but backward compatible)
-                brace_count = 0
-                json_end = -1
-                in_string = False
-                escape_next = False
-                for i in range(json_start, len(content_text)):
-                    char = content_text[i]
-                    if escape_next:
-                        escape_next = False
-                        continue
-                    if char == '\\':
-                        escape_next = True
-                        continue
-                    if char == '"' and not in_string:
-                        in_string = True
-                    elif char == '"' and in_string:
-                        in_string = False
-                    elif not in_string:
-                        if char == '{':
-                            brace_count += 1
-                        elif char == '}':
-                            brace_count -= 1
-                            if brace_count == 0:
-                                json_end = i + 1
-                                break
-                
-                if json_end == -1:
-                    logger.warning("Could not find end of JSON object")
-                    return None, None
-                
-                json_str = content_text[json_start:json_end]
-                try:
-                    result = json.loads(json_str)
-                except json.JSONDecodeError as e:
-                    logger.error(f"Failed to parse extracted JSON: {e}")
-                    return None, None
-            
-            # Analytics extraction (OUTSIDE the try/except block - runs for both success and fallback)
-            analytics = {}
-            
-            # Extract camera/event info from top level
-            analytics['channelName'] = result.get('channelName', 'unknown')
-            analytics['eventType'] = result.get('eventType', 'unknown')
-            
-            # Try NEW FORMAT first: PersonArmingTrackInfo → PersonInfo
-            person_arming_info = result.get('PersonArmingTrackInfo', {})
-            person_info = person_arming_info.get('PersonInfo', {})
-            
-            if person_info:
-                logger.debug("Detected PersonArmingTrack format (new Camera 1 format)")
-                logger.debug(f"PersonInfo keys: {list(person_info.keys())}")
-                
-                # Extract Face analytics from FaceCaptureResult
-                face_info = person_info.get('Face', {})
-                face_capture = face_info.get('FaceCaptureResult', {})
-                
-                logger.debug(f"Has Face: {bool(face_info)}, Has FaceCaptureResult: {bool(face_capture)}")
-                
-                if face_capture:
-                    # Extract ALL face analytics fields dynamically
-                    for key, value in face_capture.items():
-                        # Skip image data and position rectangles
-                        if key in ['FaceImage', 'FaceBackgroundImage', 'Rect', 'FacePictureRect']:
-                            continue
-                        
-                        # Handle nested dict values (most fields have {value: x})
-                        if isinstance(value, dict):
-                            if 'value' in value:
-                                analytics[f'face_{key}'] = str(value['value'])
-                            # Also extract ageGroup if present
-                            if key == 'age' and 'ageGroup' in value:
-                                analytics['face_ageGroup'] = value['ageGroup']
-                        else:
-                            analytics[f'face_{key}'] = str(value)
-                    
-                    # Use dateTime from top level as snapTime
-                    analytics['face_snapTime'] = result.get('dateTime', '')
-                
-                # Extract Human analytics from HumanCaptureResult
-                human_info = person_info.get('Human', {})
-                human_capture = human_info.get('HumanCaptureResult', {})
-                
-                if human_capture:
-                    # Extract ALL human analytics fields dynamically
-                    for key, value in human_capture.items():
-                        # Skip image data and position rectangles
-                        if key in ['HumanImage', 'HumanBackgroundImage', 'Rect']:
-                            continue
-                        
-                        # Handle nested dict values (most fields have {value: x})
-                        if isinstance(value, dict):
-                            if 'value' in value:
-                                analytics[f'human_{key}'] = str(value['value'])
-                        else:
-                            analytics[f'human_{key}'] = str(value)
-                    
-                    # Use dateTime from top level as snapTime
-                    analytics['human_snapTime'] = result.get('dateTime', '')
-            
-            else:
-                # FALLBACK: OLD FORMAT - Extract Face and Human analytics from CaptureResult[0]
-                capture_results = result.get('CaptureResult', [])
-                if capture_results and len(capture_results) > 0:
-                    logger.debug("Detected CaptureResult format (old format)")
-                    capture = capture_results[0]
-                    
-                    # Extract Face analytics
-                    if 'Face' in capture:
-                        face = capture['Face']
-                        for prop in face.get('Property', []):
-                            analytics['face_' + prop['description']] = prop['value']
-                        analytics['face_snapTime'] = face.get('snapTime', '')
-                    
-                    # Extract Human analytics
-                    if 'Human' in capture:
-                        human = capture['Human']
-                        for prop in human.get('Property', []):
-                            analytics['human_' + prop['description']] = prop['value']
-                        analytics['human_snapTime'] = human.get('snapTime', '')
-            
-            logger.debug(f"Parsed JSON successfully, found {len(analytics)} analytics keys")
-            logger.debug(f"Analytics keys: {list(analytics.keys())}")
+        if result is not None:
+            # Resolve only the mapped paths (same paths for both firmware formats)
+            analytics = BODY_MAPPING.read(result)
+            logger.debug(f"Parsed JSON successfully, resolved {len(analytics)} mapped fields: {list(analytics.keys())}")
             
             # Extract image from webhook bytes (tries high-res, falls back to cropped)
-            background_image = extract_image_with_fallback(content_bytes)
+            image_start = time.perf_counter()
+            METRICS.observe('extract_json', 'body_detection', image_start - start, camera)
+            background_image = extract_image_with_fallback(content_bytes, parts)
+            METRICS.observe('extract_image', 'body_detection', time.perf_counter() - image_start, camera)
             
-            if len(analytics) > 2:  # More than just channel/event
+            if any(not path.startswith('event.') for path in analytics):  # More than just channel/event
                 logger.debug(f"Returning {len(analytics)} analytics fields")
                 return analytics, background_image
             else:
-                logger.debug(f"Only {len(analytics)} analytics fields (need > 2), skipping")
+                logger.debug("No face or human analytics in payload, skipping")
         
         logger.warning("Could not find valid JSON in webhook content")
         return None, None
@@ -291,51 +904,30 @@ def extract_analytics_from_webhook_bytes(content_text, content_bytes):
         return None, None
 
 
-def extract_image_from_webhook_bytes(content_bytes, image_name):
+def extract_image_from_webhook_bytes(content_bytes, image_name, parts=None):
     """
     Extract specified image from webhook multipart data
     Args:
         content_bytes: Raw webhook content as bytes
         image_name: Name of the image field (e.g., 'humanBackgroundImage' or 'humanImage')
-    Returns JPEG bytes if found, None otherwise
+        parts: Optional MultipartIndex of content_bytes (built if not given)
+    Returns JPEG data as a memoryview if found, None otherwise
     """
     try:
-        # Find image section in bytes
-        marker_pattern = f'Content-Disposition: form-data; name="{image_name}"'.encode()
-        marker_idx = content_bytes.find(marker_pattern)
+        if parts is None:
+            parts = MultipartIndex(content_bytes)
         
-        if marker_idx == -1:
+        part = parts.get(image_name)
+        if part is None:
             logger.debug(f"{image_name} section not found in webhook")
             return None
-        
-        # Find Content-Type: image/jpeg after the marker
-        jpeg_marker_start = content_bytes.find(b'Content-Type: image/jpeg', marker_idx)
-        if jpeg_marker_start == -1:
-            return None
-        
-        # JPEG data starts after headers (skip to next blank line)
-        blank_line = content_bytes.find(b'\r\n\r\n', jpeg_marker_start)
-        if blank_line == -1:
-            blank_line = content_bytes.find(b'\n\n', jpeg_marker_start)
-        if blank_line == -1:
+        if part.content_type != 'image/jpeg':
             return None
         
-        jpeg_start = blank_line + 4 if content_bytes[blank_line:blank_line+4] == b'\r\n\r\n' else blank_line + 2
-        
-        # Find the end of JPEG data (next boundary marker)
-        boundary_end = content_bytes.find(b'--boundary', jpeg_start)
-        if boundary_end == -1:
-            boundary_end = len(content_bytes)
-        
-        # Extract JPEG data (trim whitespace)
-        jpeg_data = content_bytes[jpeg_start:boundary_end].strip()
-        
-        # Verify it's actually JPEG by checking for JPEG markers
-        if not jpeg_data.startswith(b'\xff\xd8'):  # JPEG SOI (Start of Image) marker
-            logger.warning(f"Extracted {image_name} doesn't start with JPEG SOI marker")
-            return None
-        if not jpeg_data.endswith(b'\xff\xd9'):  # JPEG EOI (End of Image) marker
-            logger.warning(f"Extracted {image_name} doesn't end with JPEG EOI marker (incomplete image)")
+        # Verify it's actually JPEG by checking for SOI (0xFFD8) and EOI (0xFFD9) markers
+        jpeg_data = trim_jpeg_view(parts.view(part))
+        if jpeg_data is None:
+            logger.warning(f"Extracted {image_name} is missing JPEG SOI/EOI markers (incomplete image)")
             return None
         
         logger.info(f"✅ Extracted {image_name} from webhook: {len(jpeg_data)} bytes")
@@ -346,31 +938,35 @@ def extract_image_from_webhook_bytes(content_bytes, image_name):
         return None
 
 
-def extract_image_with_fallback(content_bytes):
+def extract_image_with_fallback(content_bytes, parts=None):
     """
     Extract image from webhook with fallback logic
     Priority: high-res full scene images first, then cropped images
-    Returns JPEG bytes if found, None otherwise
+    The body is indexed once, so trying several image names costs no extra scans
+    Returns JPEG data as a memoryview if found, None otherwise
     """
+    if parts is None:
+        parts = MultipartIndex(content_bytes)
+    
     # Try high-res full scene images (both naming conventions)
-    jpeg_data = extract_image_from_webhook_bytes(content_bytes, 'humanBackgroundImage')
+    jpeg_data = extract_image_from_webhook_bytes(content_bytes, 'humanBackgroundImage', parts)
     if jpeg_data:
         logger.info("🎯 Using high-res full scene image (humanBackgroundImage)")
         return jpeg_data
     
-    jpeg_data = extract_image_from_webhook_bytes(content_bytes, 'faceBackgroundImage')
+    jpeg_data = extract_image_from_webhook_bytes(content_bytes, 'faceBackgroundImage', parts)
     if jpeg_data:
         logger.info("🎯 Using high-res full scene image (faceBackgroundImage)")
         return jpeg_data
     
     # Fallback to cropped images
     logger.warning("⚠️ High-res images not found, trying cropped images as fallback")
-    jpeg_data = extract_image_from_webhook_bytes(content_bytes, 'humanImage')
+    jpeg_data = extract_image_from_webhook_bytes(content_bytes, 'humanImage', parts)
     if jpeg_data:
         logger.info("🎯 Using cropped person image (humanImage) as fallback")
         return jpeg_data
     
-    jpeg_data = extract_image_from_webhook_bytes(content_bytes, 'faceImage')
+    jpeg_data = extract_image_from_webhook_bytes(content_bytes, 'faceImage', parts)
     if jpeg_data:
         logger.info("🎯 Using cropped face image (faceImage) as fallback")
         return jpeg_data
@@ -380,100 +976,1309 @@ def extract_image_with_fallback(content_bytes):
     return None
 
 
-def cleanup_old_webhooks():
+# ==================== CAPTURE RETENTION ====================
+# Raw webhook captures (capture_format "files") are recorded in webhook_index.jsonl next
+# to them, the same flock-shared append-only index the line crossing images use: every
+# worker process sees the captures all the others saved, so max_saved_files/max_saved_mb
+# hold for the directory, and each save costs one index append instead of a glob and a
+# stat of every file. Filenames carry a sequence number, so captures within the same
+# second never collide.
+CAPTURE_SEQUENCE_PATTERN = re.compile(r'^webhook_\d{8}_\d{6}_(\d+)\.txt$')
+_retention_lock = threading.Lock()
+_retention_pid = None
+_capture_retention = None
+
+
+class CaptureRetention:
+    """
+    Saved captures in one directory, evicted by count and total bytes across all processes
+    Existing captures are adopted into the index the first time it is created
+    """
+    
+    def __init__(self, directory, max_files, max_bytes):
+        self.directory = directory
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.index = ImageIndex(directory, 'webhook', max_files, max_bytes, float('inf'), extension='.txt')
+        # Continue the sequence numbers of the captures already indexed
+        self.index.recent(0)
+        self.sequence = max((int(match.group(1)) for match in
+                             (CAPTURE_SEQUENCE_PATTERN.match(entry['file']) for entry in self.index.ring) if match),
+                            default=0)
+    
+    def save(self, content_bytes, event_type=None, camera=None):
+        """
+        Write one capture under a new sequence-numbered name, then apply retention
+        Returns the path written
+        """
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        with METRICS.timer('log_write', event_type, camera):
+            while True:
+                with self.lock:
+                    self.sequence += 1
+                    filename = f'webhook_{timestamp}_{self.sequence:06d}.txt'
+                try:
+                    # Exclusive create: another worker process may have taken this number
+                    with open(os.path.join(self.directory, filename), 'xb') as f:
+                        f.write(content_bytes)
+                        if DISK_FSYNC_POLICY == 'always':
+                            f.flush()
+                            os.fsync(f.fileno())
+                    break
+                except FileExistsError:
+                    continue
+        with METRICS.timer('cleanup', event_type, camera):
+            self.index.add(filename, len(content_bytes), event_type=event_type)
+        return os.path.join(self.directory, filename)
+    
+    def status(self):
+        """Index size for /health (as of this process's last save)"""
+        index = self.index.status()
+        return {"files": index['images'], "bytes": index['bytes'],
+                "max_files": self.max_files, "max_bytes": self.max_bytes}
+
+
+def get_capture_retention():
+    """Return this process's handle on the capture index for WEBHOOK_DIR, created on first use"""
+    global _retention_pid, _capture_retention
+    if _retention_pid == os.getpid() and _capture_retention.directory == WEBHOOK_DIR:
+        return _capture_retention
+    with _retention_lock:
+        if _retention_pid != os.getpid() or _capture_retention.directory != WEBHOOK_DIR:
+            _capture_retention = CaptureRetention(WEBHOOK_DIR, MAX_WEBHOOK_FILES, int(MAX_WEBHOOK_MB * 1024 * 1024))
+            _retention_pid = os.getpid()
+        return _capture_retention
+
+
+# ==================== CAPTURE ARCHIVE ====================
+# Raw webhooks are appended byte-exact to rotating compressed segment files, one per
+# process at a time (captures_<time>_<pid>_<seq>.hcap.gz or .hcap.zst). A record is a
+# JSON header line (receive time, source, Content-Type, event type, body length)
+# followed by the original body, compressed as its own gzip members / zstd frame, so a
+# segment also decompresses in one go with gunzip/zstd. A .idx sidecar (one JSON line per record:
+# offset and compressed size plus the header fields) lets readers list and filter
+# captures without decompressing them and jump straight to any one of them.
+CaptureRecord = namedtuple('CaptureRecord', 'segment offset received_at remote_addr content_type event_type body')
+CAPTURE_SEGMENT_PATTERN = re.compile(r'^captures_(\d{8}_\d{6})_(\d+)_(\d+)\.hcap\.(gz|zst)$')
+_archive_lock = threading.Lock()
+_archive_pid = None
+_capture_archive = None
+
+
+def gzip_member(chunks, level=1):
+    """Compress chunks into one gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return b''.join([compressor.compress(chunk) for chunk in chunks] + [compressor.flush()])
+
+
+def gzip_record(header, content_bytes, content_type=None):
+    """
+    Compress one record as consecutive gzip members (decompressors join them): header and
+    text parts at level 1, image parts stored at level 0 since JPEG data does not shrink
+    """
+    if isinstance(content_bytes, memoryview):
+        content_bytes = content_bytes.tobytes()  # The part scan needs bytes.find
+    body = memoryview(content_bytes)
+    members, chunks, text_start = [], [header], 0
+    for part in MultipartIndex(content_bytes, get_multipart_boundary(content_type)).parts:
+        if part.content_type.startswith('image/'):
+            chunks.append(body[text_start:part.offset])
+            members += [gzip_member(chunks), gzip_member([body[part.offset:part.offset + part.length]], 0)]
+            chunks, text_start = [], part.offset + part.length
+    chunks.append(body[text_start:])
+    members.append(gzip_member(chunks))
+    return b''.join(members)
+
+
+def zstd_frame(chunks):
+    """Compress chunks into one zstd frame"""
+    compressor = zstandard.ZstdCompressor(level=3).compressobj()
+    return b''.join([compressor.compress(chunk) for chunk in chunks] + [compressor.flush()])
+
+
+def open_capture_stream(path):
+    """Open a whole segment as one decompressed stream (sequential reads without the .idx)"""
+    if path.endswith('.zst'):
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True,
+                                                                            closefd=True))
+    return gzip.open(path, 'rb')
+
+
+def decompress_capture(path, data):
+    """Decompress one record's member/frame read from a segment"""
+    if path.endswith('.zst'):
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return gzip.decompress(data)
+
+
+class CaptureArchive:
     """
-    Remove old webhook files, keeping only the most recent MAX_WEBHOOK_FILES
+    This process's writer for capture segments in one directory
+    Rotates to a new segment past segment_bytes and, on each rotation, deletes the oldest
+    closed segments (of every process) while the directory holds more than max_bytes
     """
+    
+    def __init__(self, directory, compression='gzip', segment_bytes=8 * 1024 * 1024, max_bytes=100 * 1024 * 1024):
+        if compression == 'zstd' and zstandard is None:
+            logger.warning("capture_compression 'zstd' needs the zstandard package (pip install zstandard), using 'gzip'")
+            compression = 'gzip'
+        self.directory = directory
+        self.compression = compression
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.segment = None  # Open segment file, created on the first append
+        self.index = None
+        self.sequence = 0
+        self.records = 0
+    
+    def _open_segment(self):
+        """Start a new segment (exclusive create), after applying retention to the old ones"""
+        self._apply_retention()
+        suffix = '.hcap.zst' if self.compression == 'zstd' else '.hcap.gz'
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        while True:
+            self.sequence += 1
+            path = os.path.join(self.directory, f"captures_{stamp}_{os.getpid()}_{self.sequence:04d}{suffix}")
+            try:
+                self.segment = open(path, 'xb')
+                break
+            except FileExistsError:
+                continue
+        self.index = open(path + '.idx', 'ab')
+        logger.info(f"Started capture segment {os.path.basename(path)}")
+    
+    def _close_segment(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.index.close()
+            self.segment = self.index = None
+    
+    def _apply_retention(self):
+        """
+        Delete the oldest segments (and their .idx) while the directory is over max_bytes
+        The newest segment of every other live process is still being appended to and is
+        kept (deleting it would leave that worker writing to an unlinked file)
+        """
+        segments = []
+        newest = {}  # pid -> (stamp, sequence) of its newest segment
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                match = CAPTURE_SEGMENT_PATTERN.match(entry.name)
+                if match:
+                    size = entry.stat().st_size
+                    try:
+                        size += os.stat(entry.path + '.idx').st_size
+                    except FileNotFoundError:
+                        pass
+                    stamp, pid, sequence = match.group(1), int(match.group(2)), int(match.group(3))
+                    segments.append(((stamp, sequence), pid, entry.path, size))
+                    newest[pid] = max(newest.get(pid, (stamp, sequence)), (stamp, sequence))
+        segments.sort()
+        total = sum(size for _, _, _, size in segments)
+        for order, pid, path, size in segments:
+            if total <= self.max_bytes:
+                break
+            if pid != os.getpid() and newest[pid] == order and process_alive(pid):
+                continue
+            for name in (path, path + '.idx'):
+                try:
+                    os.remove(name)
+                except FileNotFoundError:
+                    pass  # Already removed by another process
+            total -= size
+            logger.debug(f"Deleted old capture segment: {os.path.basename(path)}")
+    
+    def append(self, content_bytes, content_type=None, remote_addr=None, event_type=None, received_at=None):
+        """
+        Append one capture (original bytes, no decoding)
+        Returns (segment path, offset) of the record
+        """
+        header = {"received": round(received_at or time.time(), 3), "remote_addr": remote_addr,
+                  "content_type": content_type, "event_type": event_type, "length": len(content_bytes)}
+        header_line = json.dumps(header).encode() + b'\n'
+        if self.compression == 'zstd':
+            data = zstd_frame((header_line, memoryview(content_bytes)))
+        else:
+            data = gzip_record(header_line, content_bytes, content_type)
+        with self.lock:
+            if self.segment is not None and self.segment.tell() >= self.segment_bytes:
+                self._close_segment()
+            if self.segment is None:
+                self._open_segment()
+            offset = self.segment.tell()
+            self.segment.write(data)
+            self.segment.flush()
+            if DISK_FSYNC_POLICY == 'always':
+                os.fsync(self.segment.fileno())
+            # Index line only after the record is complete: readers never see a partial record
+            self.index.write((json.dumps({"offset": offset, "size": len(data), **header}) + '\n').encode())
+            self.index.flush()
+            self.records += 1
+            return self.segment.name, offset
+    
+    def status(self):
+        """Open segment and record count for /health"""
+        with self.lock:
+            return {"format": "archive", "compression": self.compression, "records": self.records,
+                    "segment": os.path.basename(self.segment.name) if self.segment else None,
+                    "segment_bytes": self.segment.tell() if self.segment else 0, "max_bytes": self.max_bytes}
+
+
+def process_alive(pid):
+    """True if a process with this PID exists (it may belong to another user)"""
     try:
-        webhook_files = glob.glob(f"{WEBHOOK_DIR}/webhook_*.txt")
-        if len(webhook_files) > MAX_WEBHOOK_FILES:
-            # Sort by modification time (oldest first)
-            webhook_files.sort(key=os.path.getmtime)
-            # Delete oldest files
-            files_to_delete = webhook_files[:-MAX_WEBHOOK_FILES]
-            for old_file in files_to_delete:
-                os.remove(old_file)
-                logger.debug(f"Deleted old webhook file: {os.path.basename(old_file)}")
-            logger.info(f"Cleaned up {len(files_to_delete)} old webhook files")
-    except Exception as e:
-        logger.error(f"Error cleaning up webhook files: {e}")
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
 
 
-def save_detection_image(jpeg_data, timestamp_str):
+def get_capture_archive():
+    """Return this process's capture archive for WEBHOOK_DIR, created on first use"""
+    global _archive_pid, _capture_archive
+    if _archive_pid == os.getpid() and _capture_archive.directory == WEBHOOK_DIR:
+        return _capture_archive
+    with _archive_lock:
+        if _archive_pid != os.getpid() or _capture_archive.directory != WEBHOOK_DIR:
+            _capture_archive = CaptureArchive(WEBHOOK_DIR, CAPTURE_COMPRESSION, int(CAPTURE_SEGMENT_MB * 1024 * 1024),
+                                              int(MAX_WEBHOOK_MB * 1024 * 1024))
+            _archive_pid = os.getpid()
+        return _capture_archive
+
+
+def read_capture_index(path):
+    """Return the index entries of one segment, or None if its .idx is missing"""
+    try:
+        with open(path + '.idx', 'rb') as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return None
+    entries = []
+    for line in lines:
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            break  # Torn last line from a crash
+    return entries
+
+
+def read_capture(path, offset, size):
+    """Read one record straight from its offset (size = compressed length from the .idx)"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = decompress_capture(path, f.read(size))
+    header, _, body = data.partition(b'\n')
+    header = json.loads(header)
+    return CaptureRecord(path, offset, header['received'], header['remote_addr'], header['content_type'],
+                         header['event_type'], body)
+
+
+def scan_capture_segment(path):
+    """Yield the records of a segment without its .idx (sequential decompress, stops at a torn record)"""
+    with open_capture_stream(path) as stream:
+        position = 0
+        while True:
+            try:
+                line = stream.readline()
+                if not line:
+                    return
+                header = json.loads(line)
+                body = stream.read(header['length'])
+            except (EOFError, ValueError, zlib.error, OSError):
+                return
+            if len(body) < header['length']:
+                return
+            yield CaptureRecord(path, position, header['received'], header['remote_addr'], header['content_type'],
+                                header['event_type'], body)
+            position += 1
+
+
+def iter_capture_archive(directory, event_type=None):
     """
-    Save detection image and timestamp to HTML folder
+    Yield CaptureRecord for every archived capture in a directory, oldest segment first
     Args:
-        jpeg_data: JPEG image bytes
-        timestamp_str: Detection timestamp string (HH:MM:SS format)
+        directory: Capture directory (webhook_dir)
+        event_type: Only this event type (filtered from the .idx, skipped records are never decompressed)
+    """
+    names = sorted(name for name in os.listdir(directory) if CAPTURE_SEGMENT_PATTERN.match(name))
+    for name in names:
+        path = os.path.join(directory, name)
+        entries = read_capture_index(path)
+        if entries is None:
+            # No index (deleted or copied without it): offsets are record numbers instead
+            for record in scan_capture_segment(path):
+                if event_type is None or record.event_type == event_type:
+                    yield record
+            continue
+        with open(path, 'rb') as f:
+            for entry in entries:
+                if event_type is not None and entry.get('event_type') != event_type:
+                    continue
+                f.seek(entry['offset'])
+                data = f.read(entry['size'])
+                if len(data) < entry['size']:
+                    break
+                body = decompress_capture(path, data).partition(b'\n')[2]
+                yield CaptureRecord(path, entry['offset'], entry['received'], entry['remote_addr'],
+                                    entry['content_type'], entry['event_type'], body)
+
+
+# ==================== IMAGE STORE ====================
+# Event images are written once, straight from the request buffer slice, into a temp
+# file in the output directory. Every published name (timestamped image, "latest"
+# alias) is a hard link to or a rename of that one inode, never a second copy.
+
+def write_temp_file(directory, data, mode=0o664):
+    """
+    Write bytes-like data to a new temp file in directory (unbuffered, no intermediate copies)
+    Args:
+        directory: Target directory (same filesystem as the final names, so links/renames are atomic)
+        data: bytes or memoryview slice of the request body
+        mode: File permissions, set on the open descriptor
+    Returns the temp file path
     """
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp')
     try:
-        # Save image atomically (temp file + rename)
-        image_path = os.path.join(HTML_OUTPUT_PATH, IMAGE_FILENAME)
-        with tempfile.NamedTemporaryFile(mode='wb', dir=HTML_OUTPUT_PATH, delete=False) as tmp:
-            tmp.write(jpeg_data)
-            temp_path = tmp.name
-        os.rename(temp_path, image_path)
-        os.chmod(image_path, 0o644)  # Make readable by web server
-        logger.info(f"✅ Saved detection image: {image_path} ({len(jpeg_data)} bytes)")
-        
-        # Update OpenHAB item with filename
-        update_openhab_item(ITEM_IMAGE_FILENAME, IMAGE_FILENAME)
-        
-        # Note: Removed redundant OpenHAB Image item upload (was causing 1-3 second delay)
-        # HTML viewer loads images directly from disk, so upload is not needed
-        
-        # Save timestamp atomically (just time part for HTML display)
-        time_only = timestamp_str.split()[1] if ' ' in timestamp_str else timestamp_str
-        timestamp_path = os.path.join(HTML_OUTPUT_PATH, TIMESTAMP_FILENAME)
-        with tempfile.NamedTemporaryFile(mode='w', dir=HTML_OUTPUT_PATH, delete=False) as tmp:
-            tmp.write(time_only)
-            temp_path = tmp.name
-        os.rename(temp_path, timestamp_path)
-        os.chmod(timestamp_path, 0o644)  # Make readable by web server
-        logger.debug(f"Saved timestamp: {timestamp_path}")
-        
-    except Exception as e:
-        logger.error(f"Error saving detection image: {e}")
+        os.fchmod(fd, mode)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        if DISK_FSYNC_POLICY == 'always':
+            os.fsync(fd)
+    except BaseException:
+        os.close(fd)
+        os.unlink(temp_path)
+        raise
+    os.close(fd)
+    return temp_path
 
 
-def update_openhab_item(item_name, value):
-    """Update a single OpenHAB item via REST API"""
+def publish_files(directory, files, mode=0o664):
+    """
+    Atomically replace several small files for one event (image, timestamp text)
+    All files are written first, then renamed in the given order, so a viewer polling the
+    last one (the timestamp) never sees it before the files listed ahead of it
+    Args:
+        directory: Output directory
+        files: List of (filename, bytes-like data) in publish order
+        mode: File permissions
+    Returns number of bytes written
+    """
+    temps = []
     try:
-        url = f"{OPENHAB_URL}/rest/items/{item_name}/state"
-        headers = {
-            "Content-Type": "text/plain",
-            "Accept": "application/json"
-        }
-        response = requests.put(url, data=str(value), headers=headers, timeout=OPENHAB_TIMEOUT)
-        
-        if response.status_code in [200, 201, 202]:
-            logger.debug(f"✓ Updated {item_name} = {value}")
-            return True
-        else:
-            logger.warning(f"Failed to update {item_name}: {response.status_code}")
-            return False
-    except Exception as e:
-        logger.error(f"Error updating {item_name}: {e}")
-        return False
+        for filename, data in files:
+            temps.append((write_temp_file(directory, data, mode), filename))
+    except BaseException:
+        for temp_path, _ in temps:
+            os.unlink(temp_path)
+        raise
+    for temp_path, filename in temps:
+        os.replace(temp_path, os.path.join(directory, filename))
+    if DISK_FSYNC_POLICY == 'always':
+        sync_directory(directory)
+    return sum(len(data) for _, data in files)
+
 
+def sync_directory(directory):
+    """fsync a directory so the names created or replaced in it survive a power cut"""
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+
+# ==================== IMAGE DERIVATIVES ====================
+# Each saved event image also gets downscaled copies (e.g. thumb 320 px, medium 960 px
+# wide) so phones and wall tablets load tens of KB instead of the full background image.
+# Derivatives are built on the disk writer thread and their names never change content:
+# line crossings use the unique timestamped image name, the overwritten body detection
+# image a hash of its source. A small <latest>_manifest.json tells the viewers which
+# derivatives belong to the current image; it is published just before the timestamp.
 
-def extract_linedetection_from_xml(content_text, content_bytes):
+def build_derivatives(jpeg_data, stem, content_hash=False):
     """
-    Extract line crossing detection data from XML webhook content (Camera 2)
+    Downscale an event image to each configured width (JPEG draft mode decodes at reduced scale)
     Args:
-        content_text: Webhook content as text string (for XML parsing)
-        content_bytes: Webhook content as bytes (for image extraction)
-    Returns tuple: (linedetection_dict, jpeg_image_bytes)
+        jpeg_data: Full-size JPEG bytes
+        stem: Name stem, derivatives are <stem>_<size>.jpg
+        content_hash: Name them <stem>_<size>_<hash>.jpg instead (for images that are overwritten)
+    Returns tuple: (files [(filename, bytes)], {size: {file, width, height, bytes}}), both empty
+    when derivatives are off or the image cannot be decoded
     """
+    if not DERIVATIVES_ENABLED:
+        return [], {}
+    suffix = f"_{hashlib.sha1(jpeg_data).hexdigest()[:12]}" if content_hash else ''
+    files, derivatives = [], {}
     try:
-        # Find XML section (starts after boundary)
-        xml_start = content_text.find('<?xml version')
-        if xml_start == -1:
-            logger.warning("No XML content found in webhook")
-            return None, None
-        
-        # Find end of XML (before next boundary or image data)
-        # Look for the closing </EventNotificationAlert> tag
+        with Image.open(io.BytesIO(jpeg_data)) as source:
+            widths = {size: width for size, width in DERIVATIVE_SIZES.items() if width < source.width}
+            if not widths:
+                return [], {}  # Never upscale: the original is already small enough
+            largest = max(widths.values())
+            source.draft('RGB', (largest, source.height * largest // source.width))
+            image = source.convert('RGB')
+        # Largest first, each one resampled from the previous
+        for size, width in sorted(widths.items(), key=lambda item: -item[1]):
+            image.thumbnail((width, image.height))
+            out = io.BytesIO()
+            image.save(out, 'JPEG', quality=DERIVATIVE_QUALITY)
+            filename = f"{stem}_{size}{suffix}.jpg"
+            files.append((filename, out.getvalue()))
+            derivatives[size] = {"file": filename, "width": image.width, "height": image.height, "bytes": out.tell()}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not build image derivatives for {stem}: {e}")
+        return [], {}
+    return files, derivatives
+
+
+def latest_manifest(directory, manifest_name, image_name, time_string, derivatives):
+    """
+    Build the manifest for a latest image and the derivatives it retires
+    The previous image's derivatives stay listed as "previous" for one more event, so a
+    viewer that just read the old manifest can still load them
+    Returns tuple: (manifest JSON bytes, filenames safe to delete once it is published);
+    without derivatives the manifest is None and the old one is retired with all it listed
+    """
+    try:
+        with open(os.path.join(directory, manifest_name), 'rb') as f:
+            old = json.loads(f.read())
+    except (OSError, ValueError):
+        old = {}
+    current = {entry['file'] for entry in derivatives.values()}
+    previous = [entry['file'] for entry in old.get('derivatives', {}).values() if entry['file'] not in current]
+    retired = [name for name in old.get('previous', []) if name not in current and name not in previous]
+    if not derivatives:
+        return None, ([manifest_name] if old else []) + previous + retired
+    manifest = {"image": image_name, "time": time_string, "derivatives": derivatives, "previous": previous}
+    return json.dumps(manifest).encode(), retired
+
+
+def remove_files(directory, filenames):
+    """Delete files that may already be gone"""
+    for filename in filenames:
+        try:
+            os.remove(os.path.join(directory, filename))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error deleting {filename}: {e}")
+
+
+def manifest_name_for(image_name):
+    """hikvision_latest.jpg -> hikvision_latest_manifest.json"""
+    return f"{os.path.splitext(image_name)[0]}_manifest.json"
+
+
+# ==================== DISK WRITER ====================
+# Event files (raw captures, images, timestamps) are written by one background thread
+# per process, off the request and ingest path. Queued writes to the same "latest" file
+# supersede each other, so during a burst only the newest image is written there.
+_disk_writer_lock = threading.Lock()
+_disk_writer_pid = None
+_disk_writer = None
+
+
+class DiskWriter:
+    """
+    Run queued disk jobs in submit order on one thread (bounded queue)
+    A job submitted with a key supersedes queued jobs with the same key: those run their
+    superseded fallback instead (or nothing), so only the newest write reaches that file
+    """
+    
+    def __init__(self, max_pending, block_timeout, fsync_policy='none'):
+        self.max_pending = max_pending
+        self.block_timeout = block_timeout
+        self.fsync_policy = fsync_policy
+        self.jobs = deque()  # (job, key, sequence, superseded)
+        self.newest = {}  # key -> sequence of the newest queued job with that key
+        self.cond = threading.Condition()
+        self.submitted = 0
+        self.finished = 0
+        self.stats = {'written': 0, 'superseded': 0, 'dropped': 0, 'failed': 0, 'syncs': 0}
+        threading.Thread(target=self._run, name='disk-writer', daemon=True).start()
+    
+    def submit(self, job, key=None, superseded=None):
+        """
+        Queue job() for the writer thread, waiting up to block_timeout while the queue is full
+        Args:
+            job: Callable doing the write
+            key: File the job overwrites (e.g. a latest image), None if it is never superseded
+            superseded: Optional callable run instead of job when a newer job with the same key is queued
+        Returns True if queued, False if dropped
+        """
+        deadline = time.monotonic() + self.block_timeout
+        with self.cond:
+            while len(self.jobs) >= self.max_pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats['dropped'] += 1
+                    return False
+                self.cond.wait(remaining)
+            self.submitted += 1
+            self.jobs.append((job, key, self.submitted, superseded))
+            if key is not None:
+                self.newest[key] = self.submitted
+            self.cond.notify_all()
+            return True
+    
+    def _run(self):
+        """Writer thread: run jobs until the process exits"""
+        while True:
+            with self.cond:
+                while not self.jobs:
+                    self.cond.wait()
+                job, key, sequence, superseded = self.jobs.popleft()
+                latest = key is None or self.newest.get(key) == sequence
+                if key is not None and latest:
+                    del self.newest[key]
+                self.cond.notify_all()  # Room for a blocked submitter
+            try:
+                if latest:
+                    job()
+                elif superseded:
+                    superseded()
+                result = 'written' if latest else 'superseded'
+            except Exception as e:
+                result = 'failed'
+                logger.error(f"Error in disk writer: {e}", exc_info=True)
+            with self.cond:
+                sync = self.fsync_policy == 'batch' and not self.jobs
+            if sync:
+                os.sync()  # One flush once the burst has drained
+            with self.cond:
+                self.stats[result] += 1
+                self.stats['syncs'] += sync
+                self.finished += 1
+                self.cond.notify_all()
+    
+    def flush(self, timeout=None):
+        """Wait until every job submitted so far has run. Returns True if drained in time"""
+        with self.cond:
+            target = self.submitted
+            return self.cond.wait_for(lambda: self.finished >= target, timeout)
+    
+    def status(self):
+        """Queue depth and counters for /health"""
+        with self.cond:
+            return {"pending": len(self.jobs), "capacity": self.max_pending,
+                    "fsync": self.fsync_policy, **self.stats}
+
+
+def get_disk_writer():
+    """Return this process's disk writer, starting its thread on first use"""
+    global _disk_writer_pid, _disk_writer
+    if _disk_writer_pid == os.getpid():
+        return _disk_writer
+    with _disk_writer_lock:
+        if _disk_writer_pid != os.getpid():
+            _disk_writer = DiskWriter(DISK_WRITER_QUEUE_SIZE, DISK_WRITER_BLOCK_TIMEOUT, DISK_FSYNC_POLICY)
+            _disk_writer_pid = os.getpid()
+            logger.info(f"Started disk writer (queue size {DISK_WRITER_QUEUE_SIZE}, fsync {DISK_FSYNC_POLICY})")
+        return _disk_writer
+
+
+def submit_disk_write(job, key=None, superseded=None):
+    """
+    Run a disk write on the writer thread, or inline when the disk writer is disabled
+    Arguments as DiskWriter.submit. Returns False if the write was dropped (queue full)
+    """
+    if not DISK_WRITER_ENABLED:
+        job()
+        return True
+    if get_disk_writer().submit(job, key, superseded):
+        return True
+    logger.warning(f"⚠️ Disk writer queue still full after {DISK_WRITER_BLOCK_TIMEOUT}s, dropping write")
+    return False
+
+
+def flush_disk_writes(timeout=None):
+    """
+    Wait for this process's queued disk writes and the filename publishes they handed on
+    (shutdown, tests). Returns True if drained
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    if _disk_writer_pid == os.getpid() and not _disk_writer.flush(timeout):
+        return False
+    if _publisher_pid != os.getpid():
+        return True
+    try:
+        _image_publish_executor.submit(lambda: None).result(
+            None if deadline is None else max(0.0, deadline - time.monotonic()))
+    except FuturesTimeoutError:
+        return False
+    except RuntimeError:
+        pass  # Interpreter exit: the executor already ran its queue and shut down
+    return True
+
+
+atexit.register(flush_disk_writes, DISK_WRITER_BLOCK_TIMEOUT)
+
+
+def save_detection_image(jpeg_data, timestamp_str, camera=None):
+    """
+    Save detection image and timestamp to HTML folder and publish the filename
+    Args:
+        jpeg_data: JPEG image bytes
+        timestamp_str: Detection timestamp string (HH:MM:SS format)
+        camera: Source Camera (default: the built-in body detection camera)
+    """
+    camera = camera or CAMERAS.default_for('body_detection')
+    
+    def write():
+        if write_detection_image(jpeg_data, timestamp_str, camera):
+            # Update OpenHAB item with filename (off the disk writer thread)
+            publish_image_filename(camera.item(ITEM_IMAGE_FILENAME), camera.body_image, 'body_detection', camera)
+    
+    # Written by the disk writer; a newer image for the same file supersedes this one while queued
+    submit_disk_write(write, camera.body_image)
+
+
+def write_detection_image(jpeg_data, timestamp_str, camera=None):
+    """
+    Write detection image and timestamp to HTML folder (disk only, no OpenHAB calls)
+    Args:
+        jpeg_data: JPEG image bytes
+        timestamp_str: Detection timestamp string (HH:MM:SS format)
+        camera: Source Camera, selects the output files (default: built-in body detection camera)
+    Returns True if the image was written
+    """
+    camera = camera or CAMERAS.default_for('body_detection')
+    start = time.perf_counter()
+    try:
+        # Save image and timestamp (just time part for HTML display) atomically, timestamp last
+        # Note: Removed redundant OpenHAB Image item upload (was causing 1-3 second delay)
+        # HTML viewer loads images directly from disk, so upload is not needed
+        time_only = timestamp_str.split()[1] if ' ' in timestamp_str else timestamp_str
+        files = [(camera.body_image, jpeg_data)]
+        
+        # Downscaled copies under content-hashed names, listed in the manifest
+        with METRICS.timer('derivatives', 'body_detection', camera):
+            derivative_files, derivatives = build_derivatives(
+                jpeg_data, os.path.splitext(camera.body_image)[0], content_hash=True)
+        manifest_name = manifest_name_for(camera.body_image)
+        manifest, retired = latest_manifest(HTML_OUTPUT_PATH, manifest_name, camera.body_image, time_only, derivatives)
+        if manifest:
+            files += derivative_files + [(manifest_name, manifest)]
+        
+        written = publish_files(HTML_OUTPUT_PATH, files + [(camera.body_timestamp, time_only.encode())], 0o644)
+        remove_files(HTML_OUTPUT_PATH, retired)  # Without a manifest viewers load the full image
+        METRICS.inc('hikvision_image_bytes_written_total', 'body_detection', 'ok', written, camera)
+        logger.info(f"✅ Saved detection image: {os.path.join(HTML_OUTPUT_PATH, camera.body_image)} ({len(jpeg_data)} bytes)")
+        METRICS.observe('image_save', 'body_detection', time.perf_counter() - start, camera)
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error saving detection image: {e}")
+        return False
+
+
+# ==================== OPENHAB PUBLISHER ====================
+# One keep-alive session and one bounded worker pool per process. Both are created
+# lazily and re-created after fork, so pre-forking servers never share sockets.
+# Image filenames are published by their own single thread, in the order the images were
+# written, so a slow OpenHAB never holds up the disk writer.
+_publisher_lock = threading.Lock()
+_publisher_pid = None
+_openhab_session = None
+_publish_executor = None
+_image_publish_executor = None
+_openhab_transport = None
+
+# Recent per-event publish latencies in milliseconds (newest last)
+PUBLISH_LATENCIES_MS = deque(maxlen=500)
+
+
+class ItemStateCache:
+    """
+    Last successfully published state per OpenHAB item
+    Lets the publisher skip updates whose value has not changed. Entries expire after
+    ttl seconds, the whole cache is dropped every refresh_interval seconds, and it is
+    invalidated whenever OpenHAB becomes unreachable (it may have restarted)
+    """
+    
+    def __init__(self, enabled, ttl, refresh_interval):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.states = {}
+        self.last_refresh = time.monotonic()
+        self.skipped = 0
+    
+    def filter(self, updates):
+        """Return only the (item, value) updates that differ from the cached state"""
+        if not self.enabled:
+            return updates
+        now = time.monotonic()
+        changed = []
+        with self.lock:
+            if self.refresh_interval and now - self.last_refresh >= self.refresh_interval:
+                self.states.clear()
+                self.last_refresh = now
+                logger.debug("Item state cache: forced refresh")
+            for item_name, value in updates:
+                cached = self.states.get(item_name)
+                if cached and cached[0] == str(value) and (not self.ttl or now - cached[1] < self.ttl):
+                    self.skipped += 1
+                else:
+                    changed.append((item_name, value))
+        return changed
+    
+    def record(self, item_name, value):
+        """Remember a state OpenHAB has accepted"""
+        if self.enabled:
+            with self.lock:
+                self.states[item_name] = (str(value), time.monotonic())
+    
+    def forget(self, item_name):
+        """Drop one item (e.g. after OpenHAB rejected its update)"""
+        with self.lock:
+            self.states.pop(item_name, None)
+    
+    def invalidate(self, reason):
+        """Drop every cached state so the next event republishes all items"""
+        with self.lock:
+            if self.states:
+                logger.info(f"Item state cache invalidated: {reason}")
+            self.states.clear()
+            self.last_refresh = time.monotonic()
+    
+    def status(self):
+        """Return cache statistics for /health"""
+        with self.lock:
+            return {"enabled": self.enabled, "entries": len(self.states), "skipped": self.skipped}
+
+
+ITEM_STATE_CACHE = ItemStateCache(STATE_CACHE_ENABLED, STATE_CACHE_TTL, STATE_CACHE_REFRESH_INTERVAL)
+
+
+class CircuitBreaker:
+    """
+    Fails fast while OpenHAB is unreachable
+    closed: updates are sent. After failure_threshold consecutive connection failures the
+    breaker opens and updates go straight to the replay queue. Every reset_timeout seconds
+    one event is let through as a half-open probe: success closes the breaker, failure
+    opens it again. clock returns monotonic seconds (replaceable in tests)
+    """
+    
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+    
+    def allow(self):
+        """Return True if an update may be sent now (claims the probe when half-open)"""
+        with self.lock:
+            if self.state == 'closed':
+                return True
+            now = self.clock()
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            # Open long enough (or a probe never reported back): let one caller probe
+            self.state = 'half_open'
+            self.opened_at = now
+        logger.info("🔌 OpenHAB circuit half-open, probing")
+        return True
+    
+    def record_success(self):
+        """OpenHAB answered. Returns True if this closed the breaker"""
+        with self.lock:
+            was_closed = self.state == 'closed'
+            self.state = 'closed'
+            self.failures = 0
+        if not was_closed:
+            logger.info("✅ OpenHAB circuit closed, OpenHAB reachable again")
+        return not was_closed
+    
+    def record_failure(self):
+        """OpenHAB could not be reached (connection error or timeout)"""
+        with self.lock:
+            self.failures += 1
+            if self.state == 'open':
+                return
+            if self.state == 'closed' and self.failures < self.failure_threshold:
+                return
+            self.state = 'open'
+            self.opened_at = self.clock()
+            self.trips += 1
+        logger.warning(f"🔌 OpenHAB circuit open after {self.failures} failures, "
+                       f"queueing updates for {self.reset_timeout}s")
+    
+    def status(self):
+        """Return breaker state for /health"""
+        with self.lock:
+            retry_in = max(0.0, self.reset_timeout - (self.clock() - self.opened_at))
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "trips": self.trips,
+                "retry_in_seconds": round(retry_in, 1) if self.state != 'closed' else None
+            }
+
+
+class ReplayQueue:
+    """
+    Item updates that could not be delivered, coalesced to the latest state per item
+    Bounded to max_items (oldest item dropped first) and saved to a JSON file on every
+    change, so queued states survive a restart during an OpenHAB outage
+    The file is shared by all worker processes: changes are made under an flock on
+    <file>.lock and start from the file's current contents, so workers never overwrite
+    each other's queued updates and only the worker that drains the queue replays it
+    """
+    
+    def __init__(self, path, max_items):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.max_items = max_items
+        self.lock = threading.Lock()
+        self.pending = {}  # item_name -> value, insertion order = age
+        self.signature = None  # (inode, mtime, size) of the file pending was read from
+        self.dropped = 0
+        with self.lock:
+            self._sync()
+        if self.pending:
+            logger.info(f"🔁 Loaded {len(self.pending)} queued OpenHAB updates from {self.path}")
+    
+    def __len__(self):
+        with self.lock:
+            self._sync()
+            return len(self.pending)
+    
+    @contextmanager
+    def _locked(self):
+        """Hold the thread lock and the cross-process flock, with pending up to date"""
+        with self.lock, open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._sync()
+            yield
+    
+    def _sync(self):
+        """Reload pending if another process replaced the file since it was read. Caller holds the lock"""
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signature = None
+        if signature == self.signature:
+            return
+        self.signature = signature
+        self.pending = {}
+        if signature is None:
+            return
+        try:
+            with open(self.path, 'r') as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            self.signature = None
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load OpenHAB replay queue {self.path}: {e}")
+            return
+        if not isinstance(saved, dict):
+            logger.warning(f"Ignoring OpenHAB replay queue {self.path}: expected a JSON object")
+            return
+        self.pending = {str(item_name): str(value) for item_name, value in list(saved.items())[-self.max_items:]}
+    
+    def _save(self):
+        """Write the queue atomically (temp file + rename). Caller holds both locks"""
+        try:
+            if not self.pending:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                self.signature = None
+                return
+            with tempfile.NamedTemporaryFile(mode='w', dir=os.path.dirname(self.path) or '.', delete=False) as tmp:
+                json.dump(self.pending, tmp)
+                temp_path = tmp.name
+            os.replace(temp_path, self.path)
+            stat = os.stat(self.path)
+            self.signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError as e:
+            logger.warning(f"Could not save OpenHAB replay queue {self.path}: {e}")
+    
+    def add(self, updates):
+        """Queue (item_name, value) updates, replacing older queued states of the same items"""
+        if not updates:
+            return
+        with self._locked():
+            for item_name, value in updates:
+                self.pending.pop(item_name, None)
+                self.pending[item_name] = str(value)
+            while len(self.pending) > self.max_items:
+                del self.pending[next(iter(self.pending))]
+                self.dropped += 1
+            self._save()
+    
+    def discard(self, item_names):
+        """Drop queued states superseded by a newer update of the same items"""
+        item_names = list(item_names)
+        with self.lock:
+            self._sync()
+            if not any(item_name in self.pending for item_name in item_names):
+                return  # Common case: one stat, no flock, no write
+        with self._locked():
+            removed = [self.pending.pop(item_name, None) for item_name in item_names]
+            if any(value is not None for value in removed):
+                self._save()
+    
+    def drain(self):
+        """Remove and return all queued updates as (item_name, value) tuples, oldest first"""
+        with self._locked():
+            updates = list(self.pending.items())
+            if updates:
+                self.pending.clear()
+                self._save()
+            return updates
+    
+    def status(self):
+        """Return queue statistics for /health (dropped counts this process only)"""
+        with self.lock:
+            self._sync()
+            return {"pending": len(self.pending), "max_items": self.max_items, "dropped": self.dropped}
+
+
+OPENHAB_BREAKER = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+_replay_queue_lock = threading.Lock()
+_replay_queue_pid = None
+_replay_queue = None
+
+
+def get_replay_queue():
+    """
+    Return this process's handle on the shared replay queue, loading it on first use
+    Created after gunicorn forks its workers, not at import in the master
+    """
+    global _replay_queue_pid, _replay_queue
+    if _replay_queue_pid == os.getpid():
+        return _replay_queue
+    with _replay_queue_lock:
+        if _replay_queue_pid != os.getpid():
+            _replay_queue = ReplayQueue(os.path.join(WEBHOOK_DIR, REPLAY_QUEUE_FILE), REPLAY_QUEUE_MAX_ITEMS)
+            _replay_queue_pid = os.getpid()
+        return _replay_queue
+
+
+def get_openhab_session():
+    """Return the process-wide keep-alive requests.Session for OpenHAB"""
+    global _publisher_pid, _openhab_session, _publish_executor, _image_publish_executor, _openhab_transport
+    if _publisher_pid != os.getpid():
+        with _publisher_lock:
+            if _publisher_pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OPENHAB_POOL_SIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update({
+                    "Content-Type": "text/plain",
+                    "Accept": "application/json"
+                })
+                _openhab_session = session
+                _publish_executor = ThreadPoolExecutor(max_workers=OPENHAB_PUBLISH_WORKERS,
+                                                       thread_name_prefix='openhab-publish')
+                _image_publish_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-publish')
+                _openhab_transport = create_openhab_transport()
+                _publisher_pid = os.getpid()
+    return _openhab_session
+
+
+def get_publish_executor():
+    """Return the process-wide bounded worker pool used for concurrent item updates"""
+    get_openhab_session()
+    return _publish_executor
+
+
+def publish_image_filename(item_name, filename, event_type=None, camera=None):
+    """Queue the filename of a written image for the image publisher thread (never waits on OpenHAB)"""
+    def publish():
+        try:
+            publish_openhab_items([(item_name, filename)], 'image filename', event_type, camera)
+        except Exception as e:
+            logger.error(f"Error publishing image filename {filename}: {e}", exc_info=True)
+    
+    get_openhab_session()
+    _image_publish_executor.submit(publish)
+
+
+def get_openhab_transport():
+    """Return the process-wide transport that delivers item states to OpenHAB"""
+    get_openhab_session()
+    return _openhab_transport
+
+
+def create_openhab_transport():
+    """Build the transport selected by openhab.transport in config.json"""
+    if OPENHAB_TRANSPORT == 'mqtt':
+        # One client ID per worker: a broker drops the older session when the same ID connects again
+        return MqttTransport(MQTT_HOST, MQTT_PORT, MQTT_TOPIC_TEMPLATE, f"{MQTT_CLIENT_ID}-{os.getpid()}",
+                             MQTT_USERNAME, MQTT_PASSWORD, MQTT_RETAIN, MQTT_KEEPALIVE)
+    return RestTransport()
+
+
+class RestTransport:
+    """One REST PUT per item, sent concurrently on the publisher pool"""
+    
+    name = 'rest'
+    
+    def send(self, updates, event_type=None, camera=None):
+        """Deliver (item_name, value) updates. Returns number delivered"""
+        unreachable = []  # Queued for replay in one write, not one per failed PUT
+        if len(updates) == 1:
+            delivered = 1 if put_openhab_item_state(*updates[0], event_type, unreachable, camera) else 0
+        else:
+            executor = get_publish_executor()
+            futures = [executor.submit(put_openhab_item_state, item_name, value, event_type, unreachable, camera)
+                       for item_name, value in updates]
+            delivered = sum(1 for future in futures if future.result())
+        get_replay_queue().add(unreachable)
+        return delivered
+
+
+class MqttTransport:
+    """
+    All item states of one event in a single burst on one persistent MQTT connection
+    Minimal MQTT 3.1.1 publisher (QoS 0), no client library needed. OpenHAB picks the
+    states up through MQTT binding channels subscribed to topic_template
+    """
+    
+    name = 'mqtt'
+    
+    def __init__(self, host, port, topic_template, client_id, username='', password='',
+                 retain=True, keepalive=60):
+        self.host = host
+        self.port = port
+        self.topic_template = topic_template
+        self.client_id = client_id
+        self.username = username
+        self.password = password
+        self.retain = retain
+        self.keepalive = keepalive
+        self.lock = threading.Lock()
+        self.sock = None
+        self.last_send = 0.0
+    
+    @staticmethod
+    def _encode_length(length):
+        """MQTT variable-length 'remaining length' field"""
+        encoded = bytearray()
+        while True:
+            digit, length = length % 128, length // 128
+            encoded.append(digit | 0x80 if length else digit)
+            if not length:
+                return bytes(encoded)
+    
+    @staticmethod
+    def _encode_string(text):
+        data = text.encode('utf-8')
+        return len(data).to_bytes(2, 'big') + data
+    
+    def _connect(self):
+        """Open the connection and perform the CONNECT/CONNACK handshake"""
+        self.close()
+        sock = socket.create_connection((self.host, self.port), timeout=OPENHAB_TIMEOUT)
+        flags = 0x02  # Clean session
+        payload = self._encode_string(self.client_id)
+        if self.username:
+            flags |= 0x80
+            payload += self._encode_string(self.username)
+            if self.password:
+                flags |= 0x40
+                payload += self._encode_string(self.password)
+        variable_header = self._encode_string('MQTT') + bytes([4, flags]) + self.keepalive.to_bytes(2, 'big')
+        body = variable_header + payload
+        sock.sendall(b'\x10' + self._encode_length(len(body)) + body)
+        connack = b''
+        while len(connack) < 4:
+            chunk = sock.recv(4 - len(connack))
+            if not chunk:
+                sock.close()
+                raise ConnectionError("MQTT broker closed the connection during CONNECT")
+            connack += chunk
+        if connack[0] != 0x20 or connack[3] != 0:
+            sock.close()
+            raise ConnectionError(f"MQTT broker refused connection (return code {connack[3]})")
+        self.sock = sock
+        logger.info(f"✅ Connected to MQTT broker {self.host}:{self.port}")
+    
+    def _connection_usable(self):
+        """False if there is no socket, it sat idle past keepalive, or the broker closed it"""
+        if self.sock is None or time.monotonic() - self.last_send > self.keepalive:
+            return False
+        readable, _, _ = select.select([self.sock], [], [], 0)
+        return not readable  # A QoS 0 publisher never expects data, so readable means EOF/error
+    
+    def _packet(self, item_name, value):
+        flags = 0x31 if self.retain else 0x30
+        body = self._encode_string(self.topic_template.format(item=item_name)) + str(value).encode('utf-8')
+        return bytes([flags]) + self._encode_length(len(body)) + body
+    
+    def send(self, updates, event_type=None, camera=None):
+        """Deliver (item_name, value) updates in one write. Returns number delivered"""
+        burst = b''.join(self._packet(item_name, value) for item_name, value in updates)
+        with self.lock:
+            for attempt in (1, 2):
+                try:
+                    if not self._connection_usable():
+                        self._connect()
+                    self.sock.sendall(burst)
+                    self.last_send = time.monotonic()
+                    break
+                except OSError as e:
+                    self.close()
+                    if attempt == 2:
+                        logger.error(f"Error publishing {len(updates)} items to MQTT: {e}")
+                        ITEM_STATE_CACHE.invalidate("MQTT broker unreachable")
+                        OPENHAB_BREAKER.record_failure()
+                        get_replay_queue().add(updates)
+                        return 0
+        OPENHAB_BREAKER.record_success()
+        for item_name, value in updates:
+            logger.debug(f"✓ Published {item_name} = {value}")
+            ITEM_STATE_CACHE.record(item_name, value)
+        return len(updates)
+    
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+
+def publish_openhab_items(updates, event_label, event_type=None, camera=None):
+    """
+    Publish all item updates of one event concurrently over the pooled session
+    Args:
+        updates: List of (item_name, value) tuples
+        event_label: Description for logging (e.g. 'body_detection', 'image filename')
+        event_type: Metrics label, 'body_detection' or 'linedetection'
+        camera: Camera that sent the event (metrics label, default: built-in camera for event_type)
+    Returns number of items updated successfully
+    """
+    get_replay_queue().discard(item_name for item_name, _ in updates)
+    changed = ITEM_STATE_CACHE.filter(updates)
+    unchanged = len(updates) - len(changed)
+    METRICS.inc('hikvision_openhab_updates_total', event_type, 'unchanged', unchanged, camera)
+    if not changed:
+        if updates:
+            logger.info(f"📤 All {len(updates)} {event_label} items unchanged, nothing to publish")
+        return 0
+
+    if not OPENHAB_BREAKER.allow():
+        get_replay_queue().add(changed)
+        METRICS.inc('hikvision_openhab_updates_total', event_type, 'queued', len(changed), camera)
+        logger.warning(f"🔌 OpenHAB circuit open, queued {len(changed)} {event_label} items for replay "
+                       f"({len(get_replay_queue())} pending)")
+        return 0
+
+    start = time.monotonic()
+    updated = get_openhab_transport().send(changed, event_type, camera)
+    elapsed = time.monotonic() - start
+    elapsed_ms = elapsed * 1000
+    PUBLISH_LATENCIES_MS.append(elapsed_ms)
+    METRICS.observe('openhab_publish', event_type, elapsed, camera)
+    METRICS.inc('hikvision_openhab_updates_total', event_type, 'sent', updated, camera)
+    METRICS.inc('hikvision_openhab_updates_total', event_type, 'failed', len(changed) - updated, camera)
+
+    if updated == len(changed):
+        logger.info(f"📤 Published {updated} {event_label} items in {elapsed_ms:.0f} ms ({unchanged} unchanged)")
+    else:
+        logger.warning(f"📤 Published {updated}/{len(changed)} {event_label} items in {elapsed_ms:.0f} ms ({unchanged} unchanged)")
+
+    if len(get_replay_queue()) and OPENHAB_BREAKER.state == 'closed':
+        flush_replay_queue()
+    return updated
+
+
+def flush_replay_queue():
+    """
+    Resend queued updates once OpenHAB is reachable again
+    Updates that fail with a connection error are queued again by the transport
+    Returns number of items delivered
+    """
+    updates = get_replay_queue().drain()
+    if not updates:
+        return 0
+    delivered = get_openhab_transport().send(updates)
+    logger.info(f"🔁 Replayed {delivered}/{len(updates)} queued OpenHAB item updates")
+    return delivered
+
+
+def update_openhab_item(item_name, value):
+    """Update a single OpenHAB item through the configured transport"""
+    get_replay_queue().discard([item_name])
+    if not OPENHAB_BREAKER.allow():
+        get_replay_queue().add([(item_name, value)])
+        return False
+    return get_openhab_transport().send([(item_name, value)]) == 1
+
+
+def put_openhab_item_state(item_name, value, event_type=None, unreachable=None, camera=None):
+    """
+    Update a single OpenHAB item via REST API (event_type and camera only label the timing metric)
+    On a connection error the update is appended to unreachable for the caller to queue
+    for replay, or queued directly when no list is given
+    """
+    try:
+        url = f"{OPENHAB_URL}/rest/items/{item_name}/state"
+        with METRICS.timer('openhab_put', event_type, camera):
+            response = get_openhab_session().put(url, data=str(value), timeout=OPENHAB_TIMEOUT)
+        OPENHAB_BREAKER.record_success()
+
+        if response.status_code in [200, 201, 202]:
+            logger.debug(f"✓ Updated {item_name} = {value}")
+            ITEM_STATE_CACHE.record(item_name, value)
+            return True
+        else:
+            logger.warning(f"Failed to update {item_name}: {response.status_code}")
+            ITEM_STATE_CACHE.forget(item_name)
+            return False
+    except (requests.ConnectionError, requests.Timeout) as e:
+        logger.error(f"Error updating {item_name}: {e}")
+        ITEM_STATE_CACHE.invalidate("OpenHAB unreachable")
+        OPENHAB_BREAKER.record_failure()
+        if unreachable is None:
+            get_replay_queue().add([(item_name, value)])
+        else:
+            unreachable.append((item_name, value))
+        return False
+    except Exception as e:
+        logger.error(f"Error updating {item_name}: {e}")
+        ITEM_STATE_CACHE.forget(item_name)
+        return False
+
+
+def extract_linedetection_from_xml(content_text, content_bytes, parts=None, camera=None):
+    """
+    Extract line crossing detection data from XML webhook content (Camera 2)
+    Args:
+        content_text: Webhook content as text string (for XML parsing)
+        content_bytes: Webhook content as bytes (for image extraction)
+        parts: Optional MultipartIndex of content_bytes (built if not given)
+        camera: Camera that sent the event (labels the timing metrics)
+    Returns tuple: (linedetection_dict, jpeg_image_bytes)
+    """
+    start = time.perf_counter()
+    try:
+        # Find XML section (starts after boundary)
+        xml_start = content_text.find('<?xml version')
+        if xml_start == -1:
+            logger.warning("No XML content found in webhook")
+            return None, None
+        
+        # Find end of XML (before next boundary or image data)
+        # Look for the closing </EventNotificationAlert> tag
         xml_end = content_text.find('</EventNotificationAlert>', xml_start)
         if xml_end == -1:
             logger.warning("No closing XML tag </EventNotificationAlert> found")
@@ -614,18 +2419,26 @@ def extract_linedetection_from_xml(content_text, content_bytes):
             linedata['calculated_side'] = ''
         
         # Extract JPEG image from multipart data
+        image_start = time.perf_counter()
+        METRICS.observe('extract_xml', 'linedetection', image_start - start, camera)
         jpeg_data = None
         try:
-            # Find JPEG start marker (0xFFD8) - standard JPEG SOI marker
-            jpeg_start_idx = content_bytes.find(b'\xff\xd8')
-            if jpeg_start_idx != -1:
-                # Find JPEG end marker (0xFFD9)
+            if parts is None:
+                parts = MultipartIndex(content_bytes)
+            image_part = parts.first_of_type('image/jpeg')
+            if image_part is not None:
+                jpeg_data = trim_jpeg_view(parts.view(image_part))
+            elif not parts.parts:
+                # Not multipart: take everything from JPEG SOI (0xFFD8) to the last EOI (0xFFD9)
+                jpeg_start_idx = content_bytes.find(b'\xff\xd8')
                 jpeg_end_idx = content_bytes.rfind(b'\xff\xd9')
-                if jpeg_end_idx != -1:
-                    jpeg_data = content_bytes[jpeg_start_idx:jpeg_end_idx + 2]
-                    logger.info(f"✅ Extracted line crossing image: {len(jpeg_data)} bytes")
+                if jpeg_start_idx != -1 and jpeg_end_idx > jpeg_start_idx:
+                    jpeg_data = memoryview(content_bytes)[jpeg_start_idx:jpeg_end_idx + 2]
+            if jpeg_data is not None:
+                logger.info(f"✅ Extracted line crossing image: {len(jpeg_data)} bytes")
         except Exception as img_error:
             logger.error(f"Error extracting line crossing image: {img_error}")
+        METRICS.observe('extract_image', 'linedetection', time.perf_counter() - image_start, camera)
         
         logger.info(f"✅ Extracted line crossing data from camera {linedata.get('camera_ip')}")
         return linedata, jpeg_data
@@ -635,22 +2448,23 @@ def extract_linedetection_from_xml(content_text, content_bytes):
         return None, None
 
 
-def process_linedetection(linedata):
+def build_linedetection_updates(linedata, camera=None):
     """
-    Process line crossing detection data and update OpenHAB items (Camera 2)
+    Map line crossing detection data to OpenHAB item updates (Camera 2)
     Args:
         linedata: Dictionary containing line crossing detection data
+        camera: Source Camera, supplies region mapping and item namespace (default: built-in line crossing camera)
+    Returns list of (item_name, value) tuples
     """
-    if not linedata:
-        logger.warning("No line crossing data to process")
-        return
-    
-    logger.info("Processing line crossing detection data...")
+    camera = camera or CAMERAS.default_for('linedetection')
+    region_direction_map = camera.region_direction_map
+    invert_direction = camera.invert_direction
+    updates = []
     
     # Event information
-    update_openhab_item(ITEM_LC_EVENT_TYPE, linedata.get('event_type', ''))
-    update_openhab_item(ITEM_LC_EVENT_STATE, linedata.get('event_state', ''))
-    update_openhab_item(ITEM_LC_EVENT_DESCRIPTION, linedata.get('event_description', ''))
+    updates.append((ITEM_LC_EVENT_TYPE, linedata.get('event_type', '')))
+    updates.append((ITEM_LC_EVENT_STATE, linedata.get('event_state', '')))
+    updates.append((ITEM_LC_EVENT_DESCRIPTION, linedata.get('event_description', '')))
     
     # Update timestamp (convert to DateTime format)
     datetime_str = linedata.get('datetime', '')
@@ -659,21 +2473,21 @@ def process_linedetection(linedata):
             # Parse ISO format: 2026-02-09T07:39:01+01:00
             dt_obj = datetime.fromisoformat(datetime_str.replace('+01:00', '').replace('+00:00', '').replace('+02:00', ''))
             # Format for OpenHAB DateTime item: ISO 8601
-            update_openhab_item(ITEM_LC_DETECTION_TIME, dt_obj.isoformat())
+            updates.append((ITEM_LC_DETECTION_TIME, dt_obj.isoformat()))
         except Exception as e:
             logger.warning(f"Could not parse datetime: {datetime_str}, error: {e}")
     
     # Camera information
-    update_openhab_item(ITEM_LC_CAMERA_IP, linedata.get('camera_ip', ''))
-    update_openhab_item(ITEM_LC_CAMERA_MAC, linedata.get('camera_mac', ''))
-    update_openhab_item(ITEM_LC_CHANNEL_ID, linedata.get('channel_id', '0'))
-    update_openhab_item(ITEM_LC_CHANNEL_NAME, linedata.get('channel_name', ''))
+    updates.append((ITEM_LC_CAMERA_IP, linedata.get('camera_ip', '')))
+    updates.append((ITEM_LC_CAMERA_MAC, linedata.get('camera_mac', '')))
+    updates.append((ITEM_LC_CHANNEL_ID, linedata.get('channel_id', '0')))
+    updates.append((ITEM_LC_CHANNEL_NAME, linedata.get('channel_name', '')))
     
     # Detection target and position
     detection_target = linedata.get('detection_target', '')
     object_type = linedata.get('object_type', 'Unknown')
-    update_openhab_item(ITEM_LC_DETECTION_TARGET, detection_target)
-    update_openhab_item(ITEM_LC_OBJECT_TYPE, object_type)
+    updates.append((ITEM_LC_DETECTION_TARGET, detection_target))
+    updates.append((ITEM_LC_OBJECT_TYPE, object_type))
     
     # Calculate direction - prioritize regionID mapping over position-based detection
     # METHOD 1 (Preferred): Use camera's configured line crossing rules (regionID → direction)
@@ -690,12 +2504,12 @@ def process_linedetection(linedata):
     
     try:
         # METHOD 1: Check if regionID maps to a configured direction (most reliable)
-        if region_id in REGION_DIRECTION_MAP:
-            configured_direction = REGION_DIRECTION_MAP[region_id].lower()
+        if region_id in region_direction_map:
+            configured_direction = region_direction_map[region_id].lower()
             is_enter = (configured_direction == 'enter')
             
             # Apply direction inversion if configured
-            if INVERT_DIRECTION:
+            if invert_direction:
                 is_enter = not is_enter
                 logger.info(f"🔄 Direction inverted by config")
             
@@ -757,7 +2571,7 @@ def process_linedetection(linedata):
                 is_enter = (current_side == 'B')
                 
                 # Apply direction inversion if configured
-                if INVERT_DIRECTION:
+                if invert_direction:
                     is_enter = not is_enter
                     logger.info(f"🔄 Direction inverted by config")
                 
@@ -787,17 +2601,35 @@ def process_linedetection(linedata):
     
     logger.info(f"✅ Final direction text: '{direction_text}'")
     
-    update_openhab_item(ITEM_LC_DIRECTION, direction_text)
+    updates.append((ITEM_LC_DIRECTION, direction_text))
     
-    update_openhab_item(ITEM_LC_TARGET_X, linedata.get('target_x', '0'))
-    update_openhab_item(ITEM_LC_TARGET_Y, linedata.get('target_y', '0'))
-    update_openhab_item(ITEM_LC_TARGET_WIDTH, linedata.get('target_width', '0'))
-    update_openhab_item(ITEM_LC_TARGET_HEIGHT, linedata.get('target_height', '0'))
+    updates.append((ITEM_LC_TARGET_X, linedata.get('target_x', '0')))
+    updates.append((ITEM_LC_TARGET_Y, linedata.get('target_y', '0')))
+    updates.append((ITEM_LC_TARGET_WIDTH, linedata.get('target_width', '0')))
+    updates.append((ITEM_LC_TARGET_HEIGHT, linedata.get('target_height', '0')))
     
     # Detection line and settings
-    update_openhab_item(ITEM_LC_LINE_COORDINATES, linedata.get('line_coordinates', ''))
-    update_openhab_item(ITEM_LC_REGION_ID, linedata.get('region_id', '0'))
-    update_openhab_item(ITEM_LC_SENSITIVITY, linedata.get('sensitivity', '0'))
+    updates.append((ITEM_LC_LINE_COORDINATES, linedata.get('line_coordinates', '')))
+    updates.append((ITEM_LC_REGION_ID, linedata.get('region_id', '0')))
+    updates.append((ITEM_LC_SENSITIVITY, linedata.get('sensitivity', '0')))
+    
+    return camera.namespace(updates)
+
+
+def process_linedetection(linedata, camera=None):
+    """
+    Process line crossing detection data and update OpenHAB items (Camera 2)
+    Args:
+        linedata: Dictionary containing line crossing detection data
+        camera: Source Camera (default: the built-in line crossing camera)
+    """
+    if not linedata:
+        logger.warning("No line crossing data to process")
+        return
+    
+    logger.info("Processing line crossing detection data...")
+    
+    publish_openhab_items(build_linedetection_updates(linedata, camera), 'linedetection', 'linedetection', camera)
     
     camera_ip = linedata.get('camera_ip', 'unknown')
     object_type = linedata.get('object_type', 'unknown')
@@ -805,246 +2637,1330 @@ def process_linedetection(linedata):
     logger.info(f"✅ Updated OpenHAB line crossing items - Camera: {camera_ip}, Object: {object_type}, Direction: {direction}")
 
 
-def save_linedetection_image(jpeg_data, timestamp_str):
+# ==================== LINE CROSSING IMAGE INDEX ====================
+# Every timestamped line crossing image is recorded in <prefix>_index.jsonl next to the
+# images: one JSON object per line (file, saved, time, size, direction, ...). The HTML
+# viewer and /linecrossings read recent crossings from it without listing the directory.
+# The file is append-only and shared by all worker processes: a writer takes an flock,
+# reads the lines other processes appended since its last visit, appends its own and
+# evicts from the front of the in-memory ring by count, bytes and age. Evicted lines are
+# dropped when the file is compacted (rewritten) once they outnumber the live ones.
+INDEX_COMPACT_MIN_LINES = 64
+
+
+class ImageIndex:
+    """
+    Append-only JSON lines index of saved files (<prefix>_<date>_<time>[_n]<extension>)
+    with count, byte and age retention
+    Built from the index file on first use; a directory without one is scanned once
+    """
+    
+    def __init__(self, directory, prefix, max_images, max_bytes, max_age_seconds, skip=(), extension='.jpg'):
+        self.directory = directory
+        self.prefix = prefix
+        self.extension = extension
+        self.path = os.path.join(directory, f"{prefix}_index.jsonl")
+        self.max_images = max_images
+        self.max_bytes = max_bytes
+        self.max_age = max_age_seconds
+        self.skip = set(skip)
+        self.lock = threading.Lock()
+        self.ring = deque()  # index entries, oldest first
+        self.total_bytes = 0
+        self.lines = 0  # Lines read from the current index file
+        self.offset = 0
+        self.inode = None
+        if not os.path.exists(self.path):
+            self._adopt_existing_images()
+    
+    def _adopt_existing_images(self):
+        """Index files saved before the index existed (oldest first), once"""
+        pattern = re.compile(rf'^{re.escape(self.prefix)}_\d{{8}}_\d{{6}}(_\d+)?{re.escape(self.extension)}$')
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name not in self.skip and pattern.match(entry.name):
+                        stat = entry.stat()
+                        entries.append({"file": entry.name, "saved": round(stat.st_mtime, 3), "size": stat.st_size})
+        except FileNotFoundError:
+            return
+        entries.sort(key=lambda entry: (entry['saved'], entry['file']))
+        with self._locked_index() as f:
+            if f.tell() == 0:
+                f.write(''.join(json.dumps(entry) + '\n' for entry in entries).encode())
+        if entries:
+            logger.info(f"Indexed {len(entries)} existing {self.prefix} files into {self.path}")
+    
+    @contextmanager
+    def _locked_index(self, exclusive=True):
+        """Open the current index file under an flock, retrying if it was replaced meanwhile"""
+        while True:
+            f = open(self.path, 'a+b')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                try:
+                    if os.stat(self.path).st_ino != os.fstat(f.fileno()).st_ino:
+                        continue  # Compacted by another process between open and lock
+                except FileNotFoundError:
+                    continue
+                f.seek(0, os.SEEK_END)
+                yield f
+                return
+            finally:
+                f.close()
+    
+    def _catch_up(self, f):
+        """Read lines appended since the last visit (all of them after a compaction)"""
+        stat = os.fstat(f.fileno())
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            self.ring.clear()
+            self.total_bytes = self.lines = self.offset = 0
+            self.inode = stat.st_ino
+        if stat.st_size == self.offset:
+            return
+        f.seek(self.offset)
+        data = f.read()
+        end = data.rfind(b'\n') + 1  # A line still being written is read next time
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            self.ring.append(entry)
+            self.total_bytes += entry.get('size', 0)
+            self.lines += 1
+        self.offset += end
+    
+    def _evict(self, now):
+        """Drop entries over the count/byte limits or older than max_age. Returns evicted filenames"""
+        evicted = []
+        while self.ring and (len(self.ring) > self.max_images or self.total_bytes > self.max_bytes
+                             or self.ring[0].get('saved', now) < now - self.max_age):
+            if len(self.ring) == 1 and self.ring[0].get('saved', now) >= now - self.max_age:
+                break  # Keep the newest image even when it alone exceeds the byte limit
+            entry = self.ring.popleft()
+            self.total_bytes -= entry.get('size', 0)
+            evicted.append(entry['file'])
+            evicted += entry.get('derivatives', {}).values()
+        return evicted
+    
+    def _compact(self):
+        """Rewrite the index with live entries only (atomic rename; readers reopen by inode)"""
+        with tempfile.NamedTemporaryFile(mode='w', dir=self.directory, delete=False) as tmp:
+            tmp.write(''.join(json.dumps(entry) + '\n' for entry in self.ring))
+            temp_path = tmp.name
+        os.chmod(temp_path, 0o664)
+        os.rename(temp_path, self.path)
+        stat = os.stat(self.path)
+        self.inode, self.offset, self.lines = stat.st_ino, stat.st_size, len(self.ring)
+    
+    def add(self, filename, size, **metadata):
+        """Record a saved image, apply retention and delete evicted images"""
+        now = time.time()
+        entry = {"file": filename, "saved": round(now, 3), "size": size, **metadata}
+        with self.lock, self._locked_index() as f:
+            self._catch_up(f)
+            f.write((json.dumps(entry) + '\n').encode())
+            f.flush()
+            self.ring.append(entry)
+            self.total_bytes += size
+            self.lines += 1
+            self.offset = f.tell()
+            evicted = self._evict(now)
+            if self.lines - len(self.ring) > max(len(self.ring), INDEX_COMPACT_MIN_LINES):
+                self._compact()
+        for name in evicted:
+            try:
+                os.remove(os.path.join(self.directory, name))
+                logger.debug(f"Deleted old {self.prefix} file: {name}")
+            except FileNotFoundError:
+                pass  # Already removed by another process
+            except OSError as e:
+                logger.error(f"Error deleting image {name}: {e}")
+        return entry
+    
+    def recent(self, limit=20):
+        """Newest entries first (reads only what was appended since the last call)"""
+        oldest = time.time() - self.max_age
+        with self.lock, self._locked_index(exclusive=False) as f:
+            self._catch_up(f)
+            entries = list(self.ring)[-min(limit, self.max_images):] if limit > 0 else []
+        return [entry for entry in reversed(entries) if entry.get('saved', 0) >= oldest]
+    
+    def status(self):
+        """Index size for /health"""
+        with self.lock:
+            return {"images": len(self.ring), "bytes": self.total_bytes}
+
+
+_image_index_lock = threading.Lock()
+_image_index_pid = None
+_image_indexes = {}  # (directory, prefix) -> ImageIndex
+
+
+def get_line_image_index(camera=None):
+    """Return this process's line crossing image index for a camera, building it on first use"""
+    global _image_index_pid, _image_indexes
+    camera = camera or CAMERAS.default_for('linedetection')
+    key = (HTML_OUTPUT_PATH, camera.line_prefix)
+    with _image_index_lock:
+        if _image_index_pid != os.getpid():
+            _image_indexes = {}
+            _image_index_pid = os.getpid()
+        index = _image_indexes.get(key)
+        if index is None:
+            index = _image_indexes[key] = ImageIndex(
+                HTML_OUTPUT_PATH, camera.line_prefix, LINE_RETENTION_MAX_IMAGES,
+                int(LINE_RETENTION_MAX_MB * 1024 * 1024), LINE_RETENTION_MAX_AGE_DAYS * 86400,
+                skip=(camera.line_image,))
+        return index
+
+
+def link_unique(temp_path, directory, stem):
+    """
+    Hard-link a finished temp file under stem.jpg, or stem_2.jpg, stem_3.jpg ... if taken
+    Never overwrites an existing image. Returns the filename used
+    """
+    for attempt in range(1, 1000):
+        filename = f"{stem}.jpg" if attempt == 1 else f"{stem}_{attempt}.jpg"
+        try:
+            os.link(temp_path, os.path.join(directory, filename))
+            return filename
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"No free filename for {stem}")
+
+
+def save_linedetection_image(jpeg_data, timestamp_str, camera=None, linedata=None):
+    """
+    Save line crossing detection image to HTML folder and publish the filename
+    Args:
+        jpeg_data: JPEG image bytes
+        timestamp_str: Detection timestamp string
+        camera: Source Camera (default: the built-in line crossing camera)
+        linedata: Optional extracted crossing, recorded in the image index
+    """
+    camera = camera or CAMERAS.default_for('linedetection')
+    
+    def write(update_latest):
+        filename = write_linedetection_image(jpeg_data, timestamp_str, camera, linedata, update_latest)
+        if filename:
+            # Update OpenHAB item with filename (off the disk writer thread)
+            publish_image_filename(camera.item(ITEM_LC_IMAGE_FILENAME), filename, 'linedetection', camera)
+    
+    # Every crossing keeps its timestamped image; only the newest queued one updates the latest alias
+    submit_disk_write(lambda: write(True), camera.line_image, lambda: write(False))
+
+
+def write_linedetection_image(jpeg_data, timestamp_str, camera=None, linedata=None, update_latest=True):
     """
-    Save line crossing detection image to HTML folder
+    Write line crossing detection image to HTML folder (disk only, no OpenHAB calls)
     Args:
         jpeg_data: JPEG image bytes
         timestamp_str: Detection timestamp string
+        camera: Source Camera, selects the output files (default: built-in line crossing camera)
+        linedata: Optional extracted crossing, recorded in the image index
+        update_latest: Also replace the latest image and timestamp (False when a newer crossing is queued)
+    Returns the timestamped image filename, or None on failure
     """
+    camera = camera or CAMERAS.default_for('linedetection')
+    start = time.perf_counter()
     try:
         # Generate filename based on timestamp
         if timestamp_str:
             try:
                 dt = datetime.fromisoformat(timestamp_str.replace('+01:00', '').replace('+00:00', '').replace('+02:00', ''))
-                filename = f"{LINE_CROSSING_PREFIX}_{dt.strftime('%Y%m%d_%H%M%S')}.jpg"
+                stem = f"{camera.line_prefix}_{dt.strftime('%Y%m%d_%H%M%S')}"
                 time_string = dt.strftime('%H:%M:%S')
             except (ValueError, AttributeError) as e:
                 logger.debug(f"Error parsing timestamp '{timestamp_str}': {e}")
-                filename = f"{LINE_CROSSING_PREFIX}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
+                stem = f"{camera.line_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
                 time_string = datetime.now().strftime('%H:%M:%S')
         else:
-            filename = f"{LINE_CROSSING_PREFIX}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
+            stem = f"{camera.line_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
             time_string = datetime.now().strftime('%H:%M:%S')
         
-        # Save timestamped image (atomically to prevent corruption)
-        image_path = os.path.join(HTML_OUTPUT_PATH, filename)
-        with tempfile.NamedTemporaryFile(mode='wb', dir=HTML_OUTPUT_PATH, delete=False) as tmp:
-            tmp.write(jpeg_data)
-            temp_path = tmp.name
-        os.chmod(temp_path, 0o664)  # Set permissions: rw-rw-r-- for web server access
-        os.rename(temp_path, image_path)
-        logger.info(f"✅ Saved line crossing image: {image_path} ({len(jpeg_data)} bytes)")
+        # Open the index first so a first-run adoption scan cannot also pick up this image
+        index = get_line_image_index(camera)
         
-        # Also save as latest image for HTML viewer (atomically)
-        latest_path = os.path.join(HTML_OUTPUT_PATH, LINE_CROSSING_IMAGE)
-        with tempfile.NamedTemporaryFile(mode='wb', dir=HTML_OUTPUT_PATH, delete=False) as tmp:
-            tmp.write(jpeg_data)
-            temp_path = tmp.name
-        os.chmod(temp_path, 0o664)  # Set permissions: rw-rw-r-- for web server access
-        os.rename(temp_path, latest_path)
+        # Write the image once. The timestamped name is a hard link (a crossing in the same second
+        # gets a _2, _3 ... suffix); the temp name then replaces the "latest" alias, same inode
+        temp_path = write_temp_file(HTML_OUTPUT_PATH, jpeg_data)
+        try:
+            filename = link_unique(temp_path, HTML_OUTPUT_PATH, stem)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        if update_latest:
+            os.replace(temp_path, os.path.join(HTML_OUTPUT_PATH, camera.line_image))
+        else:
+            os.unlink(temp_path)
+        logger.info(f"✅ Saved line crossing image: {os.path.join(HTML_OUTPUT_PATH, filename)} ({len(jpeg_data)} bytes)")
         
-        # Save timestamp for HTML viewer (atomically)
-        timestamp_path = os.path.join(HTML_OUTPUT_PATH, LINE_CROSSING_TIMESTAMP)
-        with tempfile.NamedTemporaryFile(mode='w', dir=HTML_OUTPUT_PATH, delete=False) as tmp:
-            tmp.write(time_string)
-            temp_path = tmp.name
-        os.chmod(temp_path, 0o664)  # Set permissions: rw-rw-r-- for web server access
-        os.rename(temp_path, timestamp_path)
+        # Downscaled copies named after the (unique) timestamped image, for every crossing
+        with METRICS.timer('derivatives', 'linedetection', camera):
+            derivative_files, derivatives = build_derivatives(jpeg_data, os.path.splitext(filename)[0])
+        written = len(jpeg_data) + publish_files(HTML_OUTPUT_PATH, derivative_files)
         
-        # Update OpenHAB item with filename
-        update_openhab_item(ITEM_LC_IMAGE_FILENAME, filename)
+        # Record it in the image index (retention evicts the oldest images with their derivatives)
+        linedata = linedata or {}
+        index.add(
+            filename, written, camera=camera.id, time=timestamp_str,
+            direction=linedata.get('direction', ''), object_type=linedata.get('object_type', ''),
+            region_id=linedata.get('region_id', ''),
+            derivatives={size: entry['file'] for size, entry in derivatives.items()})
+        
+        # Save manifest and timestamp for HTML viewer (atomically, after the image they announce)
+        if update_latest:
+            manifest_name = manifest_name_for(camera.line_image)
+            files = [(camera.line_timestamp, time_string.encode())]
+            if derivatives:
+                # Derivatives belong to the timestamped image: retention deletes them, not the manifest
+                manifest = json.dumps({"image": filename, "time": time_string, "derivatives": derivatives}).encode()
+                files.insert(0, (manifest_name, manifest))
+            written += publish_files(HTML_OUTPUT_PATH, files)
+            if not derivatives:
+                remove_files(HTML_OUTPUT_PATH, [manifest_name])
+        elif DISK_FSYNC_POLICY == 'always':
+            sync_directory(HTML_OUTPUT_PATH)
+        METRICS.inc('hikvision_image_bytes_written_total', 'linedetection', 'ok', written, camera)
+        METRICS.observe('image_save', 'linedetection', time.perf_counter() - start, camera)
+        return filename
         
     except Exception as e:
         logger.error(f"Error saving line crossing image: {e}")
+        return None
+
+
+def build_analytics_updates(analytics, camera=None):
+    """
+    Map analytics (path -> value from BODY_MAPPING.read) to OpenHAB item updates (Camera 1)
+    Args:
+        analytics: Resolved payload fields
+        camera: Source Camera, supplies the item namespace (default: built-in body detection camera)
+    Returns list of (item_name, value) tuples
+    """
+    return (camera or CAMERAS.default_for('body_detection')).namespace(BODY_MAPPING.updates(analytics))
 
 
-def process_analytics(analytics):
+def process_analytics(analytics, camera=None):
     """
     Process analytics dict and update OpenHAB items
-    Maps webhook data to OpenHAB item names
+    Maps webhook data to OpenHAB item names (in the camera's item namespace)
     """
+    camera = camera or CAMERAS.default_for('body_detection')
     if not analytics:
         logger.warning("No analytics to process")
         return
     
     logger.info("Processing analytics and updating OpenHAB items...")
     
-    # Camera/Event info
-    channel_name = analytics.get('channelName', 'unknown')
-    event_type = analytics.get('eventType', 'unknown')
-    update_openhab_item(ITEM_CHANNEL_NAME, channel_name)
-    update_openhab_item(ITEM_EVENT_TYPE, event_type)
+    updates = build_analytics_updates(analytics, camera)
+    publish_openhab_items(updates, 'body_detection', 'body_detection', camera)
+    
+    states = dict(updates)
+    summary = [states.get(camera.item(item), 'unknown')
+               for item in (ITEM_GENDER, ITEM_AGE_GROUP, ITEM_AGE, ITEM_FACE_EXPRESSION,
+                            ITEM_JACKET_COLOR, ITEM_TROUSERS_COLOR, ITEM_MOTION_DIRECTION)]
+    logger.info("✅ Updated OpenHAB items - {} {} (age {}), {}, {} jacket, {} trousers, direction: {}".format(*summary))
+
+
+# ==================== CAMERA REGISTRY ====================
+# Every entry under "cameras" in config.json is a camera, keyed by its id. The built-in
+# body_detection and line_crossing cameras always exist, keep the global item and file
+# names, and receive events from sources no other camera claims.
+BUILTIN_CAMERAS = {
+    'body_detection': ('body_detection', 'Camera 1', '10.0.11.101'),  # id -> (event type, name, ip)
+    'line_crossing': ('linedetection', 'Camera 2', '10.0.11.102')
+}
+# ipAddress / macAddress / channelID in either JSON ("key": value) or XML (<key>value</key>)
+CAMERA_FIELD_PATTERN = re.compile(r'(ipAddress|macAddress|channelID)"?\s*[:>]\s*"?([^"<,\s}]+)')
+CAMERA_FIELD_SCAN = 4096  # Identity fields sit at the top of the metadata
+
+
+class Camera:
+    """
+    One camera: identity, OpenHAB item namespace, output files, line crossing
+    direction settings and the ingest lane its webhooks are queued on
+    """
+    
+    def __init__(self, camera_id, settings, default_name='Camera', default_ip=''):
+        self.id = camera_id
+        self.name = settings.get('name', default_name)
+        self.ip = settings.get('ip', default_ip)
+        self.mac = (settings.get('mac') or '').lower()
+        self.channel = str(settings['channel']) if settings.get('channel') is not None else None
+        self.item_prefix = settings.get('item_prefix') or ''
+        self.lane = str(settings.get('lane', camera_id))
+        self.region_direction_map = settings.get('region_direction_mapping', REGION_DIRECTION_MAP)
+        if not isinstance(self.region_direction_map, dict):
+            logger.warning(f"Invalid region_direction_mapping for camera {camera_id}, using the global mapping")
+            self.region_direction_map = REGION_DIRECTION_MAP
+        self.invert_direction = settings.get('invert_direction', INVERT_DIRECTION)
+        window = settings.get('coalesce_window_seconds', COALESCE_WINDOW)
+        if not isinstance(window, dict):
+            window = {'body_detection': window, 'linedetection': window}
+        if not all(isinstance(seconds, (int, float)) and seconds >= 0 for seconds in window.values()):
+            logger.warning(f"Invalid coalesce_window_seconds for camera {camera_id}, using the global window")
+            window = COALESCE_WINDOW
+        self.coalesce_window = {**COALESCE_WINDOW, **window}
+        limit = settings.get('rate_limit', {})
+        self.rate_limit = (limit.get('rate_per_second', RATE_LIMIT_RATE), limit.get('burst', RATE_LIMIT_BURST)) \
+            if isinstance(limit, dict) else None
+        if not self.rate_limit or not all(isinstance(v, (int, float)) and v > 0 for v in self.rate_limit):
+            logger.warning(f"Invalid rate_limit for camera {camera_id}, using the global limit")
+            self.rate_limit = (RATE_LIMIT_RATE, RATE_LIMIT_BURST)
+        
+        # Built-in cameras keep the global file names, others prefix them with the camera id
+        files = settings.get('files', {})
+        prefix = '' if camera_id in BUILTIN_CAMERAS else f"{camera_id}_"
+        self.body_image = files.get('body_detection_image', prefix + IMAGE_FILENAME)
+        self.body_timestamp = files.get('body_detection_timestamp', prefix + TIMESTAMP_FILENAME)
+        self.line_image = files.get('line_crossing_image', prefix + LINE_CROSSING_IMAGE)
+        self.line_timestamp = files.get('line_crossing_timestamp', prefix + LINE_CROSSING_TIMESTAMP)
+        self.line_prefix = self.line_image.replace('_latest.jpg', '').replace('.jpg', '')
+        self.label = f"{self.name} ({self.ip})"
+    
+    def item(self, name):
+        """Return this camera's OpenHAB item for a configured item name"""
+        return f"{self.item_prefix}_{name}" if self.item_prefix else name
+    
+    def namespace(self, updates):
+        """Rename (item, value) updates into this camera's item namespace"""
+        if not self.item_prefix:
+            return updates
+        return [(f"{self.item_prefix}_{item}", value) for item, value in updates]
+
+
+class CameraRegistry:
+    """
+    Cameras indexed by (ip, channel), (mac, channel), ip and mac for O(1) dispatch
+    Cameras with a channel (NVR inputs) are matched on ip/mac plus channel, others on ip/mac alone
+    """
+    
+    def __init__(self, config):
+        self.cameras = {}
+        self.by_ip_channel, self.by_mac_channel, self.by_ip, self.by_mac = {}, {}, {}, {}
+        self.lanes_by_ip = {}
+        self.limits_by_ip = {}
+        for camera_id, settings in config.items():
+            if not isinstance(settings, dict):
+                if camera_id != 'notes':
+                    logger.warning(f"Ignoring camera '{camera_id}': expected an object, got {type(settings).__name__}")
+                continue
+            _, name, ip = BUILTIN_CAMERAS.get(camera_id, (None, camera_id, ''))
+            self.add(Camera(camera_id, settings, name, ip))
+        for camera_id, (_, name, ip) in BUILTIN_CAMERAS.items():
+            if camera_id not in self.cameras:
+                self.add(Camera(camera_id, {}, name, ip))
+        self.defaults = {event_type: self.cameras[camera_id] for camera_id, (event_type, _, _) in BUILTIN_CAMERAS.items()}
+    
+    def add(self, camera):
+        """Register a camera under each of its identity keys (first camera wins on duplicates)"""
+        self.cameras[camera.id] = camera
+        if camera.channel is not None:
+            keys = [(self.by_ip_channel, (camera.ip, camera.channel)), (self.by_mac_channel, (camera.mac, camera.channel))]
+        else:
+            keys = [(self.by_ip, camera.ip), (self.by_mac, camera.mac)]
+        for index, key in keys:
+            if not key or not all(key if isinstance(key, tuple) else (key,)):
+                continue
+            if key in index:
+                logger.warning(f"Camera {camera.id} has the same {key} as {index[key].id}, keeping {index[key].id}")
+                continue
+            index[key] = camera
+        if camera.ip:
+            self.lanes_by_ip.setdefault(camera.ip, camera.lane)
+            self.limits_by_ip.setdefault(camera.ip, camera.rate_limit)
+    
+    def default_for(self, event_type):
+        """Built-in camera for an event type (events from unregistered sources)"""
+        return self.defaults.get(event_type, self.defaults['body_detection'])
+    
+    def lane_for(self, remote_addr):
+        """Ingest lane for a source address, before the body is parsed"""
+        return self.lanes_by_ip.get(remote_addr, 'default')
+    
+    def for_source(self, remote_addr):
+        """Registered camera at a source address, or None (before the body is parsed)"""
+        return self.by_ip.get(remote_addr)
+    
+    def rate_limit_for(self, remote_addr):
+        """Token bucket (rate per second, burst) for a source address, before the body is read"""
+        return self.limits_by_ip.get(remote_addr, (RATE_LIMIT_RATE, RATE_LIMIT_BURST))
+    
+    def identify(self, content_text, remote_addr, event_type):
+        """
+        Find the camera that sent an event from the identity fields in its metadata
+        Falls back to the source address, then to the built-in camera for the event type
+        Returns Camera
+        """
+        fields = {}
+        for match in CAMERA_FIELD_PATTERN.finditer(content_text, 0, CAMERA_FIELD_SCAN):
+            fields.setdefault(match.group(1), match.group(2))
+            if len(fields) == 3:
+                break
+        ip, channel = fields.get('ipAddress'), fields.get('channelID')
+        mac = fields.get('macAddress', '').lower()
+        return (self.by_ip_channel.get((ip, channel)) or self.by_mac_channel.get((mac, channel))
+                or self.by_ip.get(ip) or self.by_mac.get(mac) or self.by_ip.get(remote_addr)
+                or self.default_for(event_type))
+    
+    def status(self):
+        """Registered cameras for /health"""
+        return {camera.id: {"label": camera.label, "lane": camera.lane, "item_prefix": camera.item_prefix or None,
+                            "coalesce_window": {k: v for k, v in camera.coalesce_window.items() if v} or None}
+                for camera in self.cameras.values()}
+
+
+CAMERAS = CameraRegistry(CAMERA_CONFIG)
+
+
+# ==================== EVENT COALESCING ====================
+# Cameras retrigger several near-identical events per second for one person or crossing.
+# Exact retransmits (same camera, event type and extracted fields) are dropped for
+# dedup_seconds. With a coalescing window, the first event of a burst opens the window
+# and only the best event seen until it closes (highest detection score, latest on ties)
+# is published, so OpenHAB and disk load follow real activity, not the retrigger rate.
+COALESCE_DEDUP_MAX_KEYS = 4096
+
+
+def event_score(event_type, data):
+    """Detection confidence used to pick the best event of a burst (0 when the event has none)"""
+    if event_type != 'body_detection':
+        return 0.0
+    for path in SCORE_PATHS:
+        try:
+            return float(data[path])
+        except (KeyError, ValueError):
+            continue
+    return 0.0
+
+
+class EventCoalescer:
+    """
+    Per (camera, event type) burst windows plus a time-bounded dedup set
+    Held events are published from a timer thread when their window closes
+    """
+    
+    def __init__(self, dedup_seconds, max_keys=COALESCE_DEDUP_MAX_KEYS):
+        self.dedup_seconds = dedup_seconds
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.seen = OrderedDict()  # dedup key -> expiry (monotonic, insertion order = expiry order)
+        self.bursts = {}  # (camera id, event type) -> [score, event, flush, count]
+        self.stats = {'duplicates': 0, 'coalesced': 0, 'bursts': 0}
+    
+    def is_duplicate(self, camera, event_type, data):
+        """Remember an event's fields (event time included); returns True if the same event was seen within dedup_seconds"""
+        if not self.dedup_seconds:
+            return False
+        key = hash((camera.id, event_type, repr(sorted(data.items()))))
+        now = time.monotonic()
+        with self.lock:
+            while self.seen and (next(iter(self.seen.values())) < now or len(self.seen) >= self.max_keys):
+                self.seen.popitem(last=False)
+            if key in self.seen:
+                self.stats['duplicates'] += 1
+                return True
+            self.seen[key] = now + self.dedup_seconds
+        return False
+    
+    def submit(self, camera, event_type, data, event, flush):
+        """
+        Decide what to do with one extracted event
+        Args:
+            camera: Source Camera (supplies the window per event type)
+            event_type: 'body_detection' or 'linedetection'
+            data: Extracted fields (analytics or linedata), used for dedup and scoring
+            event: Tuple passed to flush(*event) if the event is held
+            flush: Publishes a held event when the window closes (runs on a timer thread)
+        Returns 'publish' (caller publishes now), 'held', 'coalesced' or 'duplicate'
+        """
+        if self.is_duplicate(camera, event_type, data):
+            return 'duplicate'
+        window = camera.coalesce_window.get(event_type, 0)
+        if not window:
+            return 'publish'
+        key = (camera.id, event_type)
+        score = event_score(event_type, data)
+        with self.lock:
+            burst = self.bursts.get(key)
+            if burst is not None:
+                burst[3] += 1
+                self.stats['coalesced'] += 1
+                if score >= burst[0]:
+                    burst[:3] = [score, event, flush]
+                return 'coalesced'
+            self.bursts[key] = [score, event, flush, 1]
+            self.stats['bursts'] += 1
+        timer = threading.Timer(window, self._close, args=(key,))
+        timer.daemon = True
+        timer.start()
+        return 'held'
+    
+    def _close(self, key):
+        """Window closed: publish the best event of the burst"""
+        with self.lock:
+            burst = self.bursts.pop(key, None)
+        if burst is None:
+            return
+        score, event, flush, count = burst
+        logger.info(f"📦 Publishing best of {count} {key[1]} event(s) from camera {key[0]} (score {score:g})")
+        try:
+            flush(*event)
+        except Exception as e:
+            logger.error(f"Error publishing coalesced {key[1]} event: {e}", exc_info=True)
+    
+    def status(self):
+        """Counters and open bursts for /health"""
+        with self.lock:
+            return {"dedup_seconds": self.dedup_seconds, "open_bursts": len(self.bursts), **self.stats}
+
+
+COALESCER = EventCoalescer(COALESCE_DEDUP_SECONDS)
+
+
+def coalesce_event(camera, event_type, data, event, flush):
+    """Run an extracted event through COALESCER and count what is not published on its own"""
+    outcome = COALESCER.submit(camera, event_type, data, event, flush)
+    if outcome in ('duplicate', 'coalesced'):
+        METRICS.inc('hikvision_events_coalesced_total', event_type, outcome, camera=camera)
+        logger.info(f"🔁 {outcome.capitalize()} {event_type} event from {camera.label}, not published on its own")
+    return outcome
+
+
+# ==================== WEBHOOK PRE-FILTER ====================
+# Most camera traffic is keep-alive: TrackInfo heartbeats without a capture result,
+# videoloss/inactive heartbeats and event types nothing here handles. The pre-filter
+# reads eventType/eventState from the first PREFILTER_SCAN_BYTES of the raw body (the
+# metadata part always comes first) and answers heartbeats and inactive events before
+# indexing, decoding, disk logging or queueing. Active events of a type outside
+# event_types are counted and, unless unknown_events is 'skip', still processed so their
+# raw capture is logged (firmware may report a detection under another eventType).
+# Anything it cannot decide goes through the full pipeline.
+EVENT_TYPE_PATTERN = re.compile(rb'eventType"?\s*[:>]\s*"?([A-Za-z]+)')
+EVENT_STATE_PATTERN = re.compile(rb'eventState"?\s*[:>]\s*"?([A-Za-z]+)')
+# A body detection event carries attributes only under one of these keys
+CAPTURE_MARKER_PATTERN = re.compile(rb'PersonInfo|CaptureResult')
+# Hikvision's periodic alarm-server heartbeat is a videoloss event in state inactive
+HEARTBEAT_EVENT_TYPES = (b'videoloss',)
+# Camera eventType -> event type used by metrics and the pipeline
+PREFILTER_PIPELINE_TYPES = {'mixedtargetdetection': 'body_detection', 'linedetection': 'linedetection'}
+PREFILTER_KNOWN_TYPES = {event_type.lower() for event_type in PREFILTER_EVENT_TYPES}
+_prefilter_lock = threading.Lock()
+PREFILTER_STATS = {'heartbeat': 0, 'inactive': 0, 'unknown_event': 0, 'unknown_processed': 0}
+
+
+def preclassify_webhook(content_bytes, scan_bytes=PREFILTER_SCAN_BYTES):
+    """
+    Decide from the start of a raw webhook body whether it can be skipped
+    Args:
+        content_bytes: Raw webhook body (bytes or bytearray, never copied)
+        scan_bytes: How far into the body to look
+    Returns tuple: (reason, camera_event_type) - reason is None when the webhook must be processed
+    """
+    type_match = EVENT_TYPE_PATTERN.search(content_bytes, 0, scan_bytes)
+    if not type_match:
+        return None, None
+    camera_type = bytes(type_match.group(1))
+    event_type = camera_type.decode('ascii').lower()
+    
+    state_match = EVENT_STATE_PATTERN.search(content_bytes, 0, scan_bytes)
+    if state_match and state_match.group(1).lower() != b'active':
+        return ('heartbeat' if camera_type.lower() in HEARTBEAT_EVENT_TYPES else 'inactive'), event_type
+    if event_type not in PREFILTER_KNOWN_TYPES:
+        return 'unknown_event', event_type
+    
+    # TrackInfo heartbeat: the whole body fits in the window and holds no capture result
+    if event_type == 'mixedtargetdetection' and len(content_bytes) <= scan_bytes \
+            and not CAPTURE_MARKER_PATTERN.search(content_bytes):
+        return 'heartbeat', event_type
+    return None, event_type
+
+
+def filter_webhook(content_bytes, remote_addr):
+    """
+    Run the pre-filter on a received body and count what it skips
+    Returns the skip reason, or None when the webhook should be processed
+    """
+    if not PREFILTER_ENABLED:
+        return None
+    reason, event_type = preclassify_webhook(content_bytes)
+    if reason is None:
+        return None
+    if reason == 'unknown_event' and PREFILTER_UNKNOWN_EVENTS == 'process':
+        with _prefilter_lock:
+            PREFILTER_STATS['unknown_processed'] += 1
+        METRICS.inc('hikvision_webhooks_unknown_total', None, 'processed', camera=CAMERAS.for_source(remote_addr))
+        logger.info(f"❓ Unknown event type '{event_type}' from {remote_addr}, processing it anyway")
+        return None
+    with _prefilter_lock:
+        PREFILTER_STATS[reason] += 1
+    METRICS.inc('hikvision_webhooks_filtered_total', PREFILTER_PIPELINE_TYPES.get(event_type), reason,
+                camera=CAMERAS.for_source(remote_addr))
+    logger.debug(f"Skipped {reason} webhook ({event_type}) from {remote_addr}")
+    return reason
+
+
+def get_prefilter_status():
+    """Return pre-filter settings and skip counters for /health"""
+    with _prefilter_lock:
+        stats = dict(PREFILTER_STATS)
+    return {"enabled": PREFILTER_ENABLED, "scan_bytes": PREFILTER_SCAN_BYTES,
+            "unknown_events": PREFILTER_UNKNOWN_EVENTS, **stats}
+
+
+# ==================== RATE LIMITING ====================
+# Shedding happens before the body is read, so a camera stuck in a retry loop costs one
+# dictionary lookup per request instead of a body read and a parse. Every source address
+# has a token bucket (refilled at rate_per_second, up to burst); a global cap on webhooks
+# in flight protects the server when many sources are busy at once. Limits apply per
+# worker process.
+RATE_LIMIT_MAX_SOURCES = 1024  # Full (idle) buckets are dropped beyond this many sources
+RATE_LIMIT_WARN_INTERVAL = 10  # Seconds between shed warnings per source
+
+
+class TokenBucketLimiter:
+    """Token bucket per source address; buckets are created full on first use"""
+    
+    def __init__(self, max_sources=RATE_LIMIT_MAX_SOURCES):
+        self.max_sources = max_sources
+        self.lock = threading.Lock()
+        self.buckets = {}  # source -> [tokens, last refill (monotonic), rate, burst]
+        self.shed = {}  # source -> requests rejected
+        self.warned = {}  # source -> last warning (monotonic)
+    
+    def allow(self, source, rate, burst):
+        """Take one token for source. Returns True if the request may proceed"""
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(source)
+            if bucket is None:
+                if len(self.buckets) >= self.max_sources:
+                    self._prune(now)
+                bucket = self.buckets[source] = [burst, now, rate, burst]
+            else:
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1:] = now, rate, burst
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True
+            self.shed[source] = self.shed.get(source, 0) + 1
+            if now - self.warned.get(source, 0) >= RATE_LIMIT_WARN_INTERVAL:
+                self.warned[source] = now
+                logger.warning(f"⚠️ Rate limiting {source}: over {rate:g}/s (burst {burst:g}), "
+                               f"{self.shed[source]} webhooks shed so far")
+            return False
+    
+    def _prune(self, now):
+        """Forget buckets that have refilled completely at their own rate (same as never seen)"""
+        for source, (tokens, last, rate, burst) in list(self.buckets.items()):
+            if tokens + (now - last) * rate >= burst:
+                del self.buckets[source]
+    
+    def status(self):
+        """Shed counts per source for /health"""
+        with self.lock:
+            return dict(self.shed)
+
+
+RATE_LIMITER = TokenBucketLimiter()
+# Shed responses close the connection, so the unread body is never drained
+SHED_HEADERS = {'Retry-After': '1', 'Connection': 'close'}
+_in_flight_lock = threading.Lock()
+_webhooks_in_flight = 0
+
+
+def admit_webhook(remote_addr):
+    """
+    Apply the source's token bucket and take a concurrency slot, before the body is read
+    Returns None when admitted (caller must call release_webhook), otherwise
+    tuple: (response_dict, http_status, headers)
+    """
+    global _webhooks_in_flight
+    if not RATE_LIMIT_ENABLED:
+        return None
+    if not RATE_LIMITER.allow(remote_addr, *CAMERAS.rate_limit_for(remote_addr)):
+        METRICS.inc('hikvision_webhooks_shed_total', None, 'rate_limited', camera=CAMERAS.for_source(remote_addr))
+        return {"status": "rate_limited", "message": "too many webhooks from this source"}, 429, SHED_HEADERS
+    with _in_flight_lock:
+        admitted = _webhooks_in_flight < RATE_LIMIT_MAX_CONCURRENT
+        if admitted:
+            _webhooks_in_flight += 1
+    if not admitted:
+        METRICS.inc('hikvision_webhooks_shed_total', None, 'overloaded', camera=CAMERAS.for_source(remote_addr))
+        logger.warning(f"⚠️ {RATE_LIMIT_MAX_CONCURRENT} webhooks in flight, shedding webhook from {remote_addr}")
+        return {"status": "overloaded", "message": "too many webhooks in flight"}, 503, SHED_HEADERS
+    return None
+
+
+def release_webhook():
+    """Give back the concurrency slot taken by admit_webhook"""
+    global _webhooks_in_flight
+    if RATE_LIMIT_ENABLED:
+        with _in_flight_lock:
+            _webhooks_in_flight -= 1
+
+
+def get_rate_limit_status():
+    """Return limiter settings, webhooks in flight and shed counts per source for /health"""
+    return {
+        "enabled": RATE_LIMIT_ENABLED,
+        "rate_per_second": RATE_LIMIT_RATE,
+        "burst": RATE_LIMIT_BURST,
+        "max_concurrent": RATE_LIMIT_MAX_CONCURRENT,
+        "in_flight": _webhooks_in_flight,
+        "shed_by_source": RATE_LIMITER.status()
+    }
+
+
+# ==================== INGEST QUEUE ====================
+# Webhooks are acknowledged as soon as the body is read; worker threads do the
+# extraction, OpenHAB publishing and disk writes. Each camera lane has its own bounded
+# queue and workers, so a busy camera cannot delay another. Created lazily per process.
+_ingest_lock = threading.Lock()
+_ingest_pid = None
+_ingest_lanes = {}  # lane name -> queue.Queue
+_ingest_stats_lock = threading.Lock()
+INGEST_STATS = {'enqueued': 0, 'processed': 0, 'dropped': 0, 'failed': 0}
+INGEST_WAITS_MS = deque(maxlen=500)
+
+
+def get_ingest_queue(lane='default'):
+    """Return this process's queue for an ingest lane, starting its worker threads on first use"""
+    global _ingest_pid, _ingest_lanes
+    if _ingest_pid == os.getpid():
+        ingest_queue = _ingest_lanes.get(lane)
+        if ingest_queue is not None:
+            return ingest_queue
+    with _ingest_lock:
+        if _ingest_pid != os.getpid():
+            _ingest_lanes = {}
+            _ingest_pid = os.getpid()
+        if lane not in _ingest_lanes:
+            ingest_queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+            for i in range(INGEST_WORKERS):
+                worker = threading.Thread(target=ingest_worker, args=(ingest_queue,),
+                                          name=f'ingest-{lane}-{i}', daemon=True)
+                worker.start()
+            _ingest_lanes[lane] = ingest_queue
+            logger.info(f"Started {INGEST_WORKERS} ingest workers for lane '{lane}' (queue size {INGEST_QUEUE_SIZE}, overflow policy {INGEST_OVERFLOW_POLICY})")
+        return _ingest_lanes[lane]
+
+
+def count_ingest(key):
+    """Increment an ingest counter"""
+    with _ingest_stats_lock:
+        INGEST_STATS[key] += 1
+
+
+def enqueue_webhook(content_bytes, content_type, remote_addr, timings=None):
+    """
+    Queue a webhook body on its camera's lane for background processing
+    Applies INGEST_OVERFLOW_POLICY when the lane's queue is full
+    Returns True if the webhook was queued, False if it was dropped
+    """
+    ingest_queue = get_ingest_queue(CAMERAS.lane_for(remote_addr))
+    job = (content_bytes, content_type, remote_addr, time.monotonic(), timings)
+    
+    if INGEST_OVERFLOW_POLICY == 'block':
+        try:
+            ingest_queue.put(job, timeout=INGEST_BLOCK_TIMEOUT)
+        except queue.Full:
+            count_ingest('dropped')
+            logger.warning(f"⚠️ Ingest queue still full after {INGEST_BLOCK_TIMEOUT}s, dropping webhook from {remote_addr}")
+            return False
+    elif INGEST_OVERFLOW_POLICY == 'drop_newest':
+        try:
+            ingest_queue.put_nowait(job)
+        except queue.Full:
+            count_ingest('dropped')
+            logger.warning(f"⚠️ Ingest queue full, dropping webhook from {remote_addr}")
+            return False
+    else:
+        # drop_oldest: make room by discarding the longest-waiting webhook
+        while True:
+            try:
+                ingest_queue.put_nowait(job)
+                break
+            except queue.Full:
+                try:
+                    _, _, old_addr, _, _ = ingest_queue.get_nowait()
+                    ingest_queue.task_done()
+                    count_ingest('dropped')
+                    logger.warning(f"⚠️ Ingest queue full, dropped oldest webhook from {old_addr}")
+                except queue.Empty:
+                    pass
+    
+    count_ingest('enqueued')
+    return True
+
+
+def ingest_worker(ingest_queue):
+    """Worker thread: process queued webhooks until the process exits"""
+    while True:
+        content_bytes, content_type, remote_addr, enqueued_at, timings = ingest_queue.get()
+        try:
+            waited = time.monotonic() - enqueued_at
+            INGEST_WAITS_MS.append(waited * 1000)
+            timings = dict(timings or {}, queue_wait=waited)
+            _, status = process_webhook(content_bytes, content_type, remote_addr, timings)
+            count_ingest('processed' if status == 200 else 'failed')
+        except Exception as e:
+            count_ingest('failed')
+            logger.error(f"Error in ingest worker: {e}", exc_info=True)
+        finally:
+            ingest_queue.task_done()
+
+
+def get_ingest_status():
+    """Return queue depth, counters and wait times for /health"""
+    if INGEST_WORKERS == 0:
+        return {"mode": "synchronous"}
+    lanes = {lane: q.qsize() for lane, q in list(_ingest_lanes.items())} if _ingest_pid == os.getpid() else {}
+    waits = list(INGEST_WAITS_MS)
+    with _ingest_stats_lock:
+        stats = dict(INGEST_STATS)
+    return {
+        "mode": "queued",
+        "depth": sum(lanes.values()),
+        "lanes": lanes,
+        "capacity": INGEST_QUEUE_SIZE,
+        "workers": INGEST_WORKERS,
+        "overflow_policy": INGEST_OVERFLOW_POLICY,
+        **stats,
+        "wait_ms": {
+            "last": round(waits[-1], 1) if waits else None,
+            "avg": round(sum(waits) / len(waits), 1) if waits else None,
+            "max": round(max(waits), 1) if waits else None
+        }
+    }
+
+
+# ==================== HEALTH ====================
+# A background thread probes OpenHAB's lightweight REST root on a schedule; /health
+# only reads the cached result and in-memory counters, so it never waits on OpenHAB.
+_prober_lock = threading.Lock()
+_prober_pid = None
+_health_lock = threading.Lock()
+HEALTH_PROBE = {'reachable': None, 'status_code': None, 'latency_ms': None, 'error': None, 'checked_at': None}
+CAMERA_LAST_EVENT = {}  # camera label -> (event_type, time.time())
+
+
+def ensure_health_prober():
+    """Start this process's background OpenHAB prober on first use"""
+    global _prober_pid
+    if _prober_pid != os.getpid():
+        with _prober_lock:
+            if _prober_pid != os.getpid():
+                threading.Thread(target=health_prober, name='openhab-health-prober', daemon=True).start()
+                _prober_pid = os.getpid()
+                logger.info(f"Started OpenHAB health prober ({OPENHAB_URL}/rest/ every {OPENHAB_HEALTH_INTERVAL}s)")
+
+
+def health_prober():
+    """Prober thread: check OpenHAB every OPENHAB_HEALTH_INTERVAL seconds until the process exits"""
+    while True:
+        try:
+            probe_openhab()
+        except Exception as e:
+            logger.error(f"Error in health prober: {e}", exc_info=True)
+        time.sleep(OPENHAB_HEALTH_INTERVAL)
+
+
+def probe_openhab():
+    """
+    GET the REST root (a few hundred bytes, unlike /rest/items) and cache the result
+    A successful probe closes the circuit breaker and replays queued updates without
+    waiting for the next camera event (REST transport only)
+    """
+    start = time.monotonic()
+    status_code, error = None, None
+    try:
+        response = get_openhab_session().get(f"{OPENHAB_URL}/rest/", timeout=OPENHAB_HEALTH_TIMEOUT)
+        status_code = response.status_code
+        if status_code != 200:
+            error = f"HTTP {status_code}"
+    except requests.RequestException as e:
+        error = str(e)
+    reachable = error is None
+    record_health_probe(reachable, (time.monotonic() - start) * 1000, status_code, error)
+    
+    if reachable and get_openhab_transport().name == 'rest':
+        OPENHAB_BREAKER.record_success()
+        if len(get_replay_queue()):
+            flush_replay_queue()
+    return reachable
+
+
+def record_health_probe(reachable, latency_ms, status_code=None, error=None):
+    """Cache one probe result for /health; a failed probe invalidates the item state cache"""
+    with _health_lock:
+        HEALTH_PROBE.update({
+            'reachable': reachable,
+            'status_code': status_code,
+            'latency_ms': round(latency_ms, 1),
+            'error': error,
+            'checked_at': datetime.now().isoformat(),
+            'checked_monotonic': time.monotonic()
+        })
+    if not reachable:
+        logger.debug(f"OpenHAB health check failed: {error}")
+        ITEM_STATE_CACHE.invalidate("OpenHAB health check failed")
+
+
+def get_camera_label(event_type):
+    """Return 'Name (ip)' of the built-in camera for this event type"""
+    return CAMERAS.default_for(event_type).label
+
+
+def record_camera_event(event_type, camera=None):
+    """Remember when a camera last sent an event. Returns the camera label"""
+    label = (camera or CAMERAS.default_for(event_type)).label
+    with _health_lock:
+        CAMERA_LAST_EVENT[label] = (event_type, time.time())
+    return label
+
+
+def latency_percentiles(samples):
+    """p50/p90/p99/max of a bounded sample window (milliseconds)"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0, "p50": None, "p90": None, "p99": None, "max": None}
     
-    # Use Human data preferentially (more reliable), fallback to Face
-    timestamp = analytics.get('human_snapTime') or analytics.get('face_snapTime', '')
-    if timestamp:
-        # Format: 2026-02-08T08:29:23+01:00
+    def pick(pct):
+        return round(ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))], 1)
+    return {"count": len(ordered), "p50": pick(50), "p90": pick(90), "p99": pick(99), "max": round(ordered[-1], 1)}
+
+
+def get_recent_linecrossings(camera_id=None, limit='20'):
+    """
+    Build the /linecrossings payload
+    Args:
+        camera_id: Only this camera (default: every registered camera)
+        limit: Entries per camera (string from the query string)
+    Returns tuple: (response_dict, http_status)
+    """
+    try:
+        limit = max(0, min(int(limit), LINE_RETENTION_MAX_IMAGES))
+    except ValueError:
+        return {"status": "error", "message": "limit must be an integer"}, 400
+    if camera_id is not None and camera_id not in CAMERAS.cameras:
+        return {"status": "error", "message": f"unknown camera '{camera_id}'"}, 404
+    cameras = [CAMERAS.cameras[camera_id]] if camera_id else list(CAMERAS.cameras.values())
+    crossings = {}
+    for camera in cameras:
+        if camera.id == 'body_detection':
+            continue  # Shares the built-in line crossing file names, not a line crossing camera
+        if camera_id or os.path.exists(os.path.join(HTML_OUTPUT_PATH, f"{camera.line_prefix}_index.jsonl")):
+            crossings[camera.id] = get_line_image_index(camera).recent(limit)
+    return {"crossings": crossings, "timestamp": datetime.now().isoformat()}, 200
+
+
+def get_capture_status():
+    """Raw capture storage for /health (None until this process saved a capture)"""
+    if CAPTURE_FORMAT == 'archive':
+        return _capture_archive.status() if _archive_pid == os.getpid() else None
+    return _capture_retention.status() if _retention_pid == os.getpid() else None
+
+
+def get_disk_writer_status():
+    """Disk writer queue and counters for /health and /metrics"""
+    if not DISK_WRITER_ENABLED:
+        return {"mode": "synchronous", "fsync": DISK_FSYNC_POLICY}
+    status = _disk_writer.status() if _disk_writer_pid == os.getpid() else {"pending": 0}
+    return {"mode": "queued", **status}
+
+
+def get_health_status():
+    """
+    Build the /health payload from cached probe results and in-memory counters
+    Returns tuple: (status_dict, openhab_ok)
+    """
+    now = time.time()
+    with _health_lock:
+        probe = dict(HEALTH_PROBE)
+        cameras = {
+            camera: {"event_type": event_type, "last_event_age_seconds": round(now - seen, 1)}
+            for camera, (event_type, seen) in CAMERA_LAST_EVENT.items()
+        }
+    checked_monotonic = probe.pop('checked_monotonic', None)
+    probe['age_seconds'] = round(time.monotonic() - checked_monotonic, 1) if checked_monotonic else None
+    
+    breaker = OPENHAB_BREAKER.status()
+    openhab_ok = breaker['state'] == 'closed' and probe['reachable'] is not False
+    return {
+        "status": "healthy" if openhab_ok else "degraded",
+        "openhab_connected": openhab_ok,
+        "openhab_probe": probe,
+        "circuit_breaker": breaker,
+        "replay_queue": get_replay_queue().status(),
+        "publish_latency_ms": latency_percentiles(PUBLISH_LATENCIES_MS),
+        "state_cache": ITEM_STATE_CACHE.status(),
+        "ingest": get_ingest_status(),
+        "prefilter": get_prefilter_status(),
+        "coalesce": COALESCER.status(),
+        "rate_limit": get_rate_limit_status(),
+        "captures": get_capture_status(),
+        "disk_writer": get_disk_writer_status(),
+        "line_images": {prefix: index.status() for (_, prefix), index in list(_image_indexes.items())}
+                       if _image_index_pid == os.getpid() else {},
+        "cameras": cameras,
+        "registered_cameras": CAMERAS.status(),
+        "timestamp": datetime.now().isoformat()
+    }, openhab_ok
+
+
+def log_raw_webhook(content_bytes, content_text, event_type=None, content_type=None, remote_addr=None, received_at=None,
+                    camera=None):
+    """Save a raw webhook body to WEBHOOK_DIR (capture archive or one file per webhook) and apply retention"""
+    try:
+        if CAPTURE_FORMAT == 'archive':
+            with METRICS.timer('log_write', event_type, camera):
+                webhook_file, offset = get_capture_archive().append(content_bytes, content_type, remote_addr,
+                                                                    event_type, received_at)
+            webhook_file = f"{webhook_file} @ {offset}"
+        else:
+            webhook_file = get_capture_retention().save(content_bytes, event_type, camera)
+    except OSError as e:
+        logger.error(f"Error saving webhook capture: {e}")
+        return
+    logger.debug(f"Saved webhook to: {webhook_file}")
+    logger.info(f"Content length: {len(content_bytes)} bytes")
+    logger.debug(f"Metadata preview: {content_text[:500]}...")
+
+
+def is_linedetection(content_text):
+    """Return True if the webhook metadata is a line crossing event (Camera 2)"""
+    return 'linedetection' in content_text
+
+
+def get_detection_timestamp_display(analytics):
+    """
+    Format the body detection time for display (YYYY-MM-DD HH:MM:SS)
+    Uses current time if the analytics carry no parseable timestamp
+    """
+    detection_timestamp = analytics.get('human.snapTime') or analytics.get('face.snapTime', '')
+    if detection_timestamp:
         try:
-            dt = datetime.fromisoformat(timestamp.replace('+01:00', '').replace('+00:00', '').replace('+02:00', ''))
-            formatted_time = dt.strftime('%d-%m-%Y kl %H:%M')
-            update_openhab_item(ITEM_TIMESTAMP, formatted_time)
+            dt = datetime.fromisoformat(detection_timestamp.replace('+01:00', '').replace('+00:00', '').replace('+02:00', ''))
+            return dt.strftime('%Y-%m-%d %H:%M:%S')
         except (ValueError, AttributeError) as e:
-            logger.debug(f"Error parsing timestamp '{timestamp}': {e}")
-            update_openhab_item(ITEM_TIMESTAMP, timestamp)
-    
-    # Clothing
-    jacket_color = analytics.get('human_jacketColor', 'unknown')
-    trousers_color = analytics.get('human_trousersColor', 'unknown')
-    jacket_type = analytics.get('human_jacketType', 'unknown')
-    trousers_type = analytics.get('human_trousersType', 'unknown')
-    
-    update_openhab_item(ITEM_JACKET_COLOR, jacket_color)
-    update_openhab_item(ITEM_TROUSERS_COLOR, trousers_color)
-    update_openhab_item(ITEM_JACKET_TYPE, jacket_type)
-    update_openhab_item(ITEM_TROUSERS_TYPE, trousers_type)
-    
-    # Accessories - convert yes/no to ON/OFF
-    hat = analytics.get('human_hat') or analytics.get('face_hat', 'no')
-    glasses = analytics.get('human_glass') or analytics.get('face_glass', 'no')
-    bag = analytics.get('human_bag', 'no')
-    things = analytics.get('human_things', 'no')
-    mask = analytics.get('human_mask') or analytics.get('face_mask', 'no')
-    ride = analytics.get('human_ride', 'no')
-    
-    update_openhab_item(ITEM_HAS_HAT, 'ON' if hat == 'yes' else 'OFF')
-    update_openhab_item(ITEM_HAS_GLASSES, 'ON' if glasses == 'yes' else 'OFF')
-    update_openhab_item(ITEM_HAS_BAG, 'ON' if bag == 'yes' else 'OFF')
-    update_openhab_item(ITEM_HAS_THINGS, 'ON' if things == 'yes' else 'OFF')
-    update_openhab_item(ITEM_HAS_MASK, 'ON' if mask == 'yes' else 'OFF')
-    update_openhab_item(ITEM_RIDE, 'ON' if ride == 'yes' else 'OFF')
-    
-    # Person attributes
-    gender = analytics.get('human_gender') or analytics.get('face_gender', 'unknown')
-    age_group = analytics.get('human_ageGroup') or analytics.get('face_ageGroup', 'unknown')
-    hair_style = analytics.get('human_hairStyle', 'unknown')
-    face_expression = analytics.get('face_faceExpression', 'unknown')
-    age = analytics.get('face_age', '0')
-    
-    update_openhab_item(ITEM_GENDER, gender)
-    update_openhab_item(ITEM_AGE_GROUP, age_group)
-    update_openhab_item(ITEM_HAIR_STYLE, hair_style)
-    update_openhab_item(ITEM_FACE_EXPRESSION, face_expression)
-    update_openhab_item(ITEM_AGE, age)
-    
-    # Motion
-    direction = analytics.get('human_direction', 'unknown')
-    update_openhab_item(ITEM_MOTION_DIRECTION, direction)
-    
-    # Detection quality scores
-    face_score = analytics.get('face_score', '0')
-    human_score = analytics.get('human_score', '0')
-    update_openhab_item(ITEM_FACE_SCORE, face_score)
-    update_openhab_item(ITEM_HUMAN_SCORE, human_score)
-    
-    logger.info(f"✅ Updated OpenHAB items - {gender} {age_group} (age {age}), {face_expression}, {jacket_color} jacket, {trousers_color} trousers, direction: {direction}")
+            logger.debug(f"Error parsing detection timestamp '{detection_timestamp}': {e}")
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def reject_oversized_body(remote_addr, content_length=None):
+    """Count and answer a webhook whose body is larger than WEBHOOK_MAX_BODY_BYTES (413)"""
+    METRICS.inc('hikvision_webhooks_shed_total', None, 'too_large', camera=CAMERAS.for_source(remote_addr))
+    size = f"{content_length} bytes" if content_length else "chunked body"
+    logger.warning(f"⚠️ Refusing webhook from {remote_addr}: {size} over the {WEBHOOK_MAX_BODY_BYTES} byte limit")
+    return {"status": "too_large", "message": f"body exceeds {WEBHOOK_MAX_BODY_BYTES} bytes"}, 413
+
+
+def read_request_body(stream, content_length, max_bytes=None):
+    """
+    Read a request body incrementally into one preallocated buffer
+    Args:
+        stream: WSGI input stream (request.stream)
+        content_length: Declared body size, or None if unknown (chunked upload)
+        max_bytes: Stop reading a chunked body once it passes this size (default: no limit)
+    Returns bytearray with the body, or None if a chunked body passed max_bytes
+    """
+    if not content_length:
+        body = bytearray()
+        while True:
+            chunk = stream.read(REQUEST_CHUNK_SIZE)
+            if not chunk:
+                break
+            body += chunk
+            if max_bytes and len(body) > max_bytes:
+                return None
+        return body
+    
+    body = bytearray(content_length)
+    received = 0
+    with memoryview(body) as view:
+        while received < content_length:
+            chunk = stream.read(min(REQUEST_CHUNK_SIZE, content_length - received))
+            if not chunk:
+                break
+            view[received:received + len(chunk)] = chunk
+            received += len(chunk)
+    if received < content_length:
+        logger.warning(f"Webhook body truncated: received {received} of {content_length} bytes")
+        del body[received:]
+    return body
 
 
 @app.route('/webhook', methods=['POST'])
 def webhook():
     """Handle incoming webhook from Hikvision camera"""
+    # Over-limit sources and overload are answered before the body is read
+    rejection = admit_webhook(request.remote_addr)
+    if rejection:
+        return rejection
     try:
         logger.info(f"Webhook received from {request.remote_addr}")
+        ensure_health_prober()
+        
+        # Oversized bodies are refused before the buffer is allocated (declared length)
+        # or as soon as a chunked upload passes the limit
+        if (request.content_length or 0) > WEBHOOK_MAX_BODY_BYTES:
+            return reject_oversized_body(request.remote_addr, request.content_length)
+        
+        # Stream the body into a single buffer (no cached copy, no full-body decode)
+        start = time.perf_counter()
+        content_bytes = read_request_body(request.stream, request.content_length, WEBHOOK_MAX_BODY_BYTES)
+        if content_bytes is None:
+            return reject_oversized_body(request.remote_addr)
+        timings = {'receive': time.perf_counter() - start}
+        
+        # Heartbeats and events nothing here handles are answered before any parsing
+        reason = filter_webhook(content_bytes, request.remote_addr)
+        if reason:
+            return {"status": "ignored", "reason": reason, "timestamp": datetime.now().isoformat()}, 200
+        
+        if INGEST_WORKERS == 0:
+            return process_webhook(content_bytes, request.content_type, request.remote_addr, timings)
+        
+        # Acknowledge the camera immediately, workers do the heavy lifting
+        if enqueue_webhook(content_bytes, request.content_type, request.remote_addr, timings):
+            return {"status": "queued", "timestamp": datetime.now().isoformat()}, 200
+        return {"status": "dropped", "message": "ingest queue full"}, 503
+        
+    except Exception as e:
+        logger.error(f"Error receiving webhook: {e}", exc_info=True)
+        return {"status": "error", "message": str(e)}, 500
+    finally:
+        release_webhook()
+
+
+def publish_linedetection_event(linedata, jpeg_image, camera):
+    """Update the camera's line crossing items and save its detection image"""
+    process_linedetection(linedata, camera)
+    if jpeg_image:
+        save_linedetection_image(jpeg_image, linedata.get('datetime', ''), camera, linedata)
+    else:
+        logger.warning("No image found in line crossing webhook")
+
+
+def publish_body_event(analytics, background_image, camera):
+    """Update the camera's body detection items and save its background image"""
+    process_analytics(analytics, camera)
+    if background_image:
+        save_detection_image(background_image, get_detection_timestamp_display(analytics), camera)
+    else:
+        logger.warning("No background image found in webhook")
+
+
+def process_webhook(content_bytes, content_type, remote_addr, timings=None):
+    """
+    Extract, publish and save one webhook body
+    Args:
+        content_bytes: Raw webhook body
+        content_type: Request Content-Type header (carries the multipart boundary)
+        remote_addr: Source address (for logging)
+        timings: Optional {stage: seconds} measured before this call (receive, queue_wait)
+    Returns tuple: (response_dict, http_status)
+    """
+    start = time.perf_counter()
+    event_type = camera = None
+    try:
+        logger.debug(f"Processing webhook from {remote_addr} ({len(content_bytes)} bytes)")
+        
+        # Index the multipart body once; every extractor below reuses it
+        parts = MultipartIndex(content_bytes, get_multipart_boundary(content_type))
+        
+        # Only the JSON/XML metadata is decoded to text, JPEG parts stay as byte slices
+        content_text = extract_metadata_text(parts, content_bytes)
         
-        # Get raw content as bytes (for image extraction)
-        content_bytes = request.get_data()
+        event_type = 'linedetection' if is_linedetection(content_text) else 'body_detection'
+        decode_seconds = time.perf_counter() - start
         
-        # Also get as text for JSON/XML parsing
-        content_text = content_bytes.decode('utf-8', errors='ignore')
+        # Registry lookup: item namespace, output files and direction settings for this camera
+        camera = CAMERAS.identify(content_text, remote_addr, event_type)
         
-        # Save raw webhook to file for analysis (when debugging)
-        if LOG_WEBHOOKS and content_text:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            webhook_file = os.path.join(WEBHOOK_DIR, f'webhook_{timestamp}.txt')
-            with open(webhook_file, 'w') as f:
-                f.write(content_text)
-            logger.debug(f"Saved webhook to: {webhook_file}")
-            logger.info(f"Content length: {len(content_bytes)} bytes")
-            logger.debug(f"Raw content preview: {content_text[:500]}...")
-            # Cleanup old webhook files
-            cleanup_old_webhooks()
+        # Stages timed before the event type and camera were known are recorded now
+        for stage, seconds in (timings or {}).items():
+            METRICS.observe(stage, event_type, seconds, camera)
+        METRICS.observe('decode', event_type, decode_seconds, camera)
+        
+        # Save raw webhook to file for analysis (when debugging), on the disk writer thread
+        if LOG_WEBHOOKS and content_bytes:
+            # Receive time: now, less the processing so far and the time spent in the ingest queue
+            received_at = time.time() - (time.perf_counter() - start) - (timings or {}).get('queue_wait', 0)
+            submit_disk_write(lambda: log_raw_webhook(content_bytes, content_text, event_type,
+                                                      content_type, remote_addr, received_at, camera))
         
         # Determine event type: line crossing detection (Camera 2) or body detection (Camera 1)
-        if 'linedetection' in content_text or '<eventType>linedetection</eventType>' in content_text:
+        if event_type == 'linedetection':
             # ==================== CAMERA 2: LINE CROSSING DETECTION ====================
-            logger.info("📍 Detected LINE CROSSING event from Camera 2")
+            logger.info(f"📍 Detected LINE CROSSING event from {camera.label}")
             
-            linedata, jpeg_image = extract_linedetection_from_xml(content_text, content_bytes)
+            linedata, jpeg_image = extract_linedetection_from_xml(content_text, content_bytes, parts, camera)
             
+            outcome = None
             if linedata:
                 logger.info("Line crossing data extracted successfully")
                 logger.debug(f"Extracted line data: {linedata}")
                 
-                # Update OpenHAB items
-                process_linedetection(linedata)
-                
-                # Save detection image if extracted
-                if jpeg_image:
-                    timestamp_str = linedata.get('datetime', '')
-                    save_linedetection_image(jpeg_image, timestamp_str)
-                else:
-                    logger.warning("No image found in line crossing webhook")
+                # Publish now, hold for the camera's coalescing window, or drop a retransmit
+                event = (linedata, jpeg_image, camera)
+                outcome = coalesce_event(camera, event_type, linedata, event, publish_linedetection_event)
+                if outcome == 'publish':
+                    publish_linedetection_event(*event)
             else:
                 logger.warning("No line crossing data found in webhook")
-                
-            camera_name = CAMERA_LINE.get('name', 'Camera 2')
-            camera_ip = CAMERA_LINE.get('ip', '10.0.11.102')
+            
+            METRICS.inc('hikvision_webhooks_total', event_type, 'ok' if linedata else 'no_data', camera=camera)
             return {
                 "status": "ok",
                 "event_type": "linedetection",
-                "camera": f"{camera_name} ({camera_ip})",
+                "camera": record_camera_event('linedetection', camera),
                 "timestamp": datetime.now().isoformat(),
-                "data_found": linedata is not None
+                "data_found": linedata is not None,
+                "outcome": outcome
             }, 200
             
         else:
             # ==================== CAMERA 1: BODY DETECTION (ORIGINAL) ====================
-            logger.info("👤 Detected BODY DETECTION event from Camera 1")
+            logger.info(f"👤 Detected BODY DETECTION event from {camera.label}")
             
             # Extract analytics and background image from webhook
-            analytics, background_image = extract_analytics_from_webhook_bytes(content_text, content_bytes)
+            analytics, background_image = extract_analytics_from_webhook_bytes(content_text, content_bytes, parts, camera)
             
+            outcome = None
             if analytics:
                 logger.info("Analytics extracted successfully")
                 logger.debug(f"Extracted data: {analytics}")
                 
-                # Update OpenHAB items
-                process_analytics(analytics)
-                
-                # Save background image if extracted
-                if background_image:
-                    detection_timestamp = analytics.get('human_snapTime') or analytics.get('face_snapTime', '')
-                    if detection_timestamp:
-                        # Format timestamp for display (HH:MM:SS)
-                        try:
-                            dt = datetime.fromisoformat(detection_timestamp.replace('+01:00', '').replace('+00:00', '').replace('+02:00', ''))
-                            timestamp_display = dt.strftime('%Y-%m-%d %H:%M:%S')
-                        except (ValueError, AttributeError) as e:
-                            logger.debug(f"Error parsing detection timestamp '{detection_timestamp}': {e}")
-                            timestamp_display = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                        save_detection_image(background_image, timestamp_display)
-                    else:
-                        # Use current time if no timestamp in analytics
-                        timestamp_display = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                        save_detection_image(background_image, timestamp_display)
-                else:
-                    logger.warning("No background image found in webhook")
+                # Publish now, hold for the camera's coalescing window, or drop a retransmit
+                event = (analytics, background_image, camera)
+                outcome = coalesce_event(camera, event_type, analytics, event, publish_body_event)
+                if outcome == 'publish':
+                    publish_body_event(*event)
             else:
                 logger.warning("No analytics found in webhook")
             
-            camera_name = CAMERA_BODY.get('name', 'Camera 1')
-            camera_ip = CAMERA_BODY.get('ip', '10.0.11.101')
+            METRICS.inc('hikvision_webhooks_total', event_type, 'ok' if analytics else 'no_data', camera=camera)
             return {
                 "status": "ok",
                 "event_type": "body_detection",
-                "camera": f"{camera_name} ({camera_ip})",
+                "camera": record_camera_event('body_detection', camera),
                 "timestamp": datetime.now().isoformat(),
-                "analytics_found": analytics is not None
+                "analytics_found": analytics is not None,
+                "outcome": outcome
             }, 200
         
     except Exception as e:
         logger.error(f"Error processing webhook: {e}", exc_info=True)
+        METRICS.inc('hikvision_webhooks_total', event_type, 'error', camera=camera)
         return {"status": "error", "message": str(e)}, 500
+    finally:
+        METRICS.observe('total', event_type, time.perf_counter() - start, camera)
 
 
 @app.route('/test', methods=['GET'])
@@ -1059,25 +3975,101 @@ def test():
     }, 200
 
 
+@app.route('/linecrossings', methods=['GET'])
+def linecrossings():
+    """Recent line crossing images per camera, newest first, from the image index"""
+    return get_recent_linecrossings(request.args.get('camera'), request.args.get('limit', '20'))
+
+
 @app.route('/health', methods=['GET'])
 def health():
-    """Health check endpoint"""
+    """Health check endpoint (cached probe result + counters, never blocks on OpenHAB)"""
+    ensure_health_prober()
+    status, openhab_ok = get_health_status()
+    return status, 200 if openhab_ok else 503
+
+
+def render_status_metrics():
+    """Gauges and totals already kept for /health, in Prometheus text format"""
+    with _health_lock:
+        reachable = HEALTH_PROBE['reachable']
+    breaker = OPENHAB_BREAKER.status()
+    replay = get_replay_queue().status()
+    cache = ITEM_STATE_CACHE.status()
+    ingest = get_ingest_status()
+    series = [
+        ('hikvision_circuit_breaker_open', 'gauge', "1 while OpenHAB updates are being queued instead of sent",
+         1 if breaker['state'] != 'closed' else 0),
+        ('hikvision_circuit_breaker_trips_total', 'counter', "Times the circuit breaker opened", breaker['trips']),
+        ('hikvision_replay_queue_pending', 'gauge', "Item updates waiting for OpenHAB", replay['pending']),
+        ('hikvision_replay_queue_dropped_total', 'counter', "Queued item updates dropped (queue full)", replay['dropped']),
+        ('hikvision_state_cache_skipped_total', 'counter', "Item updates skipped as unchanged", cache['skipped'])
+    ]
+    if reachable is not None:
+        series.append(('hikvision_openhab_up', 'gauge', "Result of the last background OpenHAB probe", int(reachable)))
+    if ingest['mode'] == 'queued':
+        series.append(('hikvision_ingest_queue_depth', 'gauge', "Webhooks waiting for an ingest worker", ingest['depth']))
+        for key in ('enqueued', 'processed', 'dropped', 'failed'):
+            series.append((f'hikvision_ingest_{key}_total', 'counter', f"Webhooks {key} by the ingest queue", ingest[key]))
+    disk = get_disk_writer_status()
+    if disk['mode'] == 'queued':
+        series.append(('hikvision_disk_writer_queue_depth', 'gauge', "File writes waiting for the disk writer", disk['pending']))
+        for key in ('superseded', 'dropped', 'failed'):
+            series.append((f'hikvision_disk_writes_{key}_total', 'counter', f"File writes {key} by the disk writer", disk.get(key, 0)))
+    lines = []
+    for name, metric_type, help_text, value in series:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}", f"{name} {value}"]
+    return '\n'.join(lines) + '\n'
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint: per-stage latency histograms, counters and queue gauges"""
+    return Response(METRICS.render() + render_status_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+def run_production_server(port, workers, threads):
+    """
+    Serve the app on gunicorn with N worker processes of M threads each
+    SIGHUP reloads workers gracefully; per-process state (sessions, queues) is rebuilt after fork
+    """
     try:
-        # Test OpenHAB connection
-        response = requests.get(f"{OPENHAB_URL}/rest/items", timeout=OPENHAB_HEALTH_TIMEOUT)
-        openhab_ok = response.status_code == 200
-    except Exception as e:
-        logger.debug(f"OpenHAB health check failed: {e}")
-        openhab_ok = False
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        logger.error("❌ Production mode needs gunicorn: pip install gunicorn")
+        sys.exit(1)
     
-    return {
-        "status": "healthy" if openhab_ok else "degraded",
-        "openhab_connected": openhab_ok,
-        "timestamp": datetime.now().isoformat()
-    }, 200 if openhab_ok else 503
+    class WebhookApplication(BaseApplication):
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+        
+        def load(self):
+            return app
+    
+    WebhookApplication.options = {
+        'bind': f'0.0.0.0:{port}',
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread',
+        'timeout': SERVER_TIMEOUT,
+        'graceful_timeout': SERVER_GRACEFUL_TIMEOUT,
+        'keepalive': SERVER_KEEPALIVE,
+        'accesslog': None,
+    }
+    WebhookApplication().run()
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Hikvision Webhook Analytics Processor")
+    parser.add_argument('mode', nargs='?', choices=['dev', 'serve'], default='dev',
+                        help="dev = Flask development server, serve = production gunicorn server")
+    parser.add_argument('--port', type=int, default=WEBHOOK_PORT, help="Listening port")
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help="Worker processes (serve mode)")
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS, help="Threads per worker (serve mode)")
+    args = parser.parse_args()
+    WEBHOOK_PORT = args.port
+    
     # Ensure required directories exist before starting
     try:
         os.makedirs(WEBHOOK_DIR, exist_ok=True)
@@ -1085,7 +4077,6 @@ if __name__ == '__main__':
         logger.info(f"✅ Verified directories exist: {WEBHOOK_DIR}, {HTML_OUTPUT_PATH}")
     except Exception as dir_err:
         logger.error(f"❌ Failed to create required directories: {dir_err}")
-        import sys
         sys.exit(1)
     
     logger.info("=" * 70)
@@ -1093,15 +4084,28 @@ if __name__ == '__main__':
     logger.info("=" * 70)
     logger.info(f"Configuration loaded from: {CONFIG_FILE}")
     logger.info(f"Listening on: http://0.0.0.0:{WEBHOOK_PORT}")
+    if args.mode == 'serve':
+        logger.info(f"Server: gunicorn, {args.workers} workers x {args.threads} threads")
+    else:
+        logger.info("Server: Flask development server (use 'serve' for production)")
     logger.info(f"OpenHAB URL: {OPENHAB_URL}")
+    if OPENHAB_TRANSPORT == 'mqtt':
+        logger.info(f"OpenHAB publisher: MQTT {MQTT_HOST}:{MQTT_PORT}, topic {MQTT_TOPIC_TEMPLATE}")
+    else:
+        logger.info(f"OpenHAB publisher: REST, {OPENHAB_PUBLISH_WORKERS} workers, {OPENHAB_POOL_SIZE} pooled connections")
     logger.info(f"Webhook endpoint: POST http://0.0.0.0:{WEBHOOK_PORT}/webhook")
     logger.info(f"Test endpoint: GET http://0.0.0.0:{WEBHOOK_PORT}/test")
     logger.info(f"Health endpoint: GET http://0.0.0.0:{WEBHOOK_PORT}/health")
+    logger.info(f"Ingest: {f'{INGEST_WORKERS} workers and queue {INGEST_QUEUE_SIZE} per camera lane, overflow {INGEST_OVERFLOW_POLICY}' if INGEST_WORKERS else 'synchronous'}")
     logger.info(f"Webhook logging: {'Enabled' if LOG_WEBHOOKS else 'Disabled'}")
-    logger.info(f"Max webhook files: {MAX_WEBHOOK_FILES} (auto-cleanup enabled)")
+    if CAPTURE_FORMAT == 'archive':
+        logger.info(f"Webhook captures: {get_capture_archive().compression} archive, {CAPTURE_SEGMENT_MB:g} MB segments, {MAX_WEBHOOK_MB:g} MB total")
+    else:
+        logger.info(f"Max webhook files: {MAX_WEBHOOK_FILES}, {MAX_WEBHOOK_MB:g} MB (auto-cleanup enabled)")
     logger.info("-" * 70)
-    logger.info(f"Camera 1 (Body Detection): {CAMERA_BODY.get('name', 'Unknown')} - {CAMERA_BODY.get('ip', 'Unknown')}")
-    logger.info(f"Camera 2 (Line Crossing): {CAMERA_LINE.get('name', 'Unknown')} - {CAMERA_LINE.get('ip', 'Unknown')}")
+    for camera in CAMERAS.cameras.values():
+        items = f", items {camera.item_prefix}_*" if camera.item_prefix else ""
+        logger.info(f"Camera {camera.id}: {camera.label} - lane {camera.lane}{items}")
     logger.info("-" * 70)
     logger.info(f"Detection Settings:")
     logger.info(f"  Direction detection: Region-based (using camera rule IDs)")
@@ -1109,4 +4113,7 @@ if __name__ == '__main__':
     logger.info(f"  Position margin: {POSITION_MARGIN*100:.1f}% | Invert direction: {INVERT_DIRECTION}")
     logger.info("=" * 70)
     
-    app.run(host='0.0.0.0', port=WEBHOOK_PORT, debug=False)
+    if args.mode == 'serve':
+        run_production_server(WEBHOOK_PORT, args.workers, args.threads)
+    else:
+        app.run(host='0.0.0.0', port=WEBHOOK_PORT, debug=False, threaded=True)
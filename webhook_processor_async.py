@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Hikvision Webhook Analytics Processor - asyncio variant
+Same extraction and item mapping as webhook_processor.py, served by aiohttp:
+- OpenHAB updates go through one pooled aiohttp.ClientSession (no thread per call)
+- Disk writes (raw webhook logs, images) go to the shared disk writer thread, submitted
+  from a thread pool executor
+- Webhooks are acknowledged immediately and processed as tasks, so a single
+  process on one core can keep hundreds of events in flight
+
+Requires: pip install aiohttp
+Usage: python3 webhook_processor_async.py [--port 5001]
+"""
+
+import argparse
+import asyncio
+import functools
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import webhook_processor as wp
+from webhook_processor import logger
+
+try:
+    import aiohttp
+    from aiohttp import web
+except ImportError:
+    aiohttp = None
+
+# Configuration (shares config.json with the threaded service)
+ASYNC_MAX_IN_FLIGHT = wp.CONFIG.get('async', {}).get('max_in_flight', 500)
+ASYNC_IO_THREADS = wp.CONFIG.get('async', {}).get('io_threads', 4)
+
+
+def call_replay_queue(func, *args):
+    """Apply func to this process's replay queue (runs on the I/O executor)"""
+    return func(wp.get_replay_queue(), *args)
+
+
+class AsyncOpenHABClient:
+    """Pooled asyncio client for the OpenHAB REST API"""
+
+    def __init__(self, base_url, pool_size, timeout, io_executor):
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.io_executor = io_executor
+        self.session = None
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            # Connect/read limits only: time spent waiting for a free pooled connection under
+            # a burst is not an OpenHAB failure and must not trip the circuit breaker
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout),
+            headers={"Content-Type": "text/plain", "Accept": "application/json"}
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+    async def replay_queue(self, func, *args):
+        """
+        Run func(replay_queue, *args) on the I/O executor, never on the loop: queue changes
+        take an flock shared with other workers and rewrite the queue file
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.io_executor, functools.partial(call_replay_queue, func, *args))
+
+    async def update_item(self, item_name, value, event_type=None, unreachable=None, camera=None):
+        """
+        Update a single OpenHAB item. Returns True on success
+        Connection errors append the update to unreachable (queued by the caller in one write)
+        """
+        start = time.perf_counter()
+        try:
+            url = f"{self.base_url}/rest/items/{item_name}/state"
+            async with self.session.put(url, data=str(value).encode('utf-8')) as response:
+                wp.METRICS.observe('openhab_put', event_type, time.perf_counter() - start, camera)
+                wp.OPENHAB_BREAKER.record_success()
+                if response.status in (200, 201, 202):
+                    logger.debug(f"✓ Updated {item_name} = {value}")
+                    wp.ITEM_STATE_CACHE.record(item_name, value)
+                    return True
+                logger.warning(f"Failed to update {item_name}: {response.status}")
+                wp.ITEM_STATE_CACHE.forget(item_name)
+                return False
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            wp.METRICS.observe('openhab_put', event_type, time.perf_counter() - start, camera)
+            logger.error(f"Error updating {item_name}: {e}")
+            wp.ITEM_STATE_CACHE.invalidate("OpenHAB unreachable")
+            wp.OPENHAB_BREAKER.record_failure()
+            if unreachable is None:
+                await self.replay_queue(wp.ReplayQueue.add, [(item_name, value)])
+            else:
+                unreachable.append((item_name, value))
+            return False
+        except Exception as e:
+            logger.error(f"Error updating {item_name}: {e}")
+            wp.ITEM_STATE_CACHE.forget(item_name)
+            return False
+
+    async def publish(self, updates, event_label, event_type=None, camera=None):
+        """
+        Publish all item updates of one event concurrently
+        Returns number of items updated successfully
+        """
+        await self.replay_queue(wp.ReplayQueue.discard, [item_name for item_name, _ in updates])
+        changed = wp.ITEM_STATE_CACHE.filter(updates)
+        wp.METRICS.inc('hikvision_openhab_updates_total', event_type, 'unchanged', len(updates) - len(changed), camera)
+        if not changed:
+            return 0
+        if not wp.OPENHAB_BREAKER.allow():
+            await self.replay_queue(wp.ReplayQueue.add, changed)
+            wp.METRICS.inc('hikvision_openhab_updates_total', event_type, 'queued', len(changed), camera)
+            logger.warning(f"🔌 OpenHAB circuit open, queued {len(changed)} {event_label} items for replay "
+                           f"({await self.replay_queue(len)} pending)")
+            return 0
+        start = time.monotonic()
+        unreachable = []
+        results = await asyncio.gather(*(self.update_item(item, value, event_type, unreachable, camera)
+                                         for item, value in changed))
+        if unreachable:
+            await self.replay_queue(wp.ReplayQueue.add, unreachable)
+        elapsed = time.monotonic() - start
+        elapsed_ms = elapsed * 1000
+        wp.PUBLISH_LATENCIES_MS.append(elapsed_ms)
+        updated = sum(results)
+        wp.METRICS.observe('openhab_publish', event_type, elapsed, camera)
+        wp.METRICS.inc('hikvision_openhab_updates_total', event_type, 'sent', updated, camera)
+        wp.METRICS.inc('hikvision_openhab_updates_total', event_type, 'failed', len(changed) - updated, camera)
+        logger.info(f"📤 Published {updated}/{len(changed)} {event_label} items in {elapsed_ms:.0f} ms "
+                    f"({len(updates) - len(changed)} unchanged)")
+        if wp.OPENHAB_BREAKER.state == 'closed' and await self.replay_queue(len):
+            await self.flush_replay_queue()
+        return updated
+
+    async def flush_replay_queue(self):
+        """Resend updates queued during an outage (failures are queued again)"""
+        updates = await self.replay_queue(wp.ReplayQueue.drain)
+        if not updates:
+            return 0
+        unreachable = []
+        results = await asyncio.gather(*(self.update_item(item, value, unreachable=unreachable)
+                                         for item, value in updates))
+        if unreachable:
+            await self.replay_queue(wp.ReplayQueue.add, unreachable)
+        logger.info(f"🔁 Replayed {sum(results)}/{len(updates)} queued OpenHAB item updates")
+        return sum(results)
+
+    async def ping(self):
+        """Probe the REST root and cache the result for /health. Returns True if reachable"""
+        start = time.monotonic()
+        status_code, error = None, None
+        try:
+            timeout = aiohttp.ClientTimeout(total=wp.OPENHAB_HEALTH_TIMEOUT)
+            async with self.session.get(f"{self.base_url}/rest/", timeout=timeout) as response:
+                status_code = response.status
+                if status_code != 200:
+                    error = f"HTTP {status_code}"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = str(e) or type(e).__name__
+        reachable = error is None
+        wp.record_health_probe(reachable, (time.monotonic() - start) * 1000, status_code, error)
+        return reachable
+
+
+async def health_prober(app):
+    """Background task: probe OpenHAB on a schedule, close the breaker and replay on success"""
+    client = app['openhab']
+    while True:
+        try:
+            if await client.ping():
+                wp.OPENHAB_BREAKER.record_success()
+                if await client.replay_queue(len):
+                    await client.flush_replay_queue()
+        except Exception as e:
+            logger.error(f"Error in health prober: {e}", exc_info=True)
+        await asyncio.sleep(wp.OPENHAB_HEALTH_INTERVAL)
+
+
+async def run_io(app, func, *args):
+    """Run a blocking disk operation on the I/O executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(app['io_executor'], functools.partial(func, *args))
+
+
+async def publish_linedetection_event(app, linedata, jpeg_image, camera):
+    """Publish line crossing items and save the detection image (async wp.publish_linedetection_event)"""
+    client = app['openhab']
+    await client.publish(wp.build_linedetection_updates(linedata, camera), 'linedetection', 'linedetection', camera)
+    if jpeg_image:
+        loop = asyncio.get_running_loop()
+
+        def write(update_latest):
+            filename = wp.write_linedetection_image(jpeg_image, linedata.get('datetime', ''), camera, linedata, update_latest)
+            if filename:
+                asyncio.run_coroutine_threadsafe(client.publish(
+                    [(camera.item(wp.ITEM_LC_IMAGE_FILENAME), filename)], 'image filename', 'linedetection', camera), loop)
+
+        # Same superseding as wp.save_linedetection_image: only the newest queued crossing updates the latest alias
+        await run_io(app, wp.submit_disk_write, lambda: write(True), camera.line_image, lambda: write(False))
+    else:
+        logger.warning("No image found in line crossing webhook")
+
+
+async def publish_body_event(app, analytics, background_image, camera):
+    """Publish body detection items and save the background image (async wp.publish_body_event)"""
+    client = app['openhab']
+    await client.publish(wp.build_analytics_updates(analytics, camera), 'body_detection', 'body_detection', camera)
+    if background_image:
+        timestamp_display = wp.get_detection_timestamp_display(analytics)
+        loop = asyncio.get_running_loop()
+
+        def write():
+            if wp.write_detection_image(background_image, timestamp_display, camera):
+                asyncio.run_coroutine_threadsafe(client.publish(
+                    [(camera.item(wp.ITEM_IMAGE_FILENAME), camera.body_image)], 'image filename', 'body_detection', camera), loop)
+
+        await run_io(app, wp.submit_disk_write, write, camera.body_image)
+    else:
+        logger.warning("No background image found in webhook")
+
+
+async def process_event(app, content_bytes, content_type, remote_addr, receive_seconds):
+    """Extract, publish and save one webhook body (async counterpart of wp.process_webhook)"""
+    start = time.perf_counter()
+    event_type = camera = None
+    try:
+        parts = wp.MultipartIndex(content_bytes, wp.get_multipart_boundary(content_type))
+        content_text = wp.extract_metadata_text(parts, content_bytes)
+        event_type = 'linedetection' if wp.is_linedetection(content_text) else 'body_detection'
+        decode_seconds = time.perf_counter() - start
+        camera = wp.CAMERAS.identify(content_text, remote_addr, event_type)
+        wp.METRICS.observe('receive', event_type, receive_seconds, camera)
+        wp.METRICS.observe('decode', event_type, decode_seconds, camera)
+
+        if wp.LOG_WEBHOOKS and content_bytes:
+            received_at = time.time() - (time.perf_counter() - start)
+            await run_io(app, wp.submit_disk_write, lambda: wp.log_raw_webhook(
+                content_bytes, content_text, event_type, content_type, remote_addr, received_at, camera))
+
+        if event_type == 'linedetection':
+            logger.info(f"📍 Detected LINE CROSSING event from {camera.label}")
+            wp.record_camera_event('linedetection', camera)
+            data, image = wp.extract_linedetection_from_xml(content_text, content_bytes, parts, camera)
+            publish = publish_linedetection_event
+        else:
+            logger.info(f"👤 Detected BODY DETECTION event from {camera.label}")
+            wp.record_camera_event('body_detection', camera)
+            data, image = wp.extract_analytics_from_webhook_bytes(content_text, content_bytes, parts, camera)
+            publish = publish_body_event
+        wp.METRICS.inc('hikvision_webhooks_total', event_type, 'ok' if data else 'no_data', camera=camera)
+        if not data:
+            logger.warning("No line crossing data found in webhook" if event_type == 'linedetection'
+                           else "No analytics found in webhook")
+            return
+
+        # Held events are published on the loop when their coalescing window closes
+        loop = asyncio.get_running_loop()
+
+        def flush(*event):
+            asyncio.run_coroutine_threadsafe(publish(app, *event), loop)
+
+        event = (data, image, camera)
+        if wp.coalesce_event(camera, event_type, data, event, flush) == 'publish':
+            await publish(app, *event)
+    except Exception as e:
+        logger.error(f"Error processing webhook: {e}", exc_info=True)
+        wp.METRICS.inc('hikvision_webhooks_total', event_type, 'error', camera=camera)
+    finally:
+        wp.METRICS.observe('total', event_type, time.perf_counter() - start, camera)
+        app['in_flight'] -= 1
+
+
+async def handle_webhook(request):
+    """Read the body, schedule processing and acknowledge the camera immediately"""
+    app = request.app
+    logger.info(f"Webhook received from {request.remote}")
+    if app['in_flight'] >= ASYNC_MAX_IN_FLIGHT:
+        logger.warning(f"⚠️ {app['in_flight']} events in flight, dropping webhook from {request.remote}")
+        return web.json_response({"status": "dropped", "message": "too many events in flight"}, status=503)
+    rejection = wp.admit_webhook(request.remote)
+    if rejection:
+        body, status, headers = rejection
+        return web.json_response(body, status=status, headers=headers)
+
+    try:
+        start = time.perf_counter()
+        content_bytes = bytearray()
+        async for chunk in request.content.iter_chunked(wp.REQUEST_CHUNK_SIZE):
+            content_bytes += chunk
+        receive_seconds = time.perf_counter() - start
+    finally:
+        wp.release_webhook()
+
+    reason = wp.filter_webhook(content_bytes, request.remote)
+    if reason:
+        return web.json_response({"status": "ignored", "reason": reason, "timestamp": datetime.now().isoformat()})
+
+    app['in_flight'] += 1
+    task = asyncio.create_task(process_event(app, content_bytes, request.headers.get('Content-Type'),
+                                             request.remote, receive_seconds))
+    app['tasks'].add(task)
+    task.add_done_callback(app['tasks'].discard)
+    return web.json_response({"status": "queued", "timestamp": datetime.now().isoformat()})
+
+
+async def handle_test(request):
+    """Test endpoint to verify service is running"""
+    return web.json_response({
+        "status": "running",
+        "service": "Hikvision Webhook Analytics Processor (asyncio)",
+        "listening_on": f"0.0.0.0:{request.app['port']}",
+        "openhab_url": wp.OPENHAB_URL,
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+async def handle_linecrossings(request):
+    """Recent line crossing images per camera from the image index (reads run on the I/O executor)"""
+    body, status = await run_io(request.app, wp.get_recent_linecrossings,
+                                request.query.get('camera'), request.query.get('limit', '20'))
+    return web.json_response(body, status=status)
+
+
+async def handle_health(request):
+    """Health check endpoint (cached probe result + counters, never blocks on OpenHAB or the loop)"""
+    status, openhab_ok = await run_io(request.app, wp.get_health_status)
+    del status['ingest']  # The asyncio variant has no ingest queue, report in-flight tasks instead
+    status['in_flight'] = request.app['in_flight']
+    return web.json_response(status, status=200 if openhab_ok else 503)
+
+
+async def handle_metrics(request):
+    """Prometheus scrape endpoint (same series as the threaded service)"""
+    # Status gauges read the shared replay queue file, so they are rendered off the loop
+    text = wp.METRICS.render() + await run_io(request.app, wp.render_status_metrics)
+    return web.Response(text=text, content_type='text/plain')
+
+
+async def on_startup(app):
+    await app['openhab'].start()
+    app['prober'] = asyncio.create_task(health_prober(app))
+
+
+async def on_cleanup(app):
+    app['prober'].cancel()
+    if app['tasks']:
+        await asyncio.gather(*app['tasks'], return_exceptions=True)
+    await run_io(app, wp.flush_disk_writes, wp.DISK_WRITER_BLOCK_TIMEOUT)
+    await app['openhab'].close()
+    app['io_executor'].shutdown(wait=True)
+
+
+def create_app(port=wp.WEBHOOK_PORT):
+    """Build the aiohttp application"""
+    if wp.OPENHAB_TRANSPORT != 'rest':
+        logger.warning(f"⚠️  openhab.transport '{wp.OPENHAB_TRANSPORT}' is not supported by the asyncio variant, "
+                       f"publishing over REST")
+    app = web.Application(client_max_size=wp.WEBHOOK_MAX_BODY_BYTES)
+    app['port'] = port
+    app['io_executor'] = ThreadPoolExecutor(max_workers=ASYNC_IO_THREADS, thread_name_prefix='async-io')
+    app['openhab'] = AsyncOpenHABClient(wp.OPENHAB_URL, wp.OPENHAB_POOL_SIZE, wp.OPENHAB_TIMEOUT, app['io_executor'])
+    app['in_flight'] = 0
+    app['tasks'] = set()
+    app.router.add_post('/webhook', handle_webhook)
+    app.router.add_get('/test', handle_test)
+    app.router.add_get('/health', handle_health)
+    app.router.add_get('/linecrossings', handle_linecrossings)
+    app.router.add_get('/metrics', handle_metrics)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+if __name__ == '__main__':
+    if aiohttp is None:
+        logger.error("❌ The asyncio variant needs aiohttp: pip install aiohttp")
+        sys.exit(1)
+
+    parser = argparse.ArgumentParser(description="Hikvision Webhook Analytics Processor (asyncio)")
+    parser.add_argument('--port', type=int, default=wp.WEBHOOK_PORT, help="Listening port")
+    args = parser.parse_args()
+
+    try:
+        os.makedirs(wp.WEBHOOK_DIR, exist_ok=True)
+        os.makedirs(wp.HTML_OUTPUT_PATH, exist_ok=True)
+    except Exception as dir_err:
+        logger.error(f"❌ Failed to create required directories: {dir_err}")
+        sys.exit(1)
+
+    logger.info("=" * 70)
+    logger.info("Hikvision Webhook Analytics Processor (asyncio) Starting")
+    logger.info("=" * 70)
+    logger.info(f"Listening on: http://0.0.0.0:{args.port}")
+    logger.info(f"OpenHAB URL: {wp.OPENHAB_URL} ({wp.OPENHAB_POOL_SIZE} pooled connections)")
+    logger.info(f"Max in-flight events: {ASYNC_MAX_IN_FLIGHT} | I/O threads: {ASYNC_IO_THREADS}")
+    logger.info("=" * 70)
+    web.run_app(create_app(args.port), host='0.0.0.0', port=args.port, print=None)